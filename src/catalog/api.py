@@ -7,6 +7,7 @@ from sentry_sdk.integrations.aiohttp import AioHttpIntegration
 
 from catalog import version
 from catalog.db import cleanup_db_client, init_mongo
+from catalog.feed import close_feeds
 from catalog.handlers.category import (
     CategoryCriteriaItemView,
     CategoryCriteriaRGItemView,
@@ -15,6 +16,7 @@ from catalog.handlers.category import (
     CategoryCriteriaRGView,
     CategoryCriteriaView,
     CategoryItemView,
+    CategoryRevisionView,
     CategoryView,
 )
 from catalog.handlers.crowd_sourcing.contributor import ContributorItemView, ContributorView
@@ -35,11 +37,12 @@ from catalog.handlers.crowd_sourcing.product_request_document import (
     ProductRequestDocumentItemView,
     ProductRequestDocumentView,
 )
-from catalog.handlers.general import get_version, ping_handler
+from catalog.handlers.feed import FeedView
+from catalog.handlers.general import get_version, metrics_handler, ping_handler
 from catalog.handlers.image import ImageView
 from catalog.handlers.offer import OfferItemView, OfferView
 from catalog.handlers.price import PriceItemView, PriceView, ProductPriceView
-from catalog.handlers.product import ProductItemView, ProductView
+from catalog.handlers.product import ProductItemView, ProductRevisionView, ProductView
 from catalog.handlers.product_document import ProductDocumentItemView, ProductDocumentView
 from catalog.handlers.profile import (
     ProfileCriteriaItemView,
@@ -49,17 +52,20 @@ from catalog.handlers.profile import (
     ProfileCriteriaRGView,
     ProfileCriteriaView,
     ProfileItemView,
+    ProfileRevisionView,
     ProfileView,
 )
 from catalog.handlers.search import SearchView
 from catalog.handlers.tags import TagItemView, TagView
-from catalog.handlers.vendor import VendorItemView, VendorSignItemView, VendorView
+from catalog.handlers.vendor import VendorItemView, VendorRevisionView, VendorSignItemView, VendorView
 from catalog.handlers.vendor_ban import VendorBanItemView, VendorBanView
 from catalog.handlers.vendor_ban_document import VendorBanDocumentItemView, VendorBanDocumentView
 from catalog.handlers.vendor_document import VendorDocumentItemView, VendorDocumentView
 from catalog.handlers.vendor_product import VendorProductView
 from catalog.handlers.vendor_product_document import VendorProductDocumentItemView, VendorProductDocumentView
+from catalog.http_client import close_http_client, init_http_client
 from catalog.logging import AccessLogger, setup_logging
+from catalog.medicine import start_medicine_registry, stop_medicine_registry
 from catalog.middleware import (
     context_middleware,
     convert_response_to_json,
@@ -67,6 +73,7 @@ from catalog.middleware import (
     error_middleware,
     login_middleware,
     request_id_middleware,
+    set_prepare_headers,
 )
 from catalog.migration import import_data_job
 from catalog.settings import CLIENT_MAX_SIZE, IMG_DIR, IMG_PATH, SENTRY_DSN
@@ -96,6 +103,7 @@ def create_application(on_cleanup=None):
         ),
         client_max_size=CLIENT_MAX_SIZE,
     )
+    app.on_response_prepare.append(set_prepare_headers)
     oas.setup(
         app,
         title_spec="Prozorro Catalog API",
@@ -108,6 +116,7 @@ def create_application(on_cleanup=None):
 
     app.router.add_get("/api/ping", ping_handler, allow_head=False)
     app.router.add_get("/api/version", get_version, allow_head=False)
+    app.router.add_get("/api/metrics", metrics_handler, allow_head=False)
 
     # categories
     app.router.add_view(
@@ -118,6 +127,10 @@ def create_application(on_cleanup=None):
         "/api/categories/{category_id}",
         CategoryItemView,
     )
+    app.router.add_view(
+        "/api/categories/{category_id}/revisions",
+        CategoryRevisionView,
+    )
 
     # category criteria
 
@@ -159,6 +172,10 @@ def create_application(on_cleanup=None):
         r"/api/profiles/{profile_id:[\w-]+}",
         ProfileItemView,
     )
+    app.router.add_view(
+        r"/api/profiles/{profile_id:[\w-]+}/revisions",
+        ProfileRevisionView,
+    )
 
     # profile criteria
     app.router.add_view(
@@ -200,6 +217,7 @@ def create_application(on_cleanup=None):
     # products
     app.router.add_view("/api/products", ProductView)
     app.router.add_view(r"/api/products/{product_id:[\w-]+}", ProductItemView)
+    app.router.add_view(r"/api/products/{product_id:[\w-]+}/revisions", ProductRevisionView)
 
     # product docs
     app.router.add_view(
@@ -230,6 +248,10 @@ def create_application(on_cleanup=None):
         r"/api/vendors/{vendor_id:[\w]{32}}",
         VendorItemView,
     )
+    app.router.add_view(
+        r"/api/vendors/{vendor_id:[\w]{32}}/revisions",
+        VendorRevisionView,
+    )
     app.router.add_view(
         r"/api/sign/vendors/{vendor_id:[\w]{32}}",
         VendorSignItemView,
@@ -369,6 +391,9 @@ def create_application(on_cleanup=None):
         r"/api/search",
         SearchView,
     )
+    # change feeds
+    app.router.add_view(r"/api/feed/{resource:[\w-]+}", FeedView)
+
     # images
     app.router.add_post(r"/api/images", ImageView.post, name="upload_image")
     # server images for dev env
@@ -376,8 +401,13 @@ def create_application(on_cleanup=None):
 
     app.on_startup.append(init_mongo)
     app.on_startup.append(import_data_job)
+    app.on_startup.append(init_http_client)
+    app.on_startup.append(start_medicine_registry)
     if on_cleanup:
         app.on_cleanup.append(on_cleanup)
+    app.on_cleanup.append(close_feeds)
+    app.on_cleanup.append(stop_medicine_registry)
+    app.on_cleanup.append(close_http_client)
     app.on_cleanup.append(cleanup_db_client)
     return app
 
@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+import bson
+from bson.codec_options import DEFAULT_CODEC_OPTIONS
+from pymongo.errors import PyMongoError
+
+from catalog.metrics import inc
+from catalog.settings import CHANGE_STREAM_RETRY_DELAY
+
+logger = logging.getLogger(__name__)
+
+
+class DocumentCache:
+    """
+    Process-local LRU cache of documents keyed by id (the `rev` of the cached version is kept with it).
+
+    Documents are stored BSON-encoded, so every hit decodes its own copy
+    and callers are free to modify what they get.
+    While the change stream watcher is running entries live until the document changes,
+    otherwise they expire after `ttl` seconds.
+    """
+
+    def __init__(self, name, max_size, ttl, codec_options=DEFAULT_CODEC_OPTIONS):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.codec_options = codec_options
+        self.watching = False
+        self.version = 0  # changes on every invalidation
+        self._items = OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, uid):
+        item = self._items.get(uid)
+        if item is not None:
+            rev, data, created = item
+            if self.watching or time.monotonic() - created < self.ttl:
+                self._items.move_to_end(uid)
+                inc("cache_hits", self.name)
+                return bson.decode(data, codec_options=self.codec_options)
+            del self._items[uid]
+        inc("cache_misses", self.name)
+        return None
+
+    def get_rev(self, uid):
+        item = self._items.get(uid)
+        if item is not None and (self.watching or time.monotonic() - item[2] < self.ttl):
+            return item[0]
+        return None
+
+    def set(self, obj, version=None):
+        """
+        :param obj: document to cache
+        :param version: `self.version` taken before the document was read,
+        so a document that was changed while being read isn't cached
+        """
+        if self.max_size <= 0 or version is not None and version != self.version:
+            return
+        uid = obj["id"]
+        self._items[uid] = (obj.get("rev"), bson.encode(obj, codec_options=self.codec_options), time.monotonic())
+        self._items.move_to_end(uid)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+            inc("cache_evictions", self.name)
+
+    def invalidate(self, uid):
+        self.version += 1
+        self._items.pop(uid, None)
+
+    def clear(self):
+        self.version += 1
+        self._items.clear()
+
+    async def watch(self, collection):
+        """
+        Drops cached documents once they are changed by any process.
+        Falls back to ttl expiration while change streams are unavailable (e.g. standalone mongodb)
+        """
+        pipeline = [{"$project": {"operationType": True, "documentKey": True}}]
+        while True:
+            try:
+                async with collection.watch(pipeline) as stream:
+                    # changes made before the stream was opened are unknown
+                    self.clear()
+                    self.watching = True
+                    logger.info(f"Watching {self.name} changes for cache invalidation")
+                    async for change in stream:
+                        if "documentKey" in change:
+                            self.invalidate(change["documentKey"]["_id"])
+                        else:  # drop, rename, invalidate
+                            self.clear()
+            except PyMongoError as e:
+                logger.warning(f"{self.name} cache falls back to ttl, change stream is unavailable: {e}")
+            finally:
+                self.watching = False
+            await asyncio.sleep(CHANGE_STREAM_RETRY_DELAY)
+
+
+def apply_projection(obj, projection):
+    """
+    Mimics mongodb projection of top-level fields for the cached documents
+    """
+    if not projection:
+        return obj
+    included = {k for k, v in projection.items() if v}
+    if included:
+        return {k: v for k, v in obj.items() if k in included or k == "id"}
+    return {k: v for k, v in obj.items() if k not in projection}
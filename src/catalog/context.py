@@ -6,6 +6,7 @@ from catalog.settings import TIMEZONE
 request_var = ContextVar("request_var")
 now_var = ContextVar("now_var")
 session_var = ContextVar("session", default=None)
+session_factory_var = ContextVar("session_factory", default=None)
 
 
 def get_request():
@@ -29,9 +30,21 @@ def get_now() -> datetime:
     return now_var.get()
 
 
-def get_db_session():
-    return session_var.get()
+def get_db_session(start=True):
+    """
+    :param start: whether to start the request session if it hasn't been used yet
+    """
+    session = session_var.get()
+    if session is None:
+        factory = session_factory_var.get()
+        if factory is not None and (start or factory.session is not None):
+            session = factory()
+    return session
 
 
 def set_db_session(db_session):
     session_var.set(db_session)
+
+
+def set_db_session_factory(factory):
+    session_factory_var.set(factory)
@@ -26,6 +26,7 @@ TENDERS_URL = get_resource_url(RESOURCE)
 
 async def process_tender(session: ClientSession, tender: dict[str, Any]) -> None:
     if tender is not None and tender.get("awardPeriod", {}).get("startDate") is not None:
+        dirty_products = set()
         for n, bid in enumerate(tender.get("bids", []), start=1):
             if bid.get("status") == "active" and "items" in bid and type(bid["items"]) is list:
                 for item in bid["items"]:
@@ -56,6 +57,7 @@ async def process_tender(session: ClientSession, tender: dict[str, Any]) -> None
                             data["dateCreated"] = data["dateCreated"].isoformat()
                             data["dateModified"] = data["dateModified"].isoformat()
                             await db.insert_product_bid(data)
+                            dirty_products.add(data["productId"])
                             logger.info(f"Inserted product bid data for item in bid #{n} of tender {tender['id']}")
                         except DuplicateKeyError:
                             logger.debug(f"Product bid already exists for item in bid #{n} of tender {tender['id']}")
@@ -63,6 +65,12 @@ async def process_tender(session: ClientSession, tender: dict[str, Any]) -> None
                             logger.exception(
                                 f"Error inserting product bid data for item in bid #{n} of tender {tender['id']}: {e}"
                             )
+        if dirty_products:
+            # prices of the products are recalculated by catalog.price_worker
+            try:
+                await db.mark_products_dirty(sorted(dirty_products))
+            except Exception as e:
+                logger.exception(f"Error queueing price recalculation of the products of tender {tender['id']}: {e}")
 
 
 async def item_data_handler(session: ClientSession, items: list[dict[str, Any]]) -> None:
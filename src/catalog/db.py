@@ -1,33 +1,72 @@
 import asyncio
+import binascii
 import logging
-import time
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from contextlib import asynccontextmanager
+from copy import deepcopy
 from datetime import datetime
 from decimal import Decimal
 from urllib.parse import urlencode
+from uuid import uuid4
 
 from aiohttp import web
+from bson import BSON
 from bson.codec_options import CodecOptions, TypeCodec, TypeRegistry
 from bson.decimal128 import Decimal128
-from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
-from pymongo import ASCENDING, DESCENDING, IndexModel, ReadPreference
+from bson.json_util import dumps as bson_dumps
+from bson.json_util import loads as bson_loads
+from bson.timestamp import Timestamp
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorClientSession, AsyncIOMotorDatabase
+from pymongo import ASCENDING, DESCENDING, DeleteMany, DeleteOne, ReadPreference, UpdateOne, monitoring
 from pymongo.collection import ReturnDocument
-from pymongo.errors import DuplicateKeyError, PyMongoError
+from pymongo.errors import DuplicateKeyError
 
+from catalog.cache import DocumentCache, apply_projection
 from catalog.context import get_db_session, get_request, get_request_scheme, session_var
+from catalog.indexes import apply_indexes, verify_indexes
+from catalog.metrics import inc, observe
+from catalog.serialization import json_dumps
 from catalog.settings import (
+    CATEGORY_CACHE_SIZE,
+    CATEGORY_CACHE_TTL,
     DB_NAME,
+    LIST_STREAM_BATCH_SIZE,
     MAX_LIST_LIMIT,
+    MONGODB_APPLY_INDEXES,
     MONGODB_URI,
     READ_CONCERN,
     READ_PREFERENCE,
     WRITE_CONCERN,
 )
-from catalog.utils import get_next_rev
+from catalog.utils import get_next_rev, get_now
 
 logger = logging.getLogger(__name__)
 
 DB = None
+CACHE_WATCHERS = []
+
+
+class CausalReadsListener(monitoring.CommandListener):
+    """
+    Reads of a causally consistent session carry afterClusterTime of the session writes
+    (e.g. from SESSION cookie), and the server waits until it has them before reading.
+    Counts such reads and their durations, the wait included
+    """
+
+    def __init__(self):
+        self.pending = {}
+
+    def started(self, event):
+        if "afterClusterTime" in event.command.get("readConcern", {}):
+            self.pending[(event.connection_id, event.request_id)] = event.command_name
+
+    def succeeded(self, event):
+        command_name = self.pending.pop((event.connection_id, event.request_id), None)
+        if command_name:
+            observe("causal_reads", command_name, event.duration_micros / 1e6)
+
+    def failed(self, event):
+        self.succeeded(event)
 
 
 def get_database():
@@ -39,7 +78,7 @@ async def init_mongo(*app) -> AsyncIOMotorDatabase:
 
     logger.info("init mongodb instance")
     loop = asyncio.get_event_loop()
-    conn = AsyncIOMotorClient(MONGODB_URI, io_loop=loop)
+    conn = AsyncIOMotorClient(MONGODB_URI, io_loop=loop, event_listeners=[CausalReadsListener()])
 
     DB = conn.get_database(
         DB_NAME,
@@ -47,18 +86,12 @@ async def init_mongo(*app) -> AsyncIOMotorDatabase:
         write_concern=WRITE_CONCERN,
         read_concern=READ_CONCERN,
     )
-    await asyncio.gather(
-        init_category_indexes(),
-        init_profile_indexes(),
-        init_products_indexes(),
-        init_product_bids_indexes(),
-        init_prices_indexes(),
-        init_offers_indexes(),
-        init_vendor_indexes(),
-        init_contributor_indexes(),
-        init_request_indexes(),
-        init_tag_indexes(),
-    )
+    if MONGODB_APPLY_INDEXES:
+        await apply_indexes(DB)
+    else:
+        await verify_indexes(DB)
+    if category_cache.max_size > 0:
+        CACHE_WATCHERS.append(asyncio.create_task(category_cache.watch(get_category_collection())))
     return DB
 
 
@@ -90,6 +123,17 @@ def fallback_encoder(value):
 type_registry = TypeRegistry([DecimalCodec()], fallback_encoder=fallback_encoder)
 codec_options = CodecOptions(type_registry=type_registry)
 
+category_cache = DocumentCache(
+    "category",
+    max_size=CATEGORY_CACHE_SIZE,
+    ttl=CATEGORY_CACHE_TTL,
+    codec_options=codec_options,
+)
+
+
+# revisions are stored in their own collection and never loaded with the documents
+NO_REVISIONS_PROJECTION = {"revisions": False}
+
 
 def get_collection(name, read_preference=None):
     collection = DB.get_collection(name, codec_options=codec_options)
@@ -100,6 +144,8 @@ def get_collection(name, read_preference=None):
 
 async def cleanup_db_client(app):
     global DB
+    while CACHE_WATCHERS:
+        CACHE_WATCHERS.pop().cancel()
     if DB is not None:
         DB.client.close()
         DB = None
@@ -117,7 +163,11 @@ async def flush_database(*_):
         get_contributor_collection().delete_many({}),
         get_product_request_collection().delete_many({}),
         get_tag_collection().delete_many({}),
+        get_revisions_collection().delete_many({}),
+        get_task_state_collection().delete_many({}),
+        get_dirty_products_collection().delete_many({}),
     )
+    category_cache.clear()
 
 
 def transaction_generator(func):
@@ -155,6 +205,40 @@ async def transaction_context_manager():
             session_var.reset(token)
 
 
+class LazySession:
+    """
+    Causally consistent session of a request, started on the first `get_db_session()` call
+    """
+
+    def __init__(self, cluster_time=None, operation_time=None):
+        if cluster_time is not None and not isinstance(cluster_time.get("clusterTime"), Timestamp):
+            raise TypeError("cluster_time must contain clusterTime of Timestamp type")
+        if operation_time is not None and not isinstance(operation_time, Timestamp):
+            raise TypeError("operation_time must be an instance of Timestamp")
+        self.cluster_time = cluster_time
+        self.operation_time = operation_time
+        self.session = None
+
+    def __call__(self):
+        if self.session is None:
+            # pymongo starts sessions without any i/o, while motor runs it in the thread pool
+            session = AsyncIOMotorClientSession(DB.client.delegate.start_session(causal_consistency=True), DB.client)
+            if self.cluster_time:
+                session.advance_cluster_time(self.cluster_time)  # global time in cluster level
+            if self.operation_time:
+                session.advance_operation_time(self.operation_time)  # last successful operation time in session
+            self.session = session
+        return self.session
+
+    @property
+    def operation_time_advanced(self):
+        return self.session is not None and self.session.operation_time != self.operation_time
+
+    def end(self):
+        if self.session is not None:
+            self.session.delegate.end_session()
+
+
 def rename_id(obj):
     if obj and "_id" in obj:
         obj["id"] = obj.pop("_id")
@@ -173,49 +257,96 @@ async def find_objects(collection, ids):
     filters = {"_id": {"$in": ids}}
     items = await collection.find(
         filters,
+        projection=NO_REVISIONS_PROJECTION,
     ).to_list(None)
     for i in items:
         rename_id(i)
     return items
 
 
+def encode_offset(item):
+    """
+    Opaque pagination cursor made of (dateModified, _id),
+    so documents sharing the same dateModified are neither skipped nor repeated
+    """
+    raw = bson_dumps([item["dateModified"], item["id"]])
+    return urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_offset(offset):
+    """
+    Returns (dateModified, _id) from an offset.
+    Plain dateModified offsets are still accepted (_id is None for them)
+    """
+    value = offset.replace(" ", "+")
+    try:
+        datetime.fromisoformat(value)
+    except ValueError:
+        pass
+    else:
+        return value, None
+
+    try:
+        date_modified, uid = bson_loads(urlsafe_b64decode(value + "=" * (-len(value) % 4)))
+        datetime.fromisoformat(date_modified)
+    except (binascii.Error, ValueError, TypeError):
+        raise web.HTTPBadRequest(text=f"Invalid offset: {offset}")
+    return date_modified, uid
+
+
+def get_offset_filters(offset, reverse):
+    date_modified, uid = decode_offset(offset)
+    if uid is None:
+        return {"dateModified": {"$lt" if reverse else "$gt": date_modified}}
+    # a single range on the (dateModified, _id) index,
+    # the already returned part of the dateModified "tie" is filtered out on index keys
+    return {
+        "dateModified": {"$lte" if reverse else "$gte": date_modified},
+        "$nor": [{"dateModified": date_modified, "_id": {"$gte" if reverse else "$lte": uid}}],
+    }
+
+
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+
+
 async def paginated_result(collection, *_, offset, limit, reverse, filters=None, opt_fields=None, full_data=False):
     limit = min(limit, MAX_LIST_LIMIT)
     limit = max(limit, 1)
     filters = filters or {}
     if offset:
-        try:
-            datetime.fromisoformat(offset.replace(" ", "+"))
-        except Exception:
-            raise web.HTTPBadRequest(text=f"Invalid offset: {offset}")
-        if reverse:
-            filters["dateModified"] = {"$lt": offset}
-        else:
-            filters["dateModified"] = {"$gt": offset}
+        filters.update(get_offset_filters(offset, reverse))
 
     if full_data:
-        projection = {"_rev": False}
+        projection = {"_rev": False, **NO_REVISIONS_PROJECTION}
     else:
         projection = {"dateModified": True}
         if opt_fields is not None:
             for field in opt_fields:
                 projection[field] = True
 
-    items = (
-        await collection.find(
-            filters,
-            projection=projection,
-        )
-        .sort([("dateModified", DESCENDING if reverse else ASCENDING)])
-        .limit(limit)
-        .to_list(None)
-    )
+    order = DESCENDING if reverse else ASCENDING
+    cursor = collection.find(
+        filters,
+        projection=projection,
+    ).sort([("dateModified", order), ("_id", order)])
+    request = get_request()
+    if NDJSON_CONTENT_TYPE in request.headers.get("Accept", ""):
+        return await stream_result(request, cursor.limit(limit), offset=offset, limit=limit, reverse=reverse)
+
+    items = await cursor.limit(limit).to_list(None)
     result = {"data": [rename_id(i) for i in items]}
+    if items:
+        result.update(get_page_links(request, offset, limit, reverse, first=items[0], last=items[-1]))
+    else:
+        result.update(get_page_links(request, offset, limit, reverse))
+    return result
 
+
+def get_page_links(request, offset, limit, reverse, first=None, last=None):
     # generate forward & back links
-    request = get_request()
     req_scheme = get_request_scheme()
     base_url = f"{req_scheme}://{request.host}"
+    result = {}
 
     # next page
     next_params = {
@@ -223,9 +354,9 @@ async def paginated_result(collection, *_, offset, limit, reverse, filters=None,
         "limit": limit,
     }
     prev_params = dict(next_params)
-    if items:
-        next_params["offset"] = items[-1]["dateModified"]
-        prev_params["offset"] = items[0]["dateModified"]
+    if last:
+        next_params["offset"] = encode_offset(last)
+        prev_params["offset"] = encode_offset(first)
     if reverse:
         next_params["descending"] = "1"
     next_path = f"{request.path}?{urlencode(next_params)}"
@@ -240,10 +371,99 @@ async def paginated_result(collection, *_, offset, limit, reverse, filters=None,
     return result
 
 
+async def stream_result(request, cursor, offset, limit, reverse):
+    """
+    Writes the page as newline delimited json while the cursor is iterated,
+    so only a batch of documents is kept in memory whatever the limit is.
+    The last line contains the page links the same as the json response does
+    """
+    items = aiter(cursor.batch_size(LIST_STREAM_BATCH_SIZE))
+    # the query is sent before the headers, so the session cookie has its operation time
+    item = await anext(items, None)
+    response = web.StreamResponse(headers={"Content-Type": NDJSON_CONTENT_TYPE})
+    await response.prepare(request)
+    first = last = None
+    lines = []
+    while item is not None:
+        last = rename_id(item)
+        first = first or last
+        lines.append(json_dumps(last))
+        if len(lines) >= LIST_STREAM_BATCH_SIZE:
+            await response.write(("\n".join(lines) + "\n").encode())
+            lines = []
+        item = await anext(items, None)
+    lines.append(json_dumps(get_page_links(request, offset, limit, reverse, first=first, last=last)))
+    await response.write(("\n".join(lines) + "\n").encode())
+    await response.write_eof()
+    return response
+
+
+def find_changes(collection, offset):
+    """
+    Cursor of the feed events after the offset in the same order as paginated_result returns them
+    """
+    return collection.find(
+        get_offset_filters(offset, reverse=False),
+        projection={"dateModified": True, "_rev": True},
+    ).sort([("dateModified", ASCENDING), ("_id", ASCENDING)])
+
+
 def get_sequences_collection():
     return get_collection("sequences")
 
 
+def get_task_state_collection():
+    return get_collection("task_state")
+
+
+async def read_task_state(name):
+    """
+    State that a cron task keeps between its runs, e.g. a checkpoint
+    """
+    return await get_task_state_collection().find_one({"_id": name}, projection={"_id": False}) or {}
+
+
+async def save_task_state(name, **values):
+    await get_task_state_collection().update_one({"_id": name}, {"$set": values}, upsert=True)
+
+
+async def clear_task_state(name, *keys):
+    await get_task_state_collection().update_one({"_id": name}, {"$unset": {key: "" for key in keys}})
+
+
+def get_dirty_products_collection():
+    return get_collection("dirty_products")
+
+
+async def mark_products_dirty(product_ids):
+    """
+    Queues the products for the price worker, a product is queued once until it's calculated
+    """
+    now = get_now().isoformat()
+    await get_dirty_products_collection().bulk_write(
+        [UpdateOne({"_id": product_id}, {"$set": {"dateModified": now}}, upsert=True) for product_id in product_ids],
+        ordered=False,
+    )
+
+
+async def read_dirty_products(limit):
+    """
+    :return: the products that were queued the earliest, with the dateModified they were read with
+    """
+    cursor = get_dirty_products_collection().find({}).sort([("dateModified", ASCENDING), ("_id", ASCENDING)])
+    return await cursor.limit(limit).to_list(None)
+
+
+async def delete_dirty_products(products):
+    """
+    Unless they were queued again while they were calculated
+    """
+    await get_dirty_products_collection().bulk_write(
+        [DeleteOne({"_id": product["_id"], "dateModified": product["dateModified"]}) for product in products],
+        ordered=False,
+    )
+
+
 async def get_next_sequence_value(uid):
     collection = get_sequences_collection()
     result = await collection.find_one_and_update(
@@ -256,6 +476,8 @@ async def insert_object(collection, data):
     document = dict(**data)
     document["_id"] = document.pop("id")
     document["_rev"] = get_next_rev()
+    revisions = document.pop("revisions", None)
+    inc("db_written_bytes", collection.name, get_document_size(document))
     try:
         result = await collection.insert_one(document)
     except DuplicateKeyError as e:
@@ -265,25 +487,181 @@ async def insert_object(collection, data):
             duplicated_value = detail["keyValue"][duplicated_field]
             raise web.HTTPBadRequest(text=f"Duplicate value for '{duplicated_field}': '{duplicated_value}'")
         raise web.HTTPBadRequest(text=f"Document with id {document['_id']} already exists")
+    await insert_revisions(collection, result.inserted_id, revisions, rev=document["_rev"])
     return result.inserted_id
 
 
-async def update_object(collection, data):
+def _is_same(a, b):
+    """
+    Deep equality that also tells apart True/1 and 1/1.0
+    """
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(_is_same(a[k], b[k]) for k in a)
+    if isinstance(a, list):
+        return len(a) == len(b) and all(_is_same(i, j) for i, j in zip(a, b))
+    return a == b
+
+
+def _is_safe_key(key):
+    return isinstance(key, str) and key and "." not in key and not key.startswith("$")
+
+
+def get_update_operations(before, after, prefix=""):
+    """
+    Builds $set/$unset/$push operations that turn `before` into `after`.
+    Nested dicts are compared key by key, lists that only got new items at the end are $push-ed,
+    any other changed value is $set as a whole
+    :param before: document as it was read
+    :param after: document to write
+    :param prefix: dotted path of the nested dict
+    :return: update document, empty if nothing changed
+    """
+    operations = {"$set": {}, "$unset": {}, "$push": {}}
+    for key, value in after.items():
+        path = f"{prefix}{key}"
+        if key not in before:
+            operations["$set"][path] = value
+            continue
+        old_value = before[key]
+        if _is_same(old_value, value):
+            continue
+        if (
+            isinstance(old_value, dict)
+            and isinstance(value, dict)
+            and all(_is_safe_key(k) for k in old_value.keys() | value.keys())
+        ):
+            for operator, fields in get_update_operations(old_value, value, prefix=f"{path}.").items():
+                operations[operator].update(fields)
+        elif (
+            isinstance(old_value, list)
+            and isinstance(value, list)
+            and len(value) > len(old_value)
+            and _is_same(old_value, value[: len(old_value)])
+        ):
+            operations["$push"][path] = {"$each": value[len(old_value) :]}
+        else:
+            operations["$set"][path] = value
+
+    for key in before.keys() - after.keys():
+        operations["$unset"][f"{prefix}{key}"] = ""
+
+    return {operator: fields for operator, fields in operations.items() if fields}
+
+
+def get_document_size(document):
+    return len(BSON.encode(document, codec_options=codec_options))
+
+
+async def update_object(collection, data, before=None):
+    """
+    Writes the updated document.
+    If the document as it was read is passed in `before`, only the changed fields are sent
+    and nothing is written at all if there are no changes
+    """
     revision = data.pop("rev" if "rev" in data else "_rev", None)
     document = dict(**data)
     document["_id"] = uid = document.pop("id")
-    document["_rev"] = get_next_rev(revision)
+    revisions = document.pop("revisions", None)
     match_dict = {"_id": uid}
     # add revisions filter in match dict for object which already has this functionality
     if revision is not None:
         match_dict["_rev"] = revision
-    result = await collection.find_one_and_replace(
-        match_dict,
-        document,
-        session=get_db_session(),
-    )
+
+    if before is not None:
+        before = {k: v for k, v in before.items() if k not in ("id", "_id", "rev", "_rev", "revisions")}
+        operations = get_update_operations(before, {k: v for k, v in document.items() if k != "_id"})
+        if not operations:
+            inc("db_skipped_writes", collection.name)
+            return
+        document["_rev"] = get_next_rev(revision)
+        operations.setdefault("$set", {})["_rev"] = document["_rev"]
+        # documents that weren't migrated yet still keep their history inline
+        operations.setdefault("$unset", {})["revisions"] = ""
+        inc("db_written_bytes", collection.name, get_document_size(operations))
+        result = await collection.find_one_and_update(
+            match_dict,
+            operations,
+            projection={"revisions": True},
+            session=get_db_session(),
+        )
+    else:
+        document["_rev"] = get_next_rev(revision)
+        inc("db_written_bytes", collection.name, get_document_size(document))
+        result = await collection.find_one_and_replace(
+            match_dict,
+            document,
+            projection={"revisions": True},
+            session=get_db_session(),
+        )
     if result is None:
         raise web.HTTPConflict(text="Conflict while writing document. Please, retry.")
+    inc("db_writes", collection.name)
+    # the replaced version of not migrated document is moved to the revisions collection
+    await insert_revisions(collection, uid, result.get("revisions"))
+    await insert_revisions(collection, uid, revisions, rev=document["_rev"])
+
+
+# revisions
+def get_revisions_collection(read_preference=None):
+    return get_collection("revisions", read_preference=read_preference)
+
+
+async def insert_revisions(collection, uid, revisions, rev=None):
+    """
+    Appends revisions of the document to the revisions collection
+    :param collection: collection of the document
+    :param uid: document id
+    :param revisions: list of revisions generated by `catalog.utils.generate_revision`
+    :param rev: `_rev` of the document version the revisions produced, kept as `newRev`,
+                `rev` of a revision is the one it was applied to, same as of the migrated inline revisions
+    :return:
+    """
+    if not revisions:
+        return
+    documents = []
+    for revision in revisions:
+        document = {**revision, "_id": uuid4().hex, "objectId": uid, "collection": collection.name}
+        if rev is not None:
+            document["newRev"] = rev
+        documents.append(document)
+    await get_revisions_collection().insert_many(documents, session=get_db_session())
+
+
+PRIVATE_REVISION_PATHS = ("/access",)
+
+
+def is_private_revision_path(path):
+    return any(path == private or path.startswith(private + "/") for private in PRIVATE_REVISION_PATHS)
+
+
+async def find_revisions(collection, obj_id, obj_name):
+    """
+    Public history of the document, the authors and the changes of the private fields are left out
+    as RootSerializer leaves them out of the document
+    """
+    await read_object(collection, obj_id, projection={"_id": True}, obj_name=obj_name)  # ensure exists
+    items = (
+        await get_revisions_collection()
+        .find(
+            {"objectId": obj_id, "collection": collection.name},
+            projection={"_id": False, "objectId": False, "collection": False, "author": False},
+            session=get_db_session(),
+        )
+        .sort([("date", ASCENDING)])
+        .to_list(None)
+    )
+    for item in items:
+        changes = []
+        for change in item.get("changes", []):
+            if is_private_revision_path(change.get("path", "")):
+                continue
+            if change.get("path") in ("", "/") and isinstance(change.get("value"), dict):
+                change = {**change, "value": {k: v for k, v in change["value"].items() if k != "access"}}
+            changes.append(change)
+        item["changes"] = changes
+    return items
 
 
 # category
@@ -291,15 +669,6 @@ def get_category_collection(read_preference=None):
     return get_collection("category", read_preference=read_preference)
 
 
-async def init_category_indexes():
-    modified_index = IndexModel([("dateModified", ASCENDING)], background=True)
-    tags_index = IndexModel([("tags", ASCENDING)], background=True)
-    try:
-        await get_category_collection().create_indexes([modified_index, tags_index])
-    except PyMongoError as e:
-        logger.exception(e)
-
-
 async def find_categories(**kwargs):
     collection = get_category_collection()
     result = await paginated_result(collection, **kwargs)
@@ -307,7 +676,7 @@ async def find_categories(**kwargs):
 
 
 async def read_object(collection, obj_id, projection=None, obj_name="category"):
-    projection = projection or {}
+    projection = projection or NO_REVISIONS_PROJECTION
     obj = await collection.find_one(
         {"_id": obj_id},
         projection=projection,
@@ -318,9 +687,48 @@ async def read_object(collection, obj_id, projection=None, obj_name="category"):
     return rename_id(obj)
 
 
+async def read_rev(collection, obj_id, projection=None):
+    """
+    `_rev` (and the other `projection` fields) of an object for the conditional requests,
+    None if the object isn't found
+    """
+    return await collection.find_one(
+        {"_id": obj_id},
+        projection={"_rev": True, **(projection or {})},
+        session=get_db_session(),
+    )
+
+
 async def read_category(category_id, projection=None):
+    category = category_cache.get(category_id)
+    if category is None:
+        version = category_cache.version
+        collection = get_category_collection()
+        category = await read_object(collection, category_id, obj_name="category")
+        category_cache.set(category, version=version)
+    return apply_projection(category, projection)
+
+
+async def find_categories_units(category_ids):
+    """
+    :return: {category id: unit code} of the found categories with units
+    """
     collection = get_category_collection()
-    return await read_object(collection, category_id, projection, obj_name="category")
+    cursor = collection.find({"_id": {"$in": list(category_ids)}}, projection={"unit": True}, session=get_db_session())
+    return {category["_id"]: category.get("unit", {}).get("code") async for category in cursor}
+
+
+async def read_category_rev(category_id):
+    rev = category_cache.get_rev(category_id)
+    if rev is None:
+        category = await read_rev(get_category_collection(), category_id)
+        rev = category and category.get("_rev")
+    return rev
+
+
+async def read_category_revs(category_id):
+    rev = await read_category_rev(category_id)
+    return rev and (rev,)
 
 
 async def insert_category(data):
@@ -332,8 +740,10 @@ async def insert_category(data):
 async def read_and_update_category(uid):
     collection = get_category_collection(read_preference=ReadPreference.PRIMARY)
     data = await read_object(collection, uid, obj_name="category")
+    before = deepcopy(data)
     yield data
-    await update_object(collection, data)
+    await update_object(collection, data, before=before)
+    category_cache.invalidate(uid)
 
 
 # profiles
@@ -341,16 +751,6 @@ def get_profiles_collection(read_preference=None):
     return get_collection("profiles", read_preference=read_preference)
 
 
-async def init_profile_indexes():
-    # db.contributors.createIndex({ "dateModified": 1 })
-    modified_index = IndexModel([("dateModified", ASCENDING)], background=True)
-    tags_index = IndexModel([("tags", ASCENDING)], background=True)
-    try:
-        await get_profiles_collection().create_indexes([modified_index, tags_index])
-    except PyMongoError as e:
-        logger.exception(e)
-
-
 async def insert_profile(data):
     inserted_id = await insert_object(get_profiles_collection(), data)
     return inserted_id
@@ -367,6 +767,11 @@ async def read_profile(profile_id):
     return await read_object(collection, profile_id, obj_name="profile")
 
 
+async def read_profile_revs(profile_id):
+    profile = await read_rev(get_profiles_collection(), profile_id)
+    return profile and (profile.get("_rev"),)
+
+
 async def update_profile(profile):
     await update_object(get_profiles_collection(read_preference=ReadPreference.PRIMARY), profile)
 
@@ -375,8 +780,9 @@ async def update_profile(profile):
 async def read_and_update_profile(profile_id):
     collection = get_profiles_collection(read_preference=ReadPreference.PRIMARY)
     data = await read_object(collection, profile_id, obj_name="profile")
+    before = deepcopy(data)
     yield data
-    await update_object(collection, data)
+    await update_object(collection, data, before=before)
 
 
 # criteria
@@ -456,18 +862,6 @@ def get_products_collection(read_preference=None):
     return get_collection("products", read_preference=read_preference)
 
 
-async def init_products_indexes():
-    modified_index = IndexModel([("dateModified", ASCENDING)], background=True)
-    # for quicker migration
-    # TODO: delete after migration
-    category_index = IndexModel([("relatedCategory", ASCENDING)], background=True)
-    profile_index = IndexModel([("relatedProfiles", ASCENDING)], background=True)
-    try:
-        await get_products_collection().create_indexes([modified_index, category_index, profile_index])
-    except PyMongoError as e:
-        logger.exception(e)
-
-
 async def insert_product(data):
     inserted_id = await insert_object(get_products_collection(), data)
     return inserted_id
@@ -486,6 +880,7 @@ async def read_product(uid, filters=None, collection=None):
         filters = {}
     data = await collection.find_one(
         {"_id": uid, **filters},
+        projection=NO_REVISIONS_PROJECTION,
         session=get_db_session(),
     )
     if not data:
@@ -493,12 +888,43 @@ async def read_product(uid, filters=None, collection=None):
     return rename_id(data)
 
 
+async def find_products_categories(product_ids):
+    """
+    :return: {product id: relatedCategory} of the found products
+    """
+    collection = get_products_collection()
+    cursor = collection.find(
+        {"_id": {"$in": list(product_ids)}},
+        projection={"relatedCategory": True},
+        session=get_db_session(),
+    )
+    return {product["_id"]: product.get("relatedCategory") async for product in cursor}
+
+
+async def read_product_revs(uid):
+    """
+    Revs of a product and the category and vendor it's served with
+    """
+    product = await read_rev(get_products_collection(), uid, projection={"relatedCategory": True, "vendor.id": True})
+    if not product:
+        return None
+    vendor = None
+    if "vendor" in product:
+        vendor = await read_rev(get_vendor_collection(), product["vendor"].get("id"))
+    return (
+        product.get("_rev"),
+        await read_category_rev(product.get("relatedCategory")),
+        vendor and vendor.get("_rev"),
+    )
+
+
 @asynccontextmanager
 async def read_and_update_product(uid, filters=None):
     collection = get_products_collection(read_preference=ReadPreference.PRIMARY)
     data = await read_product(uid, filters=filters, collection=collection)
+    before = deepcopy(data)
     yield data
-    await update_object(collection, data)
+    await update_object(collection, data, before=before)
 
 
 # product prices
@@ -506,17 +932,6 @@ def get_prices_collection(read_preference=None):
     return get_collection("prices", read_preference=read_preference)
 
 
-async def init_prices_indexes():
-    modified_index = IndexModel([("dateModified", ASCENDING)], background=True)
-    date_index = IndexModel([("date", ASCENDING)], background=True)
-    product_index = IndexModel([("productId", ASCENDING)], background=True)
-    date_product_index = IndexModel([("date", ASCENDING), ("productId", ASCENDING)], background=True)
-    try:
-        await get_prices_collection().create_indexes([modified_index, date_index, product_index, date_product_index])
-    except PyMongoError as e:
-        logger.exception(e)
-
-
 async def clear_prices_collection():
     await get_prices_collection().delete_many({})
 
@@ -526,6 +941,76 @@ async def insert_price(data):
     return inserted_id
 
 
+def get_price_key(price):
+    """
+    A price of a product per day and unit, whatever its id.
+    The prices written before the ids became deterministic have random ones
+    """
+    return price["productId"], price["date"][:10], price["unitCode"]
+
+
+async def write_prices(items, product_ids=None):
+    """
+    Inserts the new prices and updates the changed ones,
+    the unchanged prices keep their dateModified, so they don't show up in the feed again
+    :param items: prices to write
+    :param product_ids: of a full recalculation, their prices that aren't in `items` are deleted
+    :return: ids of the inserted and updated prices
+    """
+    collection = get_prices_collection()
+    if product_ids is not None:
+        filters = {"productId": {"$in": list(product_ids)}}
+    elif items:
+        filters = {
+            "productId": {"$in": list({item["productId"] for item in items})},
+            "date": {"$gte": min(item["date"][:10] for item in items)},
+        }
+    else:
+        filters = {"_id": {"$in": []}}
+    existing = {}
+    duplicate_ids = []  # of the days written twice, by an earlier id and a deterministic one
+    async for price in collection.find(filters, session=get_db_session()):
+        if get_price_key(price) in existing:
+            duplicate_ids.append(price["_id"])
+        else:
+            existing[get_price_key(price)] = price
+
+    operations = []
+    written_ids = []
+    for data in items:
+        document = dict(**data)
+        document["_id"] = document.pop("id")
+        before = existing.pop(get_price_key(document), None)
+        if before is not None:
+            document["_id"] = before["_id"]  # a random id of an earlier price is kept
+        if before is None:
+            document["_rev"] = get_next_rev()
+            # a concurrent writer may have inserted it since, then its row is kept
+            operations.append(UpdateOne({"_id": document["_id"]}, {"$setOnInsert": document}, upsert=True))
+        else:
+            after = {k: v for k, v in document.items() if k not in ("_id", "dateCreated", "dateModified")}
+            operations_data = get_update_operations({k: v for k, v in before.items() if k in after}, after)
+            if not operations_data:
+                inc("db_skipped_writes", collection.name)
+                continue
+            operations_data["$set"] = {
+                **operations_data.get("$set", {}),
+                "dateModified": document["dateModified"],
+                "_rev": get_next_rev(before.get("_rev")),
+            }
+            operations.append(UpdateOne({"_id": document["_id"]}, operations_data))
+        inc("db_written_bytes", collection.name, get_document_size(document))
+        written_ids.append(document["_id"])
+    if product_ids is not None:
+        duplicate_ids.extend(price["_id"] for price in existing.values())
+    if duplicate_ids:
+        operations.append(DeleteMany({"_id": {"$in": duplicate_ids}}))
+
+    if operations:
+        await collection.bulk_write(operations, ordered=False, session=get_db_session())
+    return written_ids
+
+
 async def find_prices(**kwargs):
     collection = get_prices_collection()
     result = await paginated_result(collection, **kwargs, full_data=True)
@@ -561,6 +1046,20 @@ async def find_last_price_by_product(product_id):
     return rename_id(price)
 
 
+async def find_last_prices_dates(product_ids):
+    """
+    :return: {product id: date of its last price} of the products with prices
+    """
+    collection = get_prices_collection()
+    pipeline = [
+        {"$match": {"productId": {"$in": list(product_ids)}}},
+        {"$sort": {"productId": 1, "date": -1}},
+        {"$group": {"_id": "$productId", "date": {"$first": "$date"}}},
+    ]
+    cursor = collection.aggregate(pipeline, session=get_db_session())
+    return {price["_id"]: price["date"] async for price in cursor}
+
+
 async def read_price(uid, filters=None, collection=None):
     if collection is None:
         collection = get_prices_collection()
@@ -568,6 +1067,7 @@ async def read_price(uid, filters=None, collection=None):
         filters = {}
     data = await collection.find_one(
         {"_id": uid, **filters},
+        projection=NO_REVISIONS_PROJECTION,
         session=get_db_session(),
     )
     if not data:
@@ -579,32 +1079,18 @@ async def read_price(uid, filters=None, collection=None):
 async def read_and_update_price(uid, filters=None):
     collection = get_prices_collection(read_preference=ReadPreference.PRIMARY)
     data = await read_price(uid, filters=filters, collection=collection)
+    before = deepcopy(data)
     yield data
-    await update_object(collection, data)
+    await update_object(collection, data, before=before)
 
 
 # product_bids
-def get_product_bids_collection(read_preference=None):
-    return get_collection("product_bids", read_preference=read_preference)
+PRODUCT_BID_PRICE_FIELDS = ("productId", "date", "amount", "currency", "valueAddedTaxIncluded", "unitCode", "unitName")
+PRODUCT_BID_PRICE_PROJECTION = {field: True for field in PRODUCT_BID_PRICE_FIELDS}
 
 
-async def init_product_bids_indexes():
-    modified_index = IndexModel([("dateModified", ASCENDING)], background=True)
-    date_index = IndexModel([("date", ASCENDING)], background=True)
-    product_index = IndexModel([("productId", ASCENDING)], background=True)
-    date_product_index = IndexModel([("date", ASCENDING), ("productId", ASCENDING)], background=True)
-    unique_tender_bid_item = IndexModel(
-        [("tenderId", ASCENDING), ("bidId", ASCENDING), ("itemId", ASCENDING)],
-        unique=True,
-        background=True,
-        name="unique_tender_bid_item",
-    )
-    try:
-        await get_product_bids_collection().create_indexes(
-            [modified_index, date_index, product_index, date_product_index, unique_tender_bid_item]
-        )
-    except PyMongoError as e:
-        logger.exception(e)
+def get_product_bids_collection(read_preference=None):
+    return get_collection("product_bids", read_preference=read_preference)
 
 
 async def insert_product_bid(data):
@@ -620,22 +1106,28 @@ async def find_product_bids(**kwargs):
     return result
 
 
-async def find_product_bids_group_products(limit=None, skip=None, start_date=None, end_date=None, **kwargs):
+async def find_product_bids_group_products(start_date=None, end_date=None, batch_size=None, modified_since=None):
+    """
+    A single cursor over the products of the bids, with the number of their bids in the date range
+    :param modified_since: the bids crawled since are included too, whatever their date after start_date
+    """
     collection = get_product_bids_collection()
+    match = {}
+    if end_date is not None:
+        match["date"] = {"$lt": end_date}
+    if start_date is not None and modified_since is not None:
+        match["$or"] = [{"date": {"$gte": start_date}}, {"dateModified": {"$gte": modified_since}}]
+    elif start_date is not None:
+        match["date"] = {**match.get("date", {}), "$gte": start_date}
     pipeline = [
-        {"$group": {"_id": "$productId"}},
+        {"$group": {"_id": "$productId", "bids": {"$sum": 1}}},
         {"$sort": {"_id": 1}},
     ]
-    if skip is not None:
-        pipeline.append({"$skip": skip})
-    if limit is not None:
-        pipeline.append({"$limit": limit})
-    if start_date is not None:
-        pipeline.insert(0, {"$match": {"date": {"$gte": start_date}}})
-    if end_date is not None:
-        pipeline.insert(0, {"$match": {"date": {"$lt": end_date}}})
+    if match:
+        pipeline.insert(0, {"$match": match})
 
-    result = collection.aggregate(pipeline, session=get_db_session())
+    kwargs = {"batchSize": batch_size} if batch_size else {}
+    result = collection.aggregate(pipeline, allowDiskUse=True, session=get_db_session(), **kwargs)
     return result
 
 
@@ -655,6 +1147,35 @@ async def find_product_bids_by_product(product_id, start_date=None, unit_code=No
     return result
 
 
+async def find_product_bids_by_products(products, end_date=None, batch_size=None):
+    """
+    Bids of many products in a single query, the bids of a product follow each other ordered by date
+    :param products: {(unit code, start date or None): product ids}
+    :param end_date: the bids of this date and later are left out
+    """
+    collection = get_product_bids_collection()
+    clauses = []
+    for (unit_code, start_date), product_ids in products.items():
+        clause = {"productId": {"$in": list(product_ids)}, "unitCode": unit_code}
+        date_query = {}
+        if start_date:
+            date_query["$gte"] = start_date
+        if end_date:
+            date_query["$lt"] = end_date
+        if date_query:
+            clause["date"] = date_query
+        clauses.append(clause)
+    cursor = collection.find(
+        {"currency": "UAH", "valueAddedTaxIncluded": False, "$or": clauses},
+        projection=PRODUCT_BID_PRICE_PROJECTION,
+        sort=[("productId", ASCENDING), ("date", ASCENDING)],
+        session=get_db_session(),
+    )
+    if batch_size:
+        cursor.batch_size(batch_size)
+    return cursor
+
+
 async def read_product_bid(uid, filters=None, collection=None):
     if collection is None:
         collection = get_product_bids_collection()
@@ -662,6 +1183,7 @@ async def read_product_bid(uid, filters=None, collection=None):
         filters = {}
     data = await collection.find_one(
         {"_id": uid, **filters},
+        projection=NO_REVISIONS_PROJECTION,
         session=get_db_session(),
     )
     if not data:
@@ -673,8 +1195,9 @@ async def read_product_bid(uid, filters=None, collection=None):
 async def read_and_update_product_bid(uid, filters=None):
     collection = get_product_bids_collection(read_preference=ReadPreference.PRIMARY)
     data = await read_product_bid(uid, filters=filters, collection=collection)
+    before = deepcopy(data)
     yield data
-    await update_object(collection, data)
+    await update_object(collection, data, before=before)
 
 
 # offers
@@ -682,15 +1205,6 @@ def get_offers_collection(read_preference=None):
     return get_collection("offers", read_preference=read_preference)
 
 
-async def init_offers_indexes():
-    modified_index = IndexModel([("dateModified", ASCENDING)], background=True)
-    category_index = IndexModel([("relatedCategory", ASCENDING)], background=True)
-    try:
-        await get_offers_collection().create_indexes([modified_index, category_index])
-    except PyMongoError as e:
-        logger.exception(e)
-
-
 async def insert_offer(data):
     inserted_id = await insert_object(get_offers_collection(), data)
     return inserted_id
@@ -707,12 +1221,18 @@ async def read_offer(uid):
     return await read_object(collection, uid, obj_name="offer")
 
 
+async def read_offer_revs(uid):
+    offer = await read_rev(get_offers_collection(), uid)
+    return offer and (offer.get("_rev"),)
+
+
 @asynccontextmanager
 async def read_and_update_offer(uid):
     collection = get_offers_collection(read_preference=ReadPreference.PRIMARY)
     data = await read_object(collection, uid, obj_name="offer")
+    before = deepcopy(data)
     yield data
-    await update_object(collection, data)
+    await update_object(collection, data, before=before)
 
 
 # vendor
@@ -720,19 +1240,6 @@ def get_vendor_collection(read_preference=None):
     return get_collection("vendors", read_preference=read_preference)
 
 
-async def init_vendor_indexes():
-    modified_index = IndexModel(
-        [("dateModified", ASCENDING)],
-        partialFilterExpression={"isActivated": True},
-        background=True,
-        name="activated_vendors",
-    )
-    try:
-        await get_vendor_collection().create_indexes([modified_index])
-    except PyMongoError as e:
-        logger.exception(e)
-
-
 async def find_vendors(**kwargs):
     collection = get_vendor_collection()
     result = await paginated_result(collection, **kwargs)
@@ -744,6 +1251,11 @@ async def read_vendor(uid):
     return await read_object(collection, uid, obj_name="vendor")
 
 
+async def read_vendor_revs(uid):
+    vendor = await read_rev(get_vendor_collection(), uid)
+    return vendor and (vendor.get("_rev"),)
+
+
 async def insert_vendor(data):
     inserted_id = await insert_object(get_vendor_collection(), data)
     return inserted_id
@@ -753,8 +1265,9 @@ async def insert_vendor(data):
 async def read_and_update_vendor(uid):
     collection = get_vendor_collection(read_preference=ReadPreference.PRIMARY)
     data = await read_object(collection, uid, obj_name="vendor")
+    before = deepcopy(data)
     yield data
-    await update_object(collection, data)
+    await update_object(collection, data, before=before)
 
 
 # contributor
@@ -762,14 +1275,6 @@ def get_contributor_collection(read_preference=None):
     return get_collection("contributors", read_preference=read_preference)
 
 
-async def init_contributor_indexes():
-    modified_index = IndexModel([("dateModified", ASCENDING)], background=True)
-    try:
-        await get_contributor_collection().create_indexes([modified_index])
-    except PyMongoError as e:
-        logger.exception(e)
-
-
 async def find_contributors(**kwargs):
     collection = get_contributor_collection()
     result = await paginated_result(
@@ -793,8 +1298,9 @@ async def insert_contributor(data):
 async def read_and_update_contributor(uid):
     collection = get_contributor_collection(read_preference=ReadPreference.PRIMARY)
     data = await read_object(collection, uid, obj_name="contributor")
+    before = deepcopy(data)
     yield data
-    await update_object(collection, data)
+    await update_object(collection, data, before=before)
 
 
 # product requests
@@ -802,15 +1308,6 @@ def get_product_request_collection(read_preference=None):
     return get_collection("requests", read_preference=read_preference)
 
 
-async def init_request_indexes():
-    # db.requests.createIndex({ "dateModified": 1 })
-    modified_index = IndexModel([("dateModified", ASCENDING)], background=True)
-    try:
-        await get_product_request_collection().create_indexes([modified_index])
-    except PyMongoError as e:
-        logger.exception(e)
-
-
 async def find_product_requests(**kwargs):
     collection = get_product_request_collection()
     result = await paginated_result(
@@ -825,6 +1322,25 @@ async def read_product_request(uid):
     return await read_object(collection, uid, obj_name="request")
 
 
+async def read_product_request_revs(uid):
+    """
+    Revs of a product request and the category and contributor it's served with
+    """
+    product_request = await read_rev(
+        get_product_request_collection(),
+        uid,
+        projection={"product.relatedCategory": True, "contributor_id": True},
+    )
+    if not product_request:
+        return None
+    contributor = await read_rev(get_contributor_collection(), product_request.get("contributor_id"))
+    return (
+        product_request.get("_rev"),
+        await read_category_rev(product_request.get("product", {}).get("relatedCategory")),
+        contributor and contributor.get("_rev"),
+    )
+
+
 async def insert_product_request(data):
     inserted_id = await insert_object(get_product_request_collection(), data)
     return inserted_id
@@ -834,8 +1350,9 @@ async def insert_product_request(data):
 async def read_and_update_product_request(uid):
     collection = get_product_request_collection(read_preference=ReadPreference.PRIMARY)
     data = await read_object(collection, uid, obj_name="request")
+    before = deepcopy(data)
     yield data
-    await update_object(collection, data)
+    await update_object(collection, data, before=before)
 
 
 # tags
@@ -843,16 +1360,6 @@ def get_tag_collection(read_preference=None):
     return get_collection("tag", read_preference=read_preference)
 
 
-async def init_tag_indexes():
-    code_index = IndexModel([("code", ASCENDING)], background=True, unique=True)
-    name_index = IndexModel([("name", ASCENDING)], background=True, unique=True)
-    name_en_index = IndexModel([("name_en", ASCENDING)], background=True, unique=True)
-    try:
-        await get_tag_collection().create_indexes([code_index, name_index, name_en_index])
-    except PyMongoError as e:
-        logger.exception(e)
-
-
 async def find_tags(limit, active):
     collection = get_tag_collection()
     limit = min(limit, MAX_LIST_LIMIT)
@@ -866,6 +1373,7 @@ async def find_tags(limit, active):
 async def read_tag(tag_code):
     tag = await get_tag_collection().find_one(
         {"code": tag_code},
+        projection=NO_REVISIONS_PROJECTION,
         session=get_db_session(),
     )
     if not tag:
@@ -878,16 +1386,17 @@ async def insert_tag(data):
     return inserted_id
 
 
-async def update_tag(tag):
-    await update_object(get_tag_collection(read_preference=ReadPreference.PRIMARY), tag)
+async def update_tag(tag, before=None):
+    await update_object(get_tag_collection(read_preference=ReadPreference.PRIMARY), tag, before=before)
 
 
 @asynccontextmanager
 async def read_and_update_tag(tag_code):
     data = await read_tag(tag_code)
+    before = deepcopy(data)
     yield data
     try:
-        await update_tag(data)
+        await update_tag(data, before=before)
     except DuplicateKeyError as e:
         detail = e.details
         if detail and "keyValue" in detail:
@@ -942,21 +1451,3 @@ async def validate_tags_exist(tag_codes: list[str]) -> None:
     missing = set(tag_codes) - set(existing_tags)
     if missing:
         raise web.HTTPBadRequest(text=f"Tags not found: {', '.join(missing)}")
-
-
-async def wait_until_cluster_time_reached(session, target_cluster_time, timeout=5.0):
-    """
-    Waits until the session's cluster_time reaches or exceeds the target_cluster_time.
-    """
-    start_time = time.time()
-    while True:
-        await session.client.admin.command("ping", session=session)
-        current_cluster_time = session.cluster_time
-
-        if current_cluster_time and current_cluster_time["clusterTime"] >= target_cluster_time["clusterTime"]:
-            break
-
-        if time.time() - start_time > timeout:
-            raise TimeoutError("Timed out waiting for clusterTime to reach target.")
-
-        await asyncio.sleep(0.1)
@@ -0,0 +1,132 @@
+"""
+Change feeds of the collections for /api/feed.
+Every worker keeps a single change stream per collection and fans its events out to the connected clients
+"""
+
+import asyncio
+import logging
+
+from pymongo.errors import PyMongoError
+
+from catalog.settings import CHANGE_STREAM_RETRY_DELAY, FEED_QUEUE_SIZE
+
+logger = logging.getLogger(__name__)
+
+# the same changes that move documents in the dateModified ordered lists
+CHANGES_PIPELINE = [
+    {
+        "$match": {
+            "$or": [
+                {"operationType": {"$in": ["insert", "replace"]}},
+                {"updateDescription.updatedFields.dateModified": {"$exists": True}},
+            ]
+        }
+    },
+    {
+        "$project": {
+            "documentKey": True,
+            "fullDocument.dateModified": True,
+            "fullDocument._rev": True,
+            "updateDescription.updatedFields.dateModified": True,
+            "updateDescription.updatedFields._rev": True,
+        }
+    },
+]
+
+
+def change_to_event(change):
+    fields = change.get("fullDocument") or change.get("updateDescription", {}).get("updatedFields", {})
+    if "dateModified" not in fields:
+        return None
+    return {
+        "id": change["documentKey"]["_id"],
+        "dateModified": fields["dateModified"],
+        "rev": fields.get("_rev"),
+    }
+
+
+class ChangeFeed:
+    """
+    Subscribers get queues of `{id, dateModified, rev}` events.
+    `None` in a queue means the subscriber is closed (it is too slow or the change stream is broken)
+    and the client should reconnect, so it fetches everything it missed from the database
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.subscribers = set()
+        self.opened = None
+        self.task = None
+
+    async def subscribe(self):
+        """
+        :return: events queue or None if change streams are unavailable
+        """
+        if self.task is None or self.task.done():
+            self.opened = asyncio.get_running_loop().create_future()
+            self.task = asyncio.create_task(self.run())
+        queue = asyncio.Queue(FEED_QUEUE_SIZE)
+        self.subscribers.add(queue)
+        # the stream must be open before the client reads the database, otherwise changes in between are lost
+        if not await asyncio.shield(self.opened):
+            self.subscribers.discard(queue)
+            return None
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+
+    def publish(self, event):
+        for queue in tuple(self.subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self.close_subscriber(queue)
+
+    def close_subscriber(self, queue):
+        self.subscribers.discard(queue)
+        if queue.full():  # the rest is going to be fetched from the database after reconnection
+            while not queue.empty():
+                queue.get_nowait()
+        queue.put_nowait(None)
+
+    async def run(self):
+        try:
+            async with self.collection.watch(CHANGES_PIPELINE) as stream:
+                self.opened.set_result(True)
+                logger.info(f"Watching {self.collection.name} changes for the feed")
+                async for change in stream:
+                    event = change_to_event(change)
+                    if event:
+                        self.publish(event)
+        except PyMongoError as e:
+            logger.warning(f"{self.collection.name} feed change stream is unavailable: {e}")
+        if self.opened.done():
+            self.opened = asyncio.get_running_loop().create_future()
+        self.opened.set_result(False)
+        for queue in tuple(self.subscribers):
+            self.close_subscriber(queue)
+        await asyncio.sleep(CHANGE_STREAM_RETRY_DELAY)  # new subscribers are refused meanwhile
+
+    def close(self):
+        if self.task is not None:
+            self.task.cancel()
+        if self.opened is not None and not self.opened.done():
+            self.opened.set_result(False)
+        for queue in tuple(self.subscribers):
+            self.close_subscriber(queue)
+
+
+FEEDS = {}
+
+
+def get_feed(collection):
+    if collection.name not in FEEDS:
+        FEEDS[collection.name] = ChangeFeed(collection)
+    return FEEDS[collection.name]
+
+
+async def close_feeds(app):
+    while FEEDS:
+        _, feed = FEEDS.popitem()
+        feed.close()
@@ -40,9 +40,10 @@ from catalog.models.criteria import (
     RGResponse,
     RGUpdateInput,
 )
+from catalog.models.revision import RevisionList
 from catalog.serializers.base import RootSerializer
 from catalog.state.category import CategoryState
-from catalog.utils import get_revision_changes, pagination_params
+from catalog.utils import check_not_modified, get_revision_changes, pagination_params, set_etag
 
 logger = logging.getLogger(__name__)
 
@@ -112,7 +113,9 @@ class CategoryItemView(PydanticView):
 
         Tags: Categories
         """
+        await check_not_modified(self.request, db.read_category_revs, category_id)
         obj = await db.read_category(category_id)
+        set_etag(self.request, obj.get("rev"))
         return {"data": RootSerializer(obj, show_owner=False).data}
 
     async def put(
@@ -331,3 +334,14 @@ class CategoryCriteriaRGRequirementItemView(
         return await BaseCriteriaRGRequirementItemViewMixin.patch(
             self, obj_id, criterion_id, rg_id, requirement_id, body
         )
+
+
+class CategoryRevisionView(PydanticView):
+    async def get(self, category_id: str, /) -> Union[r200[RevisionList], r400[ErrorResponse], r404[ErrorResponse]]:
+        """
+        Get category revisions
+
+        Tags: Categories
+        """
+        revisions = await db.find_revisions(db.get_category_collection(), category_id, obj_name="category")
+        return {"data": revisions}
@@ -16,7 +16,7 @@ from catalog.models.product_request import (
 )
 from catalog.serializers.product_request import ProductRequestSerializer
 from catalog.state.product_request import ProductRequestState
-from catalog.utils import get_now, get_revision_changes, pagination_params
+from catalog.utils import check_not_modified, get_now, get_revision_changes, pagination_params, set_etag
 from catalog.validations import (
     validate_category_administrator,
     validate_contributor_banned_categories,
@@ -103,12 +103,14 @@ class ProductRequestItemView(PydanticView):
 
         Tags: Contributor/ProductRequest
         """
+        await check_not_modified(self.request, db.read_product_request_revs, request_id)
         obj = await db.read_product_request(request_id)
         category = await db.read_category(
             category_id=obj["product"].get("relatedCategory"),
-            projection={"criteria": 1, "marketAdministrator": 1},
+            projection={"criteria": 1, "marketAdministrator": 1, "rev": 1},
         )
         contributor = await db.read_contributor(obj.get("contributor_id"))
+        set_etag(self.request, obj.get("rev"), category.get("rev"), contributor.get("rev"))
         return {"data": ProductRequestSerializer(obj, category=category, contributor=contributor).data}
 
 
@@ -0,0 +1,93 @@
+import asyncio
+import logging
+from typing import Optional, Union
+
+from aiohttp.web import HTTPNotFound, HTTPServiceUnavailable, StreamResponse
+from aiohttp_pydantic import PydanticView
+from aiohttp_pydantic.oas.typing import r200, r400, r404
+from pydantic import BaseModel
+
+from catalog import db
+from catalog.feed import get_feed
+from catalog.models.api import ErrorResponse
+from catalog.serialization import json_dumps
+from catalog.settings import FEED_HEARTBEAT_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+FEED_COLLECTIONS = {
+    "categories": db.get_category_collection,
+    "profiles": db.get_profiles_collection,
+    "products": db.get_products_collection,
+}
+
+
+class FeedEvent(BaseModel):
+    id: str
+    dateModified: str
+    rev: Optional[str] = None
+
+
+async def send_event(response, event):
+    # the event id is a list offset, so EventSource reconnects from the last received change
+    data = f"id: {db.encode_offset(event)}\ndata: {json_dumps(event)}\n\n"
+    await response.write(data.encode())
+
+
+class FeedView(PydanticView):
+    async def get(
+        self,
+        resource: str,
+        /,
+        offset: Optional[str] = None,
+    ) -> Union[r200[FeedEvent], r400[ErrorResponse], r404[ErrorResponse]]:
+        """
+        Server-sent events stream of `{id, dateModified, rev}` of changed objects.
+        Starts from the changes after `offset` (or Last-Event-ID header) if it's provided,
+        otherwise from the moment of connection.
+        Events can be repeated around the switch from the stored changes to the live ones.
+
+        Tags: Feed
+        """
+        if resource not in FEED_COLLECTIONS:
+            raise HTTPNotFound(text=f"Feed {resource} not found")
+        collection = FEED_COLLECTIONS[resource]()
+        offset = self.request.headers.get("Last-Event-ID") or offset
+        if offset:
+            db.decode_offset(offset)  # 400 before the stream is started
+
+        feed = get_feed(collection)
+        queue = await feed.subscribe()
+        if queue is None:
+            raise HTTPServiceUnavailable(text="Feed is temporary unavailable")
+        try:
+            response = StreamResponse(
+                headers={
+                    "Content-Type": "text/event-stream",
+                    "Cache-Control": "no-cache",
+                    "X-Accel-Buffering": "no",
+                }
+            )
+            await response.prepare(self.request)
+
+            if offset:
+                async for item in db.find_changes(collection, offset):
+                    await send_event(
+                        response,
+                        {"id": item["_id"], "dateModified": item["dateModified"], "rev": item.get("_rev")},
+                    )
+
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), FEED_HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    await response.write(b": ping\n\n")  # keeps proxies from closing the connection
+                    continue
+                if event is None:  # the client is expected to reconnect with Last-Event-ID
+                    break
+                await send_event(response, event)
+        except ConnectionResetError:
+            logger.debug("Feed client disconnected")
+        finally:
+            feed.unsubscribe(queue)
+        return response
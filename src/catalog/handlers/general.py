@@ -5,6 +5,7 @@ from aiohttp_pydantic.oas.typing import r200
 from pydantic import BaseModel
 
 from catalog import version as api_version
+from catalog.metrics import get_metrics
 from catalog.serialization import json_response
 
 logger = logging.getLogger(__name__)
@@ -18,6 +19,10 @@ class VersionResponse(BaseModel):
     version: str
 
 
+class MetricsResponse(BaseModel):
+    data: dict[str, dict[str, float]]
+
+
 @inject_params.and_request
 async def ping_handler(request) -> r200[PingResponse]:
     """
@@ -37,3 +42,13 @@ async def get_version(request) -> r200[VersionResponse]:
     Tags: Helpers
     """
     return json_response({"api_version": api_version})
+
+
+@inject_params.and_request
+async def metrics_handler(request) -> r200[MetricsResponse]:
+    """
+    Get counters of the worker process
+
+    Tags: Helpers
+    """
+    return json_response({"data": get_metrics()})
@@ -7,7 +7,7 @@ from catalog import db
 from catalog.models.api import ErrorResponse, PaginatedList
 from catalog.models.offer import OfferResponse
 from catalog.serializers.base import RootSerializer
-from catalog.utils import pagination_params
+from catalog.utils import check_not_modified, pagination_params, set_etag
 
 
 class OfferView(PydanticView):
@@ -39,5 +39,7 @@ class OfferItemView(PydanticView):
 
         Tags: Offers
         """
+        await check_not_modified(self.request, db.read_offer_revs, offer_id)
         data = await db.read_offer(offer_id)
+        set_etag(self.request, data.get("rev"))
         return {"data": RootSerializer(data).data}
@@ -16,9 +16,10 @@ from catalog.models.product import (
     ProductResponse,
     ProductUpdateInput,
 )
+from catalog.models.revision import RevisionList
 from catalog.serializers.product import ProductSerializer
 from catalog.state.product import ProductState
-from catalog.utils import get_now, get_revision_changes, pagination_params
+from catalog.utils import check_not_modified, get_now, get_revision_changes, pagination_params, set_etag
 
 logger = logging.getLogger(__name__)
 
@@ -89,10 +90,11 @@ class ProductItemView(PydanticView):
 
         Tags: Products
         """
+        await check_not_modified(self.request, db.read_product_revs, product_id)
         product = await db.read_product(product_id)
         category = await db.read_category(
             category_id=product.get("relatedCategory"),
-            projection={"criteria": 1},
+            projection={"criteria": 1, "rev": 1},
         )
 
         vendor = None
@@ -102,6 +104,7 @@ class ProductItemView(PydanticView):
             except HTTPNotFound:
                 pass
 
+        set_etag(self.request, product.get("rev"), category.get("rev"), vendor and vendor.get("rev"))
         return {"data": ProductSerializer(product, vendor=vendor, category=category).data}
 
     async def patch(
@@ -136,3 +139,14 @@ class ProductItemView(PydanticView):
         )
 
         return {"data": ProductSerializer(product, category=category).data}
+
+
+class ProductRevisionView(PydanticView):
+    async def get(self, product_id: str, /) -> Union[r200[RevisionList], r400[ErrorResponse], r404[ErrorResponse]]:
+        """
+        Get product revisions
+
+        Tags: Products
+        """
+        revisions = await db.find_revisions(db.get_products_collection(), product_id, obj_name="product")
+        return {"data": revisions}
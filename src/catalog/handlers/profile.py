@@ -1,4 +1,5 @@
 import logging
+from contextlib import asynccontextmanager
 from copy import deepcopy
 from typing import Optional, Union
 
@@ -48,9 +49,18 @@ from catalog.models.profile import (
     RequestProfileCreateInput,
     RequestProfileUpdateInput,
 )
+from catalog.models.revision import RevisionList
+from catalog.related_profiles import is_matching_changed, update_written_profile_products
 from catalog.serializers.base import RootSerializer
 from catalog.state.profile import LocalizationProfileState, ProfileState
-from catalog.utils import find_item_by_id, get_now, get_revision_changes, pagination_params
+from catalog.utils import (
+    check_not_modified,
+    find_item_by_id,
+    get_now,
+    get_revision_changes,
+    pagination_params,
+    set_etag,
+)
 from catalog.validations import validate_profile_requirements
 
 logger = logging.getLogger(__name__)
@@ -130,6 +140,7 @@ class ProfileView(ProfileViewMixin, PydanticView):
         access = set_access_token(self.request, data)
         get_revision_changes(self.request, new_obj=data)
         await db.insert_profile(data)
+        await update_written_profile_products(data)
 
         logger.info(
             f"Created profile {data['id']}",
@@ -153,7 +164,9 @@ class ProfileItemView(ProfileViewMixin, PydanticView):
 
         Tags: Profiles
         """
+        await check_not_modified(self.request, db.read_profile_revs, profile_id)
         profile = await db.read_profile(profile_id)
+        set_etag(self.request, profile.get("rev"))
         return {"data": RootSerializer(profile).data}
 
     async def put(
@@ -183,6 +196,7 @@ class ProfileItemView(ProfileViewMixin, PydanticView):
         access = set_access_token(self.request, data)
         get_revision_changes(self.request, new_obj=data)
         await db.insert_profile(data)
+        await update_written_profile_products(data)
 
         logger.info(
             f"Created profile {data['id']}",
@@ -215,6 +229,8 @@ class ProfileItemView(ProfileViewMixin, PydanticView):
             profile.update(data)
             await self.get_state_class(data).on_patch(old_profile, profile)
             get_revision_changes(self.request, new_obj=profile, old_obj=old_profile)
+        if is_matching_changed(old_profile, profile):
+            await update_written_profile_products(profile)
 
         logger.info(
             f"Updated profile {profile_id}",
@@ -228,8 +244,11 @@ class ProfileCriteriaMixin:
     obj_name = "profile"
 
     @classmethod
-    def read_and_update_parent_obj(cls, obj_id):
-        return db.read_and_update_profile(obj_id)
+    @asynccontextmanager
+    async def read_and_update_parent_obj(cls, obj_id):
+        async with db.read_and_update_profile(obj_id) as profile:
+            yield profile
+        await update_written_profile_products(profile)
 
 
 class ProfileCriteriaView(ProfileCriteriaMixin, BaseCriteriaViewMixin, PydanticView):
@@ -473,3 +492,14 @@ class ProfileCriteriaRGRequirementItemView(ProfileCriteriaMixin, BaseCriteriaRGR
         )
 
         return {"result": "success"}
+
+
+class ProfileRevisionView(PydanticView):
+    async def get(self, profile_id: str, /) -> Union[r200[RevisionList], r400[ErrorResponse], r404[ErrorResponse]]:
+        """
+        Get profile revisions
+
+        Tags: Profiles
+        """
+        revisions = await db.find_revisions(db.get_profiles_collection(), profile_id, obj_name="profile")
+        return {"data": revisions}
@@ -7,6 +7,7 @@ from aiohttp_pydantic.oas.typing import r200, r201, r400, r401, r404
 from catalog import db
 from catalog.auth import set_access_token, validate_access_token, validate_accreditation
 from catalog.models.api import ErrorResponse, PaginatedList
+from catalog.models.revision import RevisionList
 from catalog.models.vendor import (
     VendorCreateResponse,
     VendorPatchInput,
@@ -16,7 +17,7 @@ from catalog.models.vendor import (
 )
 from catalog.serializers.vendor import VendorSerializer, VendorSignSerializer
 from catalog.state.vendor import VendorState
-from catalog.utils import get_revision_changes, pagination_params
+from catalog.utils import check_not_modified, get_revision_changes, pagination_params, set_etag
 
 logger = logging.getLogger(__name__)
 
@@ -76,7 +77,9 @@ class VendorItemView(PydanticView):
 
         Tags: Vendors
         """
+        await check_not_modified(self.request, db.read_vendor_revs, vendor_id)
         obj = await db.read_vendor(vendor_id)
+        set_etag(self.request, obj.get("rev"))
         return {"data": VendorSerializer(obj).data}
 
     async def patch(
@@ -116,3 +119,14 @@ class VendorSignItemView(PydanticView):
         """
         obj = await db.read_vendor(vendor_id)
         return {"data": VendorSignSerializer(obj).data}
+
+
+class VendorRevisionView(PydanticView):
+    async def get(self, vendor_id: str, /) -> Union[r200[RevisionList], r400[ErrorResponse], r404[ErrorResponse]]:
+        """
+        Get vendor revisions
+
+        Tags: Vendors
+        """
+        revisions = await db.find_revisions(db.get_vendor_collection(), vendor_id, obj_name="vendor")
+        return {"data": revisions}
@@ -0,0 +1,109 @@
+"""
+Process-wide http client of the upstream apis.
+
+A single pooled session keeps connections alive between requests (and limits them per host),
+every request is bounded by HTTP_CLIENT_TIMEOUT.
+Upstreams are guarded by circuit breakers, so a degraded one doesn't hold the api workers
+"""
+
+import logging
+import time
+
+import aiohttp
+
+from catalog.metrics import inc
+from catalog.settings import HTTP_CLIENT_LIMIT, HTTP_CLIENT_LIMIT_PER_HOST, HTTP_CLIENT_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+HTTP_CLIENT = None
+
+
+def create_http_client():
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=HTTP_CLIENT_LIMIT, limit_per_host=HTTP_CLIENT_LIMIT_PER_HOST),
+        timeout=aiohttp.ClientTimeout(total=HTTP_CLIENT_TIMEOUT),
+    )
+
+
+def get_http_client():
+    """
+    The client is created on startup of the app, crons get one on the first use
+    """
+    global HTTP_CLIENT
+    if HTTP_CLIENT is None or HTTP_CLIENT.closed:
+        HTTP_CLIENT = create_http_client()
+    return HTTP_CLIENT
+
+
+async def init_http_client(app):
+    get_http_client()
+
+
+async def close_http_client(app=None):
+    global HTTP_CLIENT
+    if HTTP_CLIENT is not None:
+        await HTTP_CLIENT.close()
+        HTTP_CLIENT = None
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Opens after `max_failures` failures in a row and rejects calls for `reset_timeout` seconds,
+    then lets a single trial call through (half-open): its success closes the circuit, its failure reopens it.
+    Calls are made in `async with breaker:`, so a trial that ends without either (e.g. cancelled)
+    lets the next one through
+    """
+
+    def __init__(self, name, max_failures, reset_timeout):
+        self.name = name
+        self.max_failures = max_failures
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def before_call(self):
+        """
+        :raises CircuitOpenError: if the call shouldn't be made
+        """
+        if self.opened_at is None:
+            return
+        if self.trial or time.monotonic() - self.opened_at < self.reset_timeout:
+            inc("circuit_breaker_rejections", self.name)
+            raise CircuitOpenError(f"{self.name} is unavailable")
+        self.trial = True
+
+    async def __aenter__(self):
+        self.before_call()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.trial = False
+
+    def on_success(self):
+        if self.opened_at is not None:
+            logger.info(f"{self.name} circuit is closed")
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+
+    def on_failure(self):
+        self.failures += 1
+        if self.trial or self.failures >= self.max_failures:
+            if not self.trial:
+                logger.warning(f"{self.name} circuit is open after {self.failures} failures")
+                inc("circuit_breaker_opened", self.name)
+            self.opened_at = time.monotonic()
+            self.trial = False
+
+    def reset(self):
+        self.on_success()
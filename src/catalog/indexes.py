@@ -0,0 +1,248 @@
+"""
+Indexes of all the collections.
+
+Workers and crons only verify them on start, the changes are applied once per deployment:
+
+    PYTHONPATH=/app python -m catalog.indexes diff
+    PYTHONPATH=/app python -m catalog.indexes apply [--drop]
+    PYTHONPATH=/app python -m catalog.indexes stats
+"""
+
+import argparse
+import asyncio
+import logging
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import PyMongoError
+
+from catalog.logging import setup_logging
+from catalog.settings import DB_NAME, MONGODB_URI
+
+logger = logging.getLogger(__name__)
+
+# options that make indexes different, e.g. `background` doesn't
+INDEX_OPTIONS = ("unique", "sparse", "partialFilterExpression", "expireAfterSeconds")
+
+
+def cursor_index(**kwargs):
+    # dateModified ordered lists and feeds, see paginated_result
+    return IndexModel([("dateModified", ASCENDING), ("_id", ASCENDING)], background=True, **kwargs)
+
+
+INDEXES = {
+    "category": [
+        cursor_index(),
+        IndexModel([("tags", ASCENDING)], background=True),
+    ],
+    "profiles": [
+        cursor_index(),
+        IndexModel([("tags", ASCENDING)], background=True),
+        # profiles of a category, see catalog.related_profiles
+        IndexModel([("relatedCategory", ASCENDING)], background=True),
+    ],
+    "products": [
+        cursor_index(),
+        # related_profiles_task
+        IndexModel([("relatedCategory", ASCENDING)], background=True),
+        IndexModel([("relatedProfiles", ASCENDING)], background=True),
+    ],
+    "prices": [
+        cursor_index(),
+        IndexModel([("date", ASCENDING)], background=True),
+        IndexModel([("productId", ASCENDING)], background=True),
+        IndexModel([("date", ASCENDING), ("productId", ASCENDING)], background=True),
+        # last prices of the products of a price calculation batch
+        IndexModel([("productId", ASCENDING), ("date", ASCENDING)], background=True),
+        # paginated prices of a product
+        IndexModel([("productId", ASCENDING), ("dateModified", ASCENDING), ("_id", ASCENDING)], background=True),
+    ],
+    "product_bids": [
+        cursor_index(),
+        IndexModel([("date", ASCENDING)], background=True),
+        IndexModel([("productId", ASCENDING)], background=True),
+        IndexModel([("date", ASCENDING), ("productId", ASCENDING)], background=True),
+        # bids of the products of a price calculation batch, ordered by product and date
+        IndexModel([("productId", ASCENDING), ("date", ASCENDING)], background=True),
+        IndexModel(
+            [("tenderId", ASCENDING), ("bidId", ASCENDING), ("itemId", ASCENDING)],
+            unique=True,
+            background=True,
+            name="unique_tender_bid_item",
+        ),
+    ],
+    "offers": [
+        cursor_index(),
+        IndexModel([("relatedCategory", ASCENDING)], background=True),
+    ],
+    "vendors": [
+        # only activated vendors are listed
+        cursor_index(partialFilterExpression={"isActivated": True}, name="activated_vendors_cursor"),
+    ],
+    "contributors": [
+        cursor_index(),
+    ],
+    "requests": [
+        cursor_index(),
+    ],
+    "tag": [
+        IndexModel([("code", ASCENDING)], background=True, unique=True),
+        IndexModel([("name", ASCENDING)], background=True, unique=True),
+        IndexModel([("name_en", ASCENDING)], background=True, unique=True),
+    ],
+    "revisions": [
+        IndexModel([("objectId", ASCENDING), ("rev", ASCENDING)], background=True),
+    ],
+    # queue of catalog.price_worker
+    "dirty_products": [
+        IndexModel([("dateModified", ASCENDING), ("_id", ASCENDING)], background=True),
+    ],
+}
+
+
+def get_index_spec(index):
+    """
+    Comparable (key, options) of an IndexModel document or an index_information() item
+    """
+    key = tuple((field, direction) for field, direction in dict(index["key"]).items())
+    options = tuple((option, index[option]) for option in INDEX_OPTIONS if option in index)
+    return key, options
+
+
+async def diff_collection_indexes(collection, declared):
+    """
+    :return: names of the missing, changed (same name, different spec) and extra indexes
+    """
+    existing = await collection.index_information()
+    existing.pop("_id_", None)
+    missing, changed = [], []
+    for index in declared:
+        name = index.document["name"]
+        if name not in existing:
+            missing.append(name)
+        elif get_index_spec(existing[name]) != get_index_spec(index.document):
+            changed.append(name)
+    declared_names = {index.document["name"] for index in declared}
+    extra = [name for name in existing if name not in declared_names]
+    return {"missing": missing, "changed": changed, "extra": extra}
+
+
+async def diff_indexes(database):
+    names = list(INDEXES)
+    diffs = await asyncio.gather(*(diff_collection_indexes(database[name], INDEXES[name]) for name in names))
+    return dict(zip(names, diffs))
+
+
+async def verify_indexes(database):
+    """
+    Only warns about the difference, use `apply` command to fix it
+    """
+    try:
+        diffs = await diff_indexes(database)
+    except PyMongoError as e:
+        logger.exception(e)
+        return
+    for name, diff in diffs.items():
+        for kind, indexes in diff.items():
+            if indexes:
+                logger.warning(f"{name} collection has {kind} indexes: {', '.join(indexes)}")
+
+
+async def apply_indexes(database, drop=False):
+    """
+    Creates missing indexes, recreates changed ones and, if `drop`, removes the undeclared
+    """
+    diffs = await diff_indexes(database)
+    for name, diff in diffs.items():
+        collection = database[name]
+        to_drop = diff["changed"] + (diff["extra"] if drop else [])
+        for index_name in to_drop:
+            logger.info(f"Dropping {name}.{index_name}")
+            await collection.drop_index(index_name)
+        to_create = [index for index in INDEXES[name] if index.document["name"] in diff["missing"] + diff["changed"]]
+        if to_create:
+            logger.info(f"Creating {name}.{', '.join(index.document['name'] for index in to_create)}")
+            await collection.create_indexes(to_create)
+    return diffs
+
+
+def is_prefix(key, other_key):
+    return len(key) < len(other_key) and other_key[: len(key)] == key
+
+
+async def get_index_stats(database):
+    """
+    Usage of the existing indexes since the server restart (or index creation) on the queried node
+    and the declared indexes that don't exist
+    """
+    rows = []
+    for name, declared in INDEXES.items():
+        collection = database[name]
+        declared_names = {index.document["name"] for index in declared}
+        stats = await collection.aggregate([{"$indexStats": {}}]).to_list(None)
+        keys = [get_index_spec(i)[0] for i in stats]
+        for stat in stats:
+            key = get_index_spec(stat)[0]
+            rows.append(
+                {
+                    "collection": name,
+                    "name": stat["name"],
+                    "ops": stat["accesses"]["ops"],
+                    "since": stat["accesses"]["since"],
+                    "declared": stat["name"] in declared_names or stat["name"] == "_id_",
+                    # a compound index with the same prefix serves the same queries
+                    "redundant": any(is_prefix(key, other) for other in keys),
+                }
+            )
+        existing = {stat["name"] for stat in stats}
+        for index_name in sorted(declared_names - existing):
+            rows.append({"collection": name, "name": index_name, "missing": True})
+    return rows
+
+
+def print_diff(diffs):
+    for name, diff in diffs.items():
+        for kind, indexes in diff.items():
+            for index_name in indexes:
+                print(f"{name}.{index_name}: {kind}")
+
+
+def print_stats(rows):
+    for row in rows:
+        if row.get("missing"):
+            print(f"{row['collection']}.{row['name']}: missing")
+            continue
+        notes = []
+        if not row["declared"]:
+            notes.append("undeclared")
+        if row["redundant"]:
+            notes.append("redundant")
+        if not row["ops"]:
+            notes.append("unused")
+        print(
+            f"{row['collection']}.{row['name']}: {row['ops']} ops since {row['since'].isoformat()} "
+            f"{' '.join(notes)}".rstrip()
+        )
+
+
+async def run(command, drop=False):
+    database = AsyncIOMotorClient(MONGODB_URI)[DB_NAME]
+    if command == "diff":
+        print_diff(await diff_indexes(database))
+    elif command == "apply":
+        print_diff(await apply_indexes(database, drop=drop))
+    elif command == "stats":
+        print_stats(await get_index_stats(database))
+
+
+def main():
+    setup_logging()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=("diff", "apply", "stats"))
+    parser.add_argument("--drop", action="store_true", help="apply: drop the undeclared indexes")
+    args = parser.parse_args()
+    asyncio.run(run(args.command, drop=args.drop))
+
+
+if __name__ == "__main__":
+    main()
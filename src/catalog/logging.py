@@ -43,7 +43,7 @@ def setup_logging():
             record.cookies = cookies
 
         # Log database session
-        session = get_db_session()
+        session = get_db_session(start=False)
         if session:
             record.session = get_session_time(session)
 
@@ -0,0 +1,140 @@
+"""
+Process-level index of the medicine registry ids (INN, ATC) for the additionalClassifications validation.
+
+The registry is loaded once per scheme and refreshed in the background,
+while a refresh is running (or failing) the previously loaded ids are used
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+
+import aiohttp
+
+from catalog.http_client import get_http_client
+from catalog.settings import (
+    HTTP_CLIENT_TIMEOUT,
+    MEDICINE_API_URL,
+    MEDICINE_REGISTRY_PATH,
+    MEDICINE_REGISTRY_PRELOAD,
+    MEDICINE_REGISTRY_REFRESH_INTERVAL,
+    MEDICINE_SCHEMES,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class MedicineRegistryError(Exception):
+    pass
+
+
+def read_registry_file(path):
+    with open(path) as f:
+        return json.load(f)["data"]
+
+
+class MedicineRegistry:
+    def __init__(self, schemes, url, refresh_interval, path=None):
+        """
+        :param path: directory with `<scheme>.json` files of the registry api format, used instead of the api
+        """
+        self.schemes = schemes
+        self.url = url
+        self.refresh_interval = refresh_interval
+        self.path = path
+        self._ids = {}  # scheme: (frozenset of ids, monotonic time of loading)
+        self._loading = {}  # scheme: task
+        self.task = None
+
+    async def fetch(self, scheme):
+        """
+        :return: `data` of the registry, a dict with the ids as keys
+        """
+        if self.path:
+            return await asyncio.to_thread(read_registry_file, os.path.join(self.path, f"{scheme.lower()}.json"))
+        # the registry is a few megabytes, so only waiting for its chunks is limited
+        timeout = aiohttp.ClientTimeout(total=None, sock_read=HTTP_CLIENT_TIMEOUT)
+        async with get_http_client().get(f"{self.url}/registry/{scheme.lower()}.json", timeout=timeout) as resp:
+            if resp.status != 200:
+                raise MedicineRegistryError(f"{scheme} registry response status {resp.status}")
+            response = await resp.json()
+            return response["data"]
+
+    async def load(self, scheme):
+        try:
+            data = await self.fetch(scheme)
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError, ValueError, KeyError) as e:
+            raise MedicineRegistryError(f"Can't load {scheme} registry: {e!r}") from e
+        self._ids[scheme] = (frozenset(data), time.monotonic())
+        logger.info(f"Loaded {len(data)} ids of {scheme} medicine registry")
+
+    def refresh(self, scheme):
+        """
+        Starts loading of the scheme ids unless it's already running
+        :return: the loading task
+        """
+        task = self._loading.get(scheme)
+        if task is None or task.done():
+            task = self._loading[scheme] = asyncio.create_task(self.load(scheme))
+            task.add_done_callback(self._log_refresh_error)
+        return task
+
+    @staticmethod
+    def _log_refresh_error(task):
+        if not task.cancelled() and task.exception():
+            logger.warning(str(task.exception()))
+
+    async def get_ids(self, scheme):
+        """
+        :return: frozenset of the scheme ids, stale ones are returned while they are refreshed
+        :raises MedicineRegistryError: if the scheme has never been loaded successfully
+        """
+        loaded = self._ids.get(scheme)
+        if loaded is None:
+            await asyncio.shield(self.refresh(scheme))
+            return self._ids[scheme][0]
+        ids, loaded_at = loaded
+        if time.monotonic() - loaded_at >= self.refresh_interval:
+            self.refresh(scheme)
+        return ids
+
+    async def run(self):
+        """
+        Keeps every scheme loaded and refreshed
+        """
+        while True:
+            await asyncio.gather(*(self.refresh(scheme) for scheme in self.schemes), return_exceptions=True)
+            await asyncio.sleep(self.refresh_interval)
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        for task in self._loading.values():
+            task.cancel()
+
+    def clear(self):
+        self._ids.clear()
+        self._loading.clear()
+
+
+medicine_registry = MedicineRegistry(
+    MEDICINE_SCHEMES,
+    MEDICINE_API_URL,
+    MEDICINE_REGISTRY_REFRESH_INTERVAL,
+    path=MEDICINE_REGISTRY_PATH,
+)
+
+
+async def start_medicine_registry(app):
+    if MEDICINE_REGISTRY_PRELOAD:  # otherwise schemes are loaded on the first use
+        medicine_registry.start()
+
+
+async def stop_medicine_registry(app):
+    medicine_registry.close()
@@ -0,0 +1,29 @@
+"""
+Process-local counters exposed on /api/metrics.
+Every gunicorn worker keeps its own values, so they should be summed by the collector
+"""
+
+from collections import defaultdict
+from threading import Lock
+
+_counters: defaultdict[str, defaultdict[str, float]] = defaultdict(lambda: defaultdict(int))
+_lock = Lock()  # pymongo event listeners are called from the driver threads
+
+
+def inc(name, label="", value=1):
+    with _lock:
+        _counters[name][label] += value
+
+
+def observe(name, label, seconds):
+    inc(f"{name}_count", label)
+    inc(f"{name}_seconds", label, seconds)
+
+
+def get_metrics():
+    with _lock:
+        return {name: dict(values) for name, values in _counters.items()}
+
+
+def reset_metrics():
+    _counters.clear()
@@ -1,20 +1,55 @@
 import logging
 from base64 import b64decode
+from contextlib import contextmanager
 from uuid import uuid4
 
+import msgpack
 from aiohttp.web import HTTPBadRequest, HTTPException, HTTPInternalServerError, middleware
 from bson.json_util import loads
 from pydantic import ValidationError
 
 from catalog.auth import login_user
-from catalog.context import set_db_session, set_now, set_request
-from catalog.db import get_database, wait_until_cluster_time_reached
+from catalog.context import set_db_session_factory, set_now, set_request
+from catalog.db import LazySession
 from catalog.logging import request_cookies_var, request_id_var
-from catalog.serialization import json_dumps, json_response
+from catalog.serialization import (
+    MSGPACK_CONTENT_TYPE,
+    json_dumps,
+    json_response,
+    msgpack_loads,
+    msgpack_response,
+)
+from catalog.settings import IMG_PATH
 from catalog.utils import get_session_time
 
 logger = logging.getLogger(__name__)
 
+# routes that never query the db
+NO_DB_SESSION_PATHS = ("/api/ping", "/api/version", "/api/metrics", "/api/doc", IMG_PATH)
+PREPARE_HEADERS_KEY = "prepare_headers"
+
+
+@contextmanager
+def headers_on_prepare(request, set_headers):
+    """
+    Streamed responses are prepared by the handlers before the middlewares get them back,
+    so the middleware headers are set by `set_prepare_headers` then
+    """
+    callbacks = request.setdefault(PREPARE_HEADERS_KEY, [])
+    callbacks.append(set_headers)
+    try:
+        yield
+    finally:
+        callbacks.remove(set_headers)
+
+
+async def set_prepare_headers(request, response):
+    """
+    on_response_prepare signal handler
+    """
+    for set_headers in request.get(PREPARE_HEADERS_KEY, ()):
+        set_headers(response)
+
 
 def json_dumps_validation_error(exc: ValidationError) -> str:
     """Format ValidationError into JSON string with detailed error messages."""
@@ -62,11 +97,29 @@ async def error_middleware(request, handler):
 async def convert_response_to_json(request, handler):
     """
     convert dicts into valid json responses
+    or msgpack ones if the client accepts them.
+    msgpack request bodies are read as json ones
     """
+    if request.content_type == MSGPACK_CONTENT_TYPE:
+
+        async def read_msgpack(*_, **__):
+            try:
+                return msgpack_loads(await request.read())
+            except (ValueError, msgpack.UnpackException):
+                raise HTTPBadRequest(text="Malformed msgpack")
+
+        request.json = read_msgpack  # used by the pydantic views to get the body
+
     response = await handler(request)
     if isinstance(response, dict):
         status_code = 201 if request.method in ("POST", "PUT") else 200
-        response = json_response(response, status=status_code)
+        if MSGPACK_CONTENT_TYPE in request.headers.get("Accept", ""):
+            response = msgpack_response(response, status=status_code)
+        else:
+            response = json_response(response, status=status_code)
+        if etag := request.get("etag"):
+            response.etag = etag
+            response.headers["Vary"] = "Accept"
     return response
 
 
@@ -80,8 +133,14 @@ async def request_id_middleware(request, handler):
     """
     value = request.headers.get("X-Request-ID", str(uuid4()))
     request_id_var.set(value)  # for loggers inside context
-    response = await handler(request)
-    response.headers["X-Request-ID"] = value  # for AccessLogger
+
+    def set_headers(response):
+        response.headers["X-Request-ID"] = value  # for AccessLogger
+
+    with headers_on_prepare(request, set_headers):
+        response = await handler(request)
+    if not response.prepared:
+        set_headers(response)
     return response
 
 
@@ -105,39 +164,45 @@ async def context_middleware(request, handler):
 @middleware
 async def db_session_middleware(request, handler):
     """
-    Sets db session contextvar
+    Provides a causally consistent db session to `get_db_session()`.
+    It's started on the first use, so requests that don't query the db pay nothing for it
+    and SESSION cookie is only re-issued if the session has moved the operation time
     :param request:
     :param handler:
     :return:
     """
+    if request.path.startswith(NO_DB_SESSION_PATHS):
+        return await handler(request)
+
     cookie_name = "SESSION"
     warning = None
-    db = get_database()
-    async with await db.client.start_session(causal_consistency=True) as session:
-        cookie = request.cookies.get(cookie_name)
-        if cookie:
-            try:
-                values = loads(b64decode(cookie))
-                session.advance_cluster_time(values["cluster_time"])  # global time in cluster level
-                session.advance_operation_time(values["operation_time"])  # last successful operation time in session
-
-                # adds retry if current cluster time less than cluster time from cookie
-                await wait_until_cluster_time_reached(session, values["cluster_time"])
-            except Exception as exc:
-                warning = f"Error on {cookie_name} cookie parsing: {exc}"
-                logger.debug(warning)
-
-        set_db_session(session)
-        request_cookies_var.set(dict(request.cookies))
+    lazy_session = LazySession()
+    cookie = request.cookies.get(cookie_name)
+    if cookie:
         try:
+            values = loads(b64decode(cookie))
+            # session reads are sent with afterClusterTime, so the server waits until it has the client's writes
+            lazy_session = LazySession(cluster_time=values["cluster_time"], operation_time=values["operation_time"])
+        except Exception as exc:
+            warning = f"Error on {cookie_name} cookie parsing: {exc}"
+            logger.debug(warning)
+
+    def set_headers(response):
+        if lazy_session.operation_time_advanced:
+            response.set_cookie(cookie_name, get_session_time(lazy_session.session))
+        if warning:
+            # https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Warning
+            response.headers["X-Warning"] = f'199 - "{warning}"'
+
+    set_db_session_factory(lazy_session)
+    request_cookies_var.set(dict(request.cookies))
+    try:
+        with headers_on_prepare(request, set_headers):
             response = await handler(request)  # processing request
-            end_time = get_session_time(session)
-            response.set_cookie(cookie_name, end_time)
-        finally:
-            set_db_session(None)
-
-    if warning:
-        # https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Warning
-        response.headers["X-Warning"] = f'199 - "{warning}"'
+        if not response.prepared:
+            set_headers(response)
+    finally:
+        set_db_session_factory(None)
+        lazy_session.end()
 
     return response
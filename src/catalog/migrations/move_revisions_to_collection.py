@@ -0,0 +1,79 @@
+import asyncio
+import logging
+
+import sentry_sdk
+
+from catalog.db import (
+    get_category_collection,
+    get_contributor_collection,
+    get_offers_collection,
+    get_product_request_collection,
+    get_products_collection,
+    get_profiles_collection,
+    get_tag_collection,
+    get_vendor_collection,
+    init_mongo,
+    insert_revisions,
+    transaction_context_manager,
+)
+from catalog.logging import setup_logging
+from catalog.settings import SENTRY_DSN
+
+logger = logging.getLogger(__name__)
+
+COLLECTION_FUNCS = {
+    "category": get_category_collection,
+    "profiles": get_profiles_collection,
+    "products": get_products_collection,
+    "offers": get_offers_collection,
+    "vendors": get_vendor_collection,
+    "contributors": get_contributor_collection,
+    "requests": get_product_request_collection,
+    "tag": get_tag_collection,
+}
+
+
+async def migrate_collection_revisions(collection_name):
+    logger.info(f"Start {collection_name} collection migration")
+    counter = 0
+    db_collection = COLLECTION_FUNCS[collection_name]()
+    cursor = db_collection.find({"revisions": {"$exists": True}}, projection={"_id": True}, no_cursor_timeout=True)
+    async for doc in cursor:
+        async with transaction_context_manager() as session:
+            # revisions are claimed atomically, so a concurrent update_object can't move them twice
+            obj = await db_collection.find_one_and_update(
+                {"_id": doc["_id"], "revisions": {"$exists": True}},
+                {"$unset": {"revisions": ""}},
+                projection={"revisions": True},
+                session=session,
+            )
+            if obj:
+                await insert_revisions(db_collection, obj["_id"], obj["revisions"])
+                counter += 1
+
+        if counter and counter % 500 == 0:
+            logger.info(f"Processed {counter} records of migrated {collection_name}")
+
+    logger.info(f"Finished. Processed {counter} objects in {collection_name} collection")
+
+
+async def migrate():
+    for collection_name in COLLECTION_FUNCS:
+        await migrate_collection_revisions(collection_name)
+    logger.info("Successfully migrated")
+
+
+def main():
+    setup_logging()
+    if SENTRY_DSN:
+        sentry_sdk.init(dsn=SENTRY_DSN)
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(init_mongo())
+    loop.run_until_complete(migrate())
+
+
+if __name__ == "__main__":
+    """
+    PYTHONPATH=/app python catalog/migrations/move_revisions_to_collection.py
+    """
+    main()
@@ -0,0 +1,15 @@
+from typing import Any, List, Optional
+
+from catalog.models.api import ListResponse
+from catalog.models.base import BaseModel
+
+
+class Revision(BaseModel):
+    author: Optional[str] = None
+    changes: List[Any]
+    rev: Optional[str] = None  # the revision is applied to
+    newRev: Optional[str] = None  # the revision produced, unknown for the revisions moved from documents
+    date: str
+
+
+RevisionList = ListResponse[Revision]
@@ -0,0 +1,70 @@
+"""
+Requests to the openprocurement api.
+
+Agreements are only checked for their status and classification,
+so these are cached for AGREEMENT_CACHE_TTL seconds
+"""
+
+import asyncio
+
+import aiohttp
+
+from catalog.cache import DocumentCache
+from catalog.http_client import CircuitBreaker, get_http_client
+from catalog.settings import (
+    AGREEMENT_CACHE_SIZE,
+    AGREEMENT_CACHE_TTL,
+    CIRCUIT_BREAKER_FAILURES,
+    CIRCUIT_BREAKER_RESET_TIMEOUT,
+    OPENPROCUREMENT_API_URL,
+)
+
+
+class AgreementNotFound(Exception):
+    pass
+
+
+class OpenprocurementError(Exception):
+    pass
+
+
+agreement_cache = DocumentCache("agreements", AGREEMENT_CACHE_SIZE, AGREEMENT_CACHE_TTL)
+openprocurement_breaker = CircuitBreaker("openprocurement", CIRCUIT_BREAKER_FAILURES, CIRCUIT_BREAKER_RESET_TIMEOUT)
+
+
+async def get_agreement(agreement_id):
+    """
+    :return: dict with `id`, `status` and `classification` of the agreement
+    :raises AgreementNotFound:
+    :raises OpenprocurementError: on any other unexpected response
+    :raises CircuitOpenError: if the api has been failing recently, it isn't requested
+    """
+    agreement = agreement_cache.get(agreement_id)
+    if agreement is not None:
+        return agreement
+
+    async with openprocurement_breaker:
+        try:
+            async with get_http_client().get(f"{OPENPROCUREMENT_API_URL}/agreements/{agreement_id}") as resp:
+                if resp.status >= 500 or resp.status == 429:
+                    openprocurement_breaker.on_failure()
+                    raise OpenprocurementError(f"agreement response status {resp.status}")
+                openprocurement_breaker.on_success()  # the api is alive, whatever it responded
+                if resp.status == 404:
+                    raise AgreementNotFound(agreement_id)
+                if resp.status != 200:
+                    raise OpenprocurementError(f"agreement response status {resp.status}")
+                data = (await resp.json())["data"]
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            openprocurement_breaker.on_failure()
+            raise OpenprocurementError(f"Can't get agreement: {e!r}") from e
+        except (ValueError, KeyError) as e:
+            raise OpenprocurementError(f"Unexpected agreement response: {e!r}") from e
+
+    agreement = {
+        "id": agreement_id,
+        "status": data.get("status", ""),
+        "classification": data.get("classification") or {},
+    }
+    agreement_cache.set(agreement)
+    return agreement
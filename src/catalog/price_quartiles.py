@@ -0,0 +1,203 @@
+"""
+Quartiles of the bid amounts of a product in a sliding window of days, see catalog.prices.
+
+The bids are sorted by day and the window is moved by two pointers: the bids of the next day
+are added to a sorted multiset of amounts and the ones that left the window are removed from it,
+so a day costs O(log n) per added or removed bid instead of filtering and sorting all the bids again.
+Full recalculations of years of bids can use the vectorized numpy engine, if numpy is installed
+"""
+
+import logging
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Any, Callable, Iterable, Iterator, NamedTuple, Sequence
+
+from sortedcontainers import SortedList
+
+from catalog.settings import PRICE_RECALCULATION_ENGINE
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+logger = logging.getLogger(__name__)
+
+NUMPY_CHUNK_CELLS = 1 << 20  # windows x their max size sorted at once by the numpy engine
+
+
+class WindowQuartiles(NamedTuple):
+    day: date
+    date: datetime  # of the latest bid of the day
+    bid: dict[str, Any]  # the earliest bid of the window, its currency and unit are used for the price
+    sample_size: int
+    lower: Decimal
+    median: Decimal
+    upper: Decimal
+
+
+def get_quartiles(amounts: Sequence[Decimal]) -> tuple[Decimal, Decimal, Decimal]:
+    """
+    Same as statistics.quantiles(amounts, n=4) (exclusive method) for 3 and more amounts
+    :param amounts: sorted, indexing only is used so a SortedList isn't copied
+    """
+    n = len(amounts)
+    if n <= 1:
+        return amounts[0], amounts[0], amounts[0]
+    if n == 2:
+        return amounts[0], amounts[0], amounts[1]
+
+    result = []
+    m = n + 1
+    for i in range(1, 4):
+        j = min(max(i * m // 4, 1), n - 1)
+        delta = i * m - j * 4
+        result.append((amounts[j - 1] * (4 - delta) + amounts[j] * delta) / 4)
+    return result[0], result[1], result[2]
+
+
+class WindowAmounts(Sequence):
+    """
+    Amounts of the (amount, position) items of a window
+    """
+
+    __slots__ = ("items",)
+
+    def __init__(self, items: SortedList):
+        self.items = items
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        return self.items[index][0]
+
+
+def iter_window_quartiles(
+    parsed_bids: Iterable[tuple[datetime, dict[str, Any]]],
+    days: Iterable[date],
+    days_back: int,
+) -> Iterator[WindowQuartiles]:
+    """
+    :param parsed_bids: (date, bid), ordered by date as they are read from the db
+    :param days: ascending days of the bids to calculate the windows ending with
+    :param days_back: window size in days, including the last one
+    """
+    bids = sorted(parsed_bids, key=lambda parsed_bid: parsed_bid[0].date())  # stable, keeps the db order of a day
+    bid_days = [bid_date.date() for bid_date, _ in bids]
+    # equal amounts are kept in the bids order, as sorted() does, so the window is the same sequence
+    amounts = [(Decimal(bid["amount"]), position) for position, (_, bid) in enumerate(bids)]
+    window = SortedList()
+    left = right = 0
+
+    for day in days:
+        start_day = day - timedelta(days=days_back - 1)
+        while left < len(bids) and bid_days[left] < start_day:
+            if left < right:
+                window.remove(amounts[left])
+            left += 1
+        right = max(left, right)
+        day_start = right
+        while right < len(bids) and bid_days[right] <= day:
+            window.add(amounts[right])
+            right += 1
+        if not window:
+            continue
+
+        lower, median, upper = get_quartiles(WindowAmounts(window))
+        yield WindowQuartiles(
+            day=day,
+            date=max(bid_date for bid_date, _ in bids[day_start:right] if bid_date.date() == day),
+            bid=bids[left][1],
+            sample_size=len(window),
+            lower=lower,
+            median=median,
+            upper=upper,
+        )
+
+
+def iter_window_quartiles_numpy(
+    parsed_bids: Iterable[tuple[datetime, dict[str, Any]]],
+    days: Iterable[date],
+    days_back: int,
+) -> Iterator[WindowQuartiles]:
+    """
+    Vectorized iter_window_quartiles, the same results.
+    The windows of all the days are found at once as index ranges of the bids sorted by day,
+    the amounts are replaced by their ranks (equal amounts ranked in the bids order)
+    and the ranks are sorted by the rows of a matrix of the windows padded to the largest one.
+    Only the amounts at the quartile positions are interpolated, as Decimals
+    """
+    bids = sorted(parsed_bids, key=lambda parsed_bid: parsed_bid[0].date())
+    day_numbers = numpy.fromiter((day.toordinal() for day in days), dtype=numpy.int64)
+    if not bids or not len(day_numbers):
+        return
+    bid_days = numpy.fromiter((bid_date.toordinal() for bid_date, _ in bids), dtype=numpy.int64, count=len(bids))
+    amounts = [Decimal(bid["amount"]) for _, bid in bids]
+    order = numpy.array(sorted(range(len(amounts)), key=amounts.__getitem__), dtype=numpy.int64)  # rank: position
+    ranks = numpy.empty_like(order)
+    ranks[order] = numpy.arange(len(order))
+
+    lows = numpy.searchsorted(bid_days, day_numbers - (days_back - 1), side="left")
+    highs = numpy.searchsorted(bid_days, day_numbers, side="right")
+    day_starts = numpy.searchsorted(bid_days, day_numbers, side="left")
+    sizes = highs - lows
+    chunk_size = max(1, NUMPY_CHUNK_CELLS // max(int(sizes.max()), 1))
+
+    for chunk_start in range(0, len(day_numbers), chunk_size):
+        chunk = slice(chunk_start, chunk_start + chunk_size)
+        chunk_lows, chunk_sizes = lows[chunk], sizes[chunk]
+        columns = numpy.arange(max(int(chunk_sizes.max()), 1))
+        cells = numpy.minimum(chunk_lows[:, None] + columns, len(bids) - 1)
+        window_ranks = numpy.where(columns < chunk_sizes[:, None], ranks[cells], len(bids))
+        window_ranks.sort(axis=1)
+        positions = order[numpy.minimum(window_ranks, len(bids) - 1)]  # of the window amounts in ascending order
+
+        # exclusive method positions, see get_quartiles
+        quartile_positions = []
+        m = chunk_sizes + 1
+        for i in range(1, 4):
+            j = numpy.clip(i * m // 4, 1, numpy.maximum(chunk_sizes - 1, 1))
+            delta = i * m - j * 4
+            lower_positions = numpy.take_along_axis(positions, (j - 1)[:, None], axis=1)[:, 0]
+            upper_positions = numpy.take_along_axis(positions, numpy.minimum(j, columns[-1])[:, None], axis=1)[:, 0]
+            quartile_positions.append(zip(lower_positions.tolist(), upper_positions.tolist(), delta.tolist()))
+
+        rows = zip(
+            range(chunk_start, chunk_start + len(chunk_sizes)),
+            chunk_lows.tolist(),
+            chunk_sizes.tolist(),
+            positions[:, :2].tolist(),
+            *quartile_positions,
+        )
+        for day_index, low, size, first_positions, *quartiles in rows:
+            if not size:
+                continue
+            if size < 3:
+                lower, median, upper = get_quartiles([amounts[position] for position in first_positions[:size]])
+            else:
+                lower, median, upper = (
+                    (amounts[lower_position] * (4 - delta) + amounts[upper_position] * delta) / 4
+                    for lower_position, upper_position, delta in quartiles
+                )
+            high = low + size
+            yield WindowQuartiles(
+                day=date.fromordinal(int(day_numbers[day_index])),
+                date=max(bid_date for bid_date, _ in bids[day_starts[day_index] : high]),
+                bid=bids[low][1],
+                sample_size=size,
+                lower=lower,
+                median=median,
+                upper=upper,
+            )
+
+
+WINDOW_QUARTILES_ENGINES: dict[str, Callable[..., Iterator[WindowQuartiles]]] = {
+    "python": iter_window_quartiles,
+}
+if numpy is not None:
+    WINDOW_QUARTILES_ENGINES["numpy"] = iter_window_quartiles_numpy
+
+if PRICE_RECALCULATION_ENGINE not in WINDOW_QUARTILES_ENGINES:
+    logger.warning(f"Price recalculation engine {PRICE_RECALCULATION_ENGINE} is unavailable, python is used")
+recalculation_engine = WINDOW_QUARTILES_ENGINES.get(PRICE_RECALCULATION_ENGINE, iter_window_quartiles)
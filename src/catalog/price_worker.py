@@ -0,0 +1,74 @@
+"""
+Prices of the products that got new bids, recalculated within minutes.
+
+catalog.crawler queues the products of the bids it inserts to the `dirty_products` collection,
+a product is queued once however many bids it gets. The worker drains the queue in batches,
+so the nightly cron/calculate_price.py only calculates the products that have been missed.
+Same as there, the days up to today are calculated, today's prices are left to the nightly run
+"""
+
+import asyncio
+import logging
+
+import sentry_sdk
+
+from catalog import db
+from catalog.db import init_mongo
+from catalog.logging import setup_logging
+from catalog.prices import calculate_prices_for_products
+from catalog.settings import PRICE_WORKER_BATCH_SIZE, PRICE_WORKER_INTERVAL, SENTRY_DSN
+
+logger = logging.getLogger(__name__)
+
+
+async def process_dirty_products(batch_size: int = PRICE_WORKER_BATCH_SIZE) -> int:
+    """
+    Calculates the prices of a batch of the queued products
+    :return: number of the products taken from the queue
+    """
+    products = await db.read_dirty_products(batch_size)
+    if not products:
+        return 0
+    product_ids = [product["_id"] for product in products]
+    failed_product_ids: list[str] = []
+    try:
+        written_ids = await calculate_prices_for_products(product_ids, failed_product_ids=failed_product_ids)
+    except Exception:
+        logger.exception(f"Error while calculating prices for products {product_ids[0]}..{product_ids[-1]}")
+        # to the end of the queue, so they don't hold the other products back
+        await db.mark_products_dirty(product_ids)
+        return 0
+    # the products queued again during the calculation stay in the queue
+    await db.delete_dirty_products(products)
+    if failed_product_ids:
+        await db.mark_products_dirty(failed_product_ids)
+    logger.info(
+        f"Calculated prices for {len(product_ids)} products, written {len(written_ids)} rows, "
+        f"{len(failed_product_ids)} failed"
+    )
+    return len(product_ids)
+
+
+async def run_task(batch_size: int = PRICE_WORKER_BATCH_SIZE, interval: int = PRICE_WORKER_INTERVAL) -> None:
+    logger.info("Starting price worker")
+    while True:
+        try:
+            processed = await process_dirty_products(batch_size)
+        except Exception:
+            logger.exception("Error while reading the price calculation queue")
+            processed = 0
+        if processed < batch_size:
+            await asyncio.sleep(interval)
+
+
+def main():
+    setup_logging()
+    if SENTRY_DSN:
+        sentry_sdk.init(dsn=SENTRY_DSN)
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(init_mongo())
+    loop.run_until_complete(run_task())
+
+
+if __name__ == "__main__":
+    main()
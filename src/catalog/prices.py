@@ -1,10 +1,10 @@
 import asyncio
 import logging
-import statistics
-from datetime import datetime, timedelta
-from decimal import Decimal
-from typing import List
-from uuid import uuid4
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Callable, Iterator, List
 
 import sentry_sdk
 from aiohttp import web
@@ -13,11 +13,16 @@ from catalog import db
 from catalog.db import init_mongo
 from catalog.logging import setup_logging
 from catalog.models.price import PriceCreateData
-from catalog.settings import SENTRY_DSN
-from catalog.utils import get_now
+from catalog.price_quartiles import WindowQuartiles, iter_window_quartiles, recalculation_engine
+from catalog.settings import PRICE_CALCULATION_BATCH_SIZE, PRICE_CALCULATION_WORKERS, SENTRY_DSN
+from catalog.utils import create_md5_hash, get_now
 
 logger = logging.getLogger(__name__)
 
+TASK_NAME = "calculate_price"
+
+QuartilesEngine = Callable[[list, list, int], Iterator[WindowQuartiles]]
+
 
 async def calculate_price_for_product(product_id: str, days_back: int = 7) -> List[str]:
     try:
@@ -57,6 +62,136 @@ async def calculate_price_for_product(product_id: str, days_back: int = 7) -> Li
     if not product_bids:
         return []
 
+    prices = get_product_prices(product_id, product_bids, last_calculated_date, days_back)
+    if not prices:
+        return []
+
+    written_ids = await db.write_prices(prices)
+    logger.info(f"Calculated prices for product {product_id}, written {len(written_ids)} of {len(prices)} rows")
+    return written_ids
+
+
+async def calculate_prices_for_products(
+    product_ids: list[str],
+    days_back: int = 7,
+    engine: QuartilesEngine = iter_window_quartiles,
+    full: bool = False,
+    failed_product_ids: list[str] | None = None,
+    end_date: str | None = None,
+) -> List[str]:
+    """
+    calculate_price_for_product for a batch of products with a few queries:
+    their categories, units and last prices are read at once, their bids are streamed by a single query
+    and the prices are written by unordered bulk writes
+    :param full: calculate all the days, not only the ones after the last prices,
+                 and delete the prices of the products that aren't calculated any more
+    :param failed_product_ids: collects the products whose prices failed to calculate,
+                               the rest of the batch is calculated anyway
+    :param end_date: the days from it on aren't calculated, today by default as it isn't finished yet
+    """
+    if failed_product_ids is None:
+        failed_product_ids = []
+    if end_date is None:
+        end_date = get_end_date()
+    product_categories = await db.find_products_categories(product_ids)
+    category_units = await db.find_categories_units({c for c in product_categories.values() if c})
+    last_dates = {} if full else await db.find_last_prices_dates(product_ids)
+
+    last_calculated_dates = {}
+    bid_queries = defaultdict(list)  # (unit code, start date): product ids
+    for product_id in product_ids:
+        category_id = product_categories.get(product_id)
+        if product_id not in product_categories:
+            logger.info(f"Product {product_id} not found")
+        elif not category_id:
+            logger.info(f"Product {product_id} has no relatedCategory")
+        elif category_id not in category_units:
+            logger.info(f"Category {category_id} for product {product_id} not found")
+        elif not category_units[category_id]:
+            logger.info(f"Category {category_id} for product {product_id} has no unit code")
+        else:
+            last_calculated_date = start_date = None
+            if product_id in last_dates:
+                last_calculated_date = datetime.fromisoformat(last_dates[product_id]).date()
+                start_date = datetime.combine(
+                    last_calculated_date - timedelta(days=days_back), datetime.min.time()
+                ).isoformat()
+            last_calculated_dates[product_id] = last_calculated_date
+            bid_queries[(category_units[category_id], start_date)].append(product_id)
+
+    written_ids = []
+    prices = []
+    prices_product_ids = []  # whose prices are all in `prices`
+    written_product_ids = set()
+    product_id, product_bids = None, []
+
+    async def write_prices(recalculated_ids: list[str] | None = None) -> None:
+        nonlocal prices, prices_product_ids
+        written_ids.extend(await db.write_prices(prices, product_ids=recalculated_ids))
+        written_product_ids.update(prices_product_ids)
+        prices, prices_product_ids = [], []
+
+    async def add_prices() -> None:
+        last_calculated_date = last_calculated_dates[product_id]
+        try:
+            prices.extend(get_product_prices(product_id, product_bids, last_calculated_date, days_back, engine))
+        except Exception:
+            logger.exception(f"Error while calculating prices for product {product_id}")
+            failed_product_ids.append(product_id)
+            return
+        prices_product_ids.append(product_id)
+        if len(prices) >= PRICE_CALCULATION_BATCH_SIZE:
+            await write_prices(prices_product_ids if full else None)
+
+    if bid_queries:
+        cursor = await db.find_product_bids_by_products(
+            bid_queries, end_date=end_date, batch_size=PRICE_CALCULATION_BATCH_SIZE
+        )
+        async for bid in cursor:
+            if bid["productId"] != product_id:
+                if product_bids:
+                    await add_prices()
+                product_id, product_bids = bid["productId"], []
+            product_bids.append(bid)
+        if product_bids:
+            await add_prices()
+    if full:
+        # the rest of the products have no prices now, the failed ones keep theirs
+        await write_prices(
+            [
+                product_id
+                for product_id in product_ids
+                if product_id not in written_product_ids and product_id not in failed_product_ids
+            ]
+        )
+    elif prices:
+        await write_prices()
+    return written_ids
+
+
+def get_end_date() -> str:
+    return datetime.combine(get_now().date(), datetime.min.time()).isoformat()
+
+
+def get_price_id(product_id: str, day: date, unit_code: str) -> str:
+    """
+    Recalculated prices of a day keep their ids
+    """
+    return create_md5_hash(f"{product_id}/{day.isoformat()}/{unit_code}")
+
+
+def get_product_prices(
+    product_id: str,
+    product_bids: list[dict],
+    last_calculated_date: date | None,
+    days_back: int,
+    engine: QuartilesEngine = iter_window_quartiles,
+) -> list[dict]:
+    """
+    :param product_bids: ordered by date
+    :return: prices of the days of the bids since the last calculated one,
+             which is calculated again as it may have got more bids since
+    """
     parsed_bids = []
     for bid in product_bids:
         bid_date = datetime.fromisoformat(bid["date"])
@@ -65,53 +200,26 @@ async def calculate_price_for_product(product_id: str, days_back: int = 7) -> Li
     unique_days = sorted(list(set(bd.date() for bd, _ in parsed_bids)))
 
     if last_calculated_date:
-        unique_days = [day for day in unique_days if day > last_calculated_date]
+        unique_days = [day for day in unique_days if day >= last_calculated_date]
 
     if not unique_days:
         return []
 
-    inserted_ids = []
-
-    for current_day in unique_days:
-        start_day = current_day - timedelta(days=days_back - 1)
-
-        window_bids = [bid for bd, bid in parsed_bids if start_day <= bd.date() <= current_day]
-
-        if not window_bids:
-            continue
-
-        amounts = sorted([Decimal(bid["amount"]) for bid in window_bids])
-        n = len(amounts)
-
-        if n <= 1:
-            q1 = q2 = q3 = amounts[0]
-        elif n == 2:
-            q1 = amounts[0]
-            q2 = amounts[0]
-            q3 = amounts[1]
-        else:
-            q1, q2, q3 = statistics.quantiles(amounts, n=4)
-
-        unitName = window_bids[0].get("unitName")
-        unitCode = window_bids[0].get("unitCode")
-        currency = window_bids[0].get("currency")
-        value_added_tax_included = window_bids[0].get("valueAddedTaxIncluded")
-
-        current_day_dates = [bd for bd, _ in parsed_bids if bd.date() == current_day]
-        max_date_in_day = max(current_day_dates)
+    prices = []
 
+    for window in engine(parsed_bids, unique_days, days_back):
         price_data = PriceCreateData(
-            id=uuid4().hex,
+            id=get_price_id(product_id, window.day, window.bid["unitCode"]),
             productId=product_id,
-            currency=currency,
-            valueAddedTaxIncluded=value_added_tax_included,
-            unitCode=unitCode,
-            unitName=unitName,
-            date=max_date_in_day.isoformat(),
-            sampleSize=n,
-            lowerQuartile=q1,
-            medianQuartile=q2,
-            upperQuartile=q3,
+            currency=window.bid.get("currency"),
+            valueAddedTaxIncluded=window.bid.get("valueAddedTaxIncluded"),
+            unitCode=window.bid.get("unitCode"),
+            unitName=window.bid.get("unitName"),
+            date=window.date.isoformat(),
+            sampleSize=window.sample_size,
+            lowerQuartile=window.lower,
+            medianQuartile=window.median,
+            upperQuartile=window.upper,
             dateCreated=get_now().isoformat(),
             dateModified=get_now().isoformat(),
         )
@@ -120,44 +228,111 @@ async def calculate_price_for_product(product_id: str, days_back: int = 7) -> Li
         data["date"] = data["date"].isoformat()
         data["dateCreated"] = data["dateCreated"].isoformat()
         data["dateModified"] = data["dateModified"].isoformat()
-        inserted_id = await db.insert_price(data)
-        inserted_ids.append(inserted_id)
+        prices.append(data)
 
-    logger.info(f"Calculated and inserted prices for product {product_id} in {len(inserted_ids)} rows")
-    return inserted_ids
+    return prices
 
 
-async def calculate_price(batch_size: int = 100) -> None:
-    last_price = await db.find_last_calculated_price()
-    last_calculated_date = None
+@dataclass
+class PriceCounters:
+    products: int = 0
+    bids: int = 0  # in the date range of the calculation
+    prices: int = 0
+    failed_products: int = 0
+    started: float = field(default_factory=time.monotonic, repr=False)
 
-    if last_price and "date" in last_price:
-        last_calculated_date = last_price["date"]
-
-    skip = 0
-    while True:
-        end_date = datetime.combine(get_now().date(), datetime.min.time()).isoformat()
-        product_bids = await db.find_product_bids_group_products(
-            limit=batch_size, skip=skip, start_date=last_calculated_date, end_date=end_date
+    def throughput(self) -> str:
+        seconds = max(time.monotonic() - self.started, 1e-6)
+        return (
+            f"{self.products} products ({self.products / seconds:.1f}/s), "
+            f"{self.bids} bids ({self.bids / seconds:.1f}/s), {self.prices} prices in {seconds:.1f}s"
         )
-        count = 0
-        async for product_bid in product_bids:
+
+
+async def calculate_price(
+    batch_size: int = PRICE_CALCULATION_BATCH_SIZE,
+    workers: int = PRICE_CALCULATION_WORKERS,
+    engine: QuartilesEngine = iter_window_quartiles,
+    full: bool = False,
+) -> PriceCounters:
+    """
+    Products of the bids since the last run are streamed by a single aggregation
+    to a pool of workers calculating them in batches.
+    The watermark is the end date of the last run, the bids dated or crawled since then are selected,
+    so the products that catalog.price_worker has missed are calculated too
+    :param batch_size: products per batch (see calculate_prices_for_products) and per throughput log
+    :param workers: batches calculated at once
+    :param engine: of the window quartiles, see catalog.price_quartiles
+    :param full: all the products and days
+    """
+    start_date = watermark = None
+    if not full:
+        watermark = (await db.read_task_state(TASK_NAME)).get("watermark")
+        if watermark:
+            start_date = watermark
+        elif last_price := await db.find_last_calculated_price():
+            start_date = last_price.get("date")
+
+    end_date = get_end_date()
+    counters = PriceCounters()
+    queue: asyncio.Queue[list[dict] | None] = asyncio.Queue(workers)
+
+    async def worker() -> None:
+        while (product_bids := await queue.get()) is not None:
+            product_ids = [product_bid["_id"] for product_bid in product_bids]
+            failed_product_ids: list[str] = []
             try:
-                await calculate_price_for_product(product_bid["_id"])
-            except Exception as e:
-                logger.info(f"Error while calculating price for product {product_bid['_id']}: {e}")
-            count += 1
-
-        if count < batch_size:
-            break
-        skip += batch_size
-    return None
+                counters.prices += len(
+                    await calculate_prices_for_products(
+                        product_ids,
+                        engine=engine,
+                        full=full,
+                        failed_product_ids=failed_product_ids,
+                        end_date=end_date,
+                    )
+                )
+                counters.failed_products += len(failed_product_ids)
+            except Exception:
+                counters.failed_products += len(product_ids)
+                logger.exception(f"Error while calculating prices for products {product_ids[0]}..{product_ids[-1]}")
+            counters.products += len(product_ids)
+            counters.bids += sum(product_bid.get("bids", 0) for product_bid in product_bids)
+            logger.info(f"Calculated {counters.throughput()}")
+
+    async def produce() -> None:
+        cursor = await db.find_product_bids_group_products(
+            start_date=start_date, end_date=end_date, batch_size=batch_size, modified_since=watermark
+        )
+        product_bids = []
+        async for product_bid in cursor:
+            product_bids.append(product_bid)
+            if len(product_bids) >= batch_size:
+                await queue.put(product_bids)
+                product_bids = []
+        if product_bids:
+            await queue.put(product_bids)
+        for _ in range(workers):
+            await queue.put(None)
+
+    async with asyncio.TaskGroup() as group:
+        group.create_task(produce())
+        for _ in range(workers):
+            group.create_task(worker())
+    if counters.failed_products:
+        # the bids of the failed products are selected again the next run
+        logger.warning(f"Price calculation watermark is not moved to {end_date} as some products failed")
+    else:
+        await db.save_task_state(TASK_NAME, watermark=end_date)
+
+    logger.info(f"Finished price calculation: {counters.throughput()}, {counters.failed_products} failed")
+    return counters
 
 
 async def full_recalculation() -> None:
-    logger.info("Clearing prices collection")
-    await db.clear_prices_collection()
-    await calculate_price()
+    """
+    Prices are recalculated in place, only the changed ones are written
+    """
+    await calculate_price(engine=recalculation_engine, full=True)
     return None
 
 
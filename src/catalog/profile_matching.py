@@ -0,0 +1,228 @@
+"""
+Matching of products to the active profiles of their category, see `relatedProfiles`.
+
+Every profile is compiled once into predicates of its requirement responses.
+An inverted index of the requirement titles picks the candidate profiles of a product:
+the ones whose required titles are all responded and whose criteria are met,
+candidates only depend on the responded titles, so they're found once per distinct set of titles
+"""
+
+from collections import OrderedDict, defaultdict
+from typing import Any, Callable, Iterable
+
+from catalog.requirements import RequirementIndex, get_requirement_index
+from catalog.settings import LOCALIZATION_CRITERIA
+
+VALUE_CHECK_FIELDS = ("expectedValue", "minValue", "maxValue", "pattern")
+MATCHERS_CACHE_SIZE = 16
+
+
+def get_value(rr: dict[str, Any], is_list: bool = False) -> Any:
+    if "value" in rr:
+        return [rr["value"]] if is_list else rr["value"]
+    elif "values" in rr:
+        return rr["values"] if is_list else rr["values"][0]
+
+    return None
+
+
+def compile_value_check(index: RequirementIndex, title: str) -> Callable[[dict], bool]:
+    requirement = index.requirements[title]
+    data_type = index.data_types[title]
+    has_expected_value = "expectedValue" in requirement
+    expected_value = requirement.get("expectedValue")
+    has_min_value = "minValue" in requirement
+    has_max_value = "maxValue" in requirement
+    min_value, max_value = index.bounds.get(title, (None, None))
+    match_pattern = index.patterns.get(title)
+
+    def check(rr):
+        value = get_value(rr)
+        if value is None or not data_type or not isinstance(value, data_type):
+            return False
+        try:
+            if has_expected_value and value != expected_value:
+                return False
+            # a bound that isn't a number fails the check
+            if has_min_value and (min_value is None or float(value) < min_value):
+                return False
+            if has_max_value and (max_value is None or float(value) > max_value):
+                return False
+            if match_pattern is not None and not match_pattern(str(value)):
+                return False
+        except (ValueError, TypeError):
+            return False
+        return True
+
+    return check
+
+
+def compile_values_check(requirement: dict[str, Any]) -> Callable[[dict], bool]:
+    expected_values = set(requirement["expectedValues"])
+    min_items = requirement.get("expectedMinItems")
+    max_items = requirement.get("expectedMaxItems")
+
+    def check(rr):
+        values = get_value(rr, is_list=True)
+        if not values:
+            return False
+        if min_items is not None and len(expected_values.intersection(values)) < min_items:
+            return False
+        if max_items is not None and len(values) > max_items:
+            return False
+        return True
+
+    return check
+
+
+def compile_data_type_check(data_type: Any) -> Callable[[dict], bool]:
+    def check(rr):
+        return isinstance(get_value(rr), data_type) if data_type else False
+
+    return check
+
+
+def compile_requirement_check(index: RequirementIndex, title: str) -> Callable[[dict], bool]:
+    """
+    :return: predicate of a requirement response to the requirement
+    """
+    requirement = index.requirements[title]
+    if any(field in requirement for field in VALUE_CHECK_FIELDS):
+        return compile_value_check(index, title)
+    if "expectedValues" in requirement:
+        return compile_values_check(requirement)
+    return compile_data_type_check(index.data_types[title])
+
+
+def get_required_titles(index: RequirementIndex) -> frozenset | None:
+    """
+    Titles every product of the profile responds to:
+    all of the criterion groups, but only the common ones of the LOCALIZATION_CRITERIA groups (one is met)
+    :return: None if the criteria can't be met at all
+    """
+    required = set()
+    for classification_id, groups in index.criteria:
+        if classification_id == LOCALIZATION_CRITERIA:
+            if not groups:
+                return None
+            required.update(frozenset.intersection(*groups))
+        else:
+            for group in groups:
+                required.update(group)
+    return frozenset(required)
+
+
+class CompiledProfile:
+    __slots__ = ("id", "index", "checks", "required_titles")
+
+    def __init__(self, profile: dict[str, Any], index: RequirementIndex, required_titles: frozenset):
+        self.id = profile["_id"]
+        self.index = index
+        self.checks = tuple((title, compile_requirement_check(index, title)) for title in index.requirements)
+        self.required_titles = required_titles
+
+    def matches(self, responses: dict[str, list[dict[str, Any]]]) -> bool:
+        """
+        Every response to a requirement of the profile is valid and there's at least one
+        :param responses: requirement responses of the product by requirement title
+        """
+        matched = False
+        for title, check in self.checks:
+            for rr in responses.get(title, ()):
+                if not check(rr):
+                    return False
+                matched = True
+        return matched
+
+
+def group_responses(requirement_responses: list[dict[str, Any]]) -> dict[str, list[dict[str, Any]]]:
+    responses = defaultdict(list)
+    for rr in requirement_responses:
+        responses[rr["requirement"]].append(rr)
+    return responses
+
+
+class ProfileMatcher:
+    """
+    Profiles of a category compiled for matching its products.
+    The inverted index maps a title to the bit mask of the profiles that require it,
+    so a product's candidates are the profiles not masked by any of the titles it doesn't respond to
+    """
+
+    def __init__(self, profiles: Iterable[dict[str, Any]]):
+        self.profiles: list[CompiledProfile] = []
+        self.by_title: dict[str, int] = defaultdict(int)  # title: bit mask of positions of the profiles
+        self._candidates: dict[frozenset, list[CompiledProfile]] = {}
+
+        for profile in profiles:
+            index = get_requirement_index(profile)
+            # there should be requirements in profile
+            if not index:
+                continue
+            required_titles = get_required_titles(index)
+            if required_titles is None:
+                continue
+            bit = 1 << len(self.profiles)
+            self.profiles.append(CompiledProfile(profile, index, required_titles))
+            for title in required_titles:
+                self.by_title[title] |= bit
+
+    def __len__(self):
+        return len(self.profiles)
+
+    def get_candidates(self, titles: frozenset) -> list[CompiledProfile]:
+        """
+        :return: profiles whose criteria are met by the responded titles, in the order they were given
+        """
+        candidates = self._candidates.get(titles)
+        if candidates is None:
+            excluded = 0
+            for title, mask in self.by_title.items():
+                if title not in titles:
+                    excluded |= mask
+            candidates = self._candidates[titles] = [
+                profile
+                for position, profile in enumerate(self.profiles)
+                if not excluded >> position & 1 and profile.index.meets_criteria(titles)
+            ]
+        return candidates
+
+    def match(self, product: dict[str, Any]) -> list[str]:
+        """
+        :return: ids of the related profiles of the product
+        """
+        responses = group_responses(product.get("requirementResponses", []))
+        titles = frozenset(responses)
+        return [profile.id for profile in self.get_candidates(titles) if profile.matches(responses)]
+
+
+_matchers = OrderedDict()  # profiles (_id, _rev): ProfileMatcher, reused by the next batches of a category
+
+
+def get_matcher(profiles: list[dict[str, Any]]) -> ProfileMatcher:
+    key = tuple((profile["_id"], profile.get("_rev")) for profile in profiles)
+    matcher = _matchers.get(key)
+    if matcher is None:
+        matcher = ProfileMatcher(profiles)
+        if all(rev for _, rev in key):
+            _matchers[key] = matcher
+            while len(_matchers) > MATCHERS_CACHE_SIZE:
+                _matchers.popitem(last=False)
+    else:
+        _matchers.move_to_end(key)
+    return matcher
+
+
+def match_products(profiles: list[dict[str, Any]], products: list[dict[str, Any]]) -> list[tuple[str, list[str]]]:
+    """
+    A batch of products of a category, runs in the process pool of related_profiles_task
+    :return: (_id, relatedProfiles) of the products whose relatedProfiles have changed
+    """
+    matcher = get_matcher(profiles)
+    changes = []
+    for product in products:
+        related_profiles = matcher.match(product)
+        # profiles are added one by one on their writes, so the order may differ
+        if set(product.get("relatedProfiles", [])) != set(related_profiles):
+            changes.append((product["_id"], related_profiles))
+    return changes
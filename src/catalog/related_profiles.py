@@ -0,0 +1,144 @@
+"""
+Incremental maintenance of `relatedProfiles` of products.
+
+A written product is matched to the active profiles of its category,
+a written profile is matched to the products of its category that can meet its criteria
+(and the products that are related to it already), up to RELATED_PROFILES_REQUEST_LIMIT of them.
+cron/related_profiles_task.py sweeps whatever has been changed by other means since its last run,
+so it finishes the profiles with more products too
+"""
+
+import logging
+from typing import Any
+
+from pymongo import UpdateOne
+
+from catalog.db import get_products_collection, get_profiles_collection
+from catalog.models.product import ProductStatus
+from catalog.models.profile import ProfileStatus
+from catalog.profile_matching import ProfileMatcher, get_matcher
+from catalog.settings import RELATED_PROFILES_BATCH_SIZE, RELATED_PROFILES_REQUEST_LIMIT
+from catalog.utils import get_next_rev, get_now
+
+logger = logging.getLogger(__name__)
+
+PROFILE_PROJECTION = {"criteria": 1, "_rev": 1}  # requirement indexes are cached by (_id, _rev)
+# updated products get the next `_rev`, their ETags are built from it
+PRODUCT_PROJECTION = {"requirementResponses": True, "relatedProfiles": True, "relatedCategory": True, "_rev": True}
+
+
+def get_profiles_filters(category_id: str) -> dict[str, Any]:
+    return {
+        "relatedCategory": category_id,
+        "status": ProfileStatus.active,
+        "criteria.requirementGroups.requirements": {"$exists": True},
+    }
+
+
+def get_products_filters(category_id: str) -> dict[str, Any]:
+    return {"relatedCategory": category_id, "requirementResponses": {"$exists": True}, "status": ProductStatus.active}
+
+
+async def read_category_profiles(category_id: str) -> list[dict[str, Any]]:
+    return (
+        await get_profiles_collection()
+        .find(get_profiles_filters(category_id), projection=PROFILE_PROJECTION, no_cursor_timeout=True)
+        .to_list(None)
+    )
+
+
+def get_product_match(product: dict[str, Any]) -> dict[str, Any]:
+    """
+    A product written since it was read is skipped, it's been matched by that write
+    """
+    match = {"_id": product["_id"]}
+    if product.get("_rev") is not None:
+        match["_rev"] = product["_rev"]
+    return match
+
+
+def is_matchable(product: dict[str, Any]) -> bool:
+    return product.get("status", ProductStatus.active) == ProductStatus.active and "requirementResponses" in product
+
+
+def is_matching_changed(before: dict[str, Any], after: dict[str, Any]) -> bool:
+    return before.get("criteria") != after.get("criteria") or before.get("status") != after.get("status")
+
+
+async def set_product_related_profiles(product: dict[str, Any]) -> None:
+    """
+    Updates `relatedProfiles` of a product that is about to be written
+    """
+    if not is_matchable(product):
+        return
+    matcher = get_matcher(await read_category_profiles(product["relatedCategory"]))
+    related_profiles = matcher.match(product)
+    if set(product.get("relatedProfiles", [])) != set(related_profiles):
+        product["relatedProfiles"] = related_profiles
+
+
+async def update_profile_products(profile: dict[str, Any], limit: int | None = None) -> int:
+    """
+    Adds the written profile to `relatedProfiles` of the products that match it and removes it from the others
+    :param profile: either from the db (`_id`) or renamed (`id`)
+    :param limit: of the candidate products read
+    :return: number of the updated products
+    """
+    profile_id = profile.get("_id") or profile["id"]
+    category_id = profile["relatedCategory"]
+    matcher = None
+    if profile.get("status") == ProfileStatus.active:
+        matcher = ProfileMatcher([{**profile, "_id": profile_id}])
+
+    filters = get_products_filters(category_id)
+    if matcher:
+        required_titles = matcher.profiles[0].required_titles
+        candidates = {"requirementResponses.requirement": {"$all": list(required_titles)}} if required_titles else {}
+        filters["$or"] = [{"relatedProfiles": profile_id}, candidates]
+    else:
+        filters["relatedProfiles"] = profile_id
+
+    products_collection = get_products_collection()
+    cursor = products_collection.find(filters, projection=PRODUCT_PROJECTION)
+    cursor.batch_size(RELATED_PROFILES_BATCH_SIZE)
+    if limit:
+        cursor.limit(limit)
+    read = updated = 0
+    bulk = []
+    async for product in cursor:
+        read += 1
+        is_related = profile_id in product.get("relatedProfiles", [])
+        if bool(matcher and matcher.match(product)) == is_related:
+            continue
+        operator = "$pull" if is_related else "$addToSet"
+        bulk.append(
+            UpdateOne(
+                get_product_match(product),
+                {
+                    operator: {"relatedProfiles": profile_id},
+                    "$set": {"dateModified": get_now().isoformat(), "_rev": get_next_rev(product.get("_rev"))},
+                },
+            )
+        )
+        if len(bulk) >= RELATED_PROFILES_BATCH_SIZE:
+            updated += (await products_collection.bulk_write(bulk, ordered=False)).modified_count
+            bulk = []
+    if bulk:
+        updated += (await products_collection.bulk_write(bulk, ordered=False)).modified_count
+    if updated:
+        logger.info(f"Updated relatedProfiles of {updated} products of profile {profile_id}")
+    if limit and read >= limit:
+        logger.info(f"The rest of the products of profile {profile_id} are left to related_profiles_task")
+    return updated
+
+
+async def update_written_profile_products(profile: dict[str, Any]) -> None:
+    """
+    update_profile_products within a profile write request, the profile is saved already,
+    so whatever isn't updated is left to related_profiles_task that sweeps the modified profiles
+    """
+    profile_id = profile.get("_id") or profile["id"]
+    try:
+        await update_profile_products(profile, limit=RELATED_PROFILES_REQUEST_LIMIT)
+    except Exception:
+        logger.exception(f"Error while updating relatedProfiles of the products of profile {profile_id}")
@@ -0,0 +1,155 @@
+import re
+from collections import OrderedDict
+from copy import deepcopy
+from functools import partial
+
+from catalog.metrics import inc
+from catalog.models.criteria import TYPEMAP
+from catalog.settings import LOCALIZATION_CRITERIA, REQUIREMENT_INDEX_CACHE_SIZE
+
+
+def compile_pattern(pattern):
+    try:
+        return re.compile(pattern).match
+    except re.error:
+        # an invalid pattern fails on use, as it did before it was compiled
+        return partial(re.match, pattern)
+
+
+def get_float(value):
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+
+class RequirementIndex:
+    """
+    Requirements of the criteria of a category (or a profile) by title, built once per document rev:
+        requirements - requirement dicts
+        classifications - classification of the requirement's criterion
+        groups - id of the requirement's group
+        data_types - python types of `dataType`
+        patterns - compiled `pattern` match functions
+        bounds - (minValue, maxValue) as floats, None if there is no (valid) bound
+        classification_ids - ids of the criteria classifications that have requirements
+        criteria - (classification id, title sets of the groups) of every criterion
+    """
+
+    __slots__ = (
+        "requirements",
+        "classifications",
+        "groups",
+        "data_types",
+        "patterns",
+        "bounds",
+        "classification_ids",
+        "criteria",
+    )
+
+    def __init__(self, criteria):
+        self.requirements = {}
+        self.classifications = {}
+        self.groups = {}
+        self.data_types = {}
+        self.patterns = {}
+        self.bounds = {}
+        self.classification_ids = set()
+        self.criteria = []
+        # the index outlives the document it's built from, so it doesn't share its dicts
+        for criterion in deepcopy(criteria) or "":
+            classification = criterion.get("classification")
+            classification_id = (classification or {}).get("id")
+            group_titles = []
+            for group in criterion.get("requirementGroups") or "":
+                titles = set()
+                for requirement in group.get("requirements") or "":
+                    title = requirement["title"]
+                    titles.add(title)
+                    self.requirements[title] = requirement
+                    self.classifications[title] = classification
+                    self.groups[title] = group.get("id")
+                    self.data_types[title] = TYPEMAP.get(requirement.get("dataType"))
+                    self.classification_ids.add(classification_id)
+                    if "pattern" in requirement:
+                        self.patterns[title] = compile_pattern(requirement["pattern"])
+                    if "minValue" in requirement or "maxValue" in requirement:
+                        self.bounds[title] = (
+                            get_float(requirement.get("minValue")),
+                            get_float(requirement.get("maxValue")),
+                        )
+                group_titles.append(frozenset(titles))
+            self.criteria.append((classification_id, tuple(group_titles)))
+
+    def get(self, title):
+        return self.requirements.get(title)
+
+    def __contains__(self, title):
+        return title in self.requirements
+
+    def __len__(self):
+        return len(self.requirements)
+
+    def meets_criteria(self, titles):
+        """
+        If the responded requirement titles cover a group of every criterion:
+        all the groups of a criterion, but exactly one of the LOCALIZATION_CRITERIA
+        """
+        for classification_id, groups in self.criteria:
+            met = [group.issubset(titles) for group in groups]
+            if classification_id == LOCALIZATION_CRITERIA:
+                if met.count(True) != 1:
+                    return False
+            elif not all(met):
+                return False
+        return True
+
+
+class RequirementIndexCache:
+    """
+    Process-local LRU of the requirement indexes keyed by (id, rev),
+    a changed document gets a new rev, so entries are never invalidated, only evicted
+    """
+
+    def __init__(self, name, max_size):
+        self.name = name
+        self.max_size = max_size
+        self._items = OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, obj):
+        """
+        :param obj: category or profile, either from the db (`_id`, `_rev`) or renamed (`id`, `rev`)
+        """
+        uid = obj.get("id") or obj.get("_id")
+        rev = obj.get("rev") or obj.get("_rev")
+        if not uid or not rev:  # the document isn't stored or its rev wasn't projected
+            return RequirementIndex(obj.get("criteria"))
+
+        key = (uid, rev)
+        index = self._items.get(key)
+        if index is not None:
+            self._items.move_to_end(key)
+            inc("cache_hits", self.name)
+            return index
+
+        inc("cache_misses", self.name)
+        index = RequirementIndex(obj.get("criteria"))
+        if self.max_size > 0:
+            self._items[key] = index
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+                inc("cache_evictions", self.name)
+        return index
+
+    def clear(self):
+        self._items.clear()
+
+
+requirement_indexes = RequirementIndexCache("requirements", REQUIREMENT_INDEX_CACHE_SIZE)
+
+
+def get_requirement_index(obj):
+    return requirement_indexes.get(obj)
@@ -1,11 +1,23 @@
 import json
+import logging
 from datetime import datetime, timezone
 from decimal import Decimal
 from uuid import UUID
 
+import msgpack
+from aiohttp.web import Response
 from aiohttp.web import json_response as base_json_response
 from bson import ObjectId
 
+from catalog.settings import JSON_ENCODER
+
+try:
+    import ujson
+except ImportError:  # pragma: no cover
+    ujson = None
+
+logger = logging.getLogger(__name__)
+
 
 def to_iso_format(obj):
     if obj.tzinfo is None:
@@ -25,10 +37,95 @@ def json_serialize(obj):
     raise TypeError(f"Type {type(obj)} not serializable")
 
 
-def json_dumps(*args, **kwargs):
-    kwargs["default"] = json_serialize
-    return json.dumps(*args, **kwargs)
+def stdlib_dumps(obj):
+    return json.dumps(obj, default=json_serialize)
+
+
+def is_ujson_mismatch(result):
+    """
+    ujson writes 1e-07 as 1e-7 and doesn't escape DEL, such results are encoded again by json.
+    Looking through "e-"/"e+" occurrences is much faster than a regex over the whole result
+    """
+    for sign in ("e-", "e+"):
+        i = result.find(sign)
+        while i != -1:
+            exponent = result[i + 2 : i + 4]
+            if i and result[i - 1].isdigit() and exponent[:1].isdigit() and not exponent[1:].isdigit():
+                return True
+            i = result.find(sign, i + 2)
+    return "\x7f" in result
+
+
+def ujson_dumps(obj):
+    """
+    The same output as `stdlib_dumps` gives
+    """
+    try:
+        result = ujson.dumps(
+            obj,
+            default=json_serialize,
+            ensure_ascii=True,
+            escape_forward_slashes=False,
+            separators=(", ", ": "),
+        )
+    except (OverflowError, TypeError, ValueError):
+        return stdlib_dumps(obj)
+    if is_ujson_mismatch(result):
+        return stdlib_dumps(obj)
+    return result
+
+
+JSON_ENCODERS = {
+    "json": stdlib_dumps,
+}
+if ujson is not None:
+    JSON_ENCODERS["ujson"] = ujson_dumps
+
+if JSON_ENCODER not in JSON_ENCODERS:
+    logger.warning(f"JSON encoder {JSON_ENCODER} is unavailable, json is used")
+default_dumps = JSON_ENCODERS.get(JSON_ENCODER, stdlib_dumps)
+
+
+def json_dumps(obj, **kwargs):
+    if kwargs:  # indent, sort_keys, etc.
+        kwargs["default"] = json_serialize
+        return json.dumps(obj, **kwargs)
+    return default_dumps(obj)
 
 
 def json_response(*args, **kwargs):
     return base_json_response(dumps=json_dumps, *args, **kwargs)
+
+
+MSGPACK_CONTENT_TYPE = "application/msgpack"
+MSGPACK_EXT_DECIMAL = 1
+MSGPACK_EXT_DATETIME = 2
+
+
+def msgpack_default(obj):
+    # unlike json, decimals and datetimes keep their types
+    if isinstance(obj, Decimal):
+        return msgpack.ExtType(MSGPACK_EXT_DECIMAL, str(obj).encode())
+    if isinstance(obj, datetime):
+        return msgpack.ExtType(MSGPACK_EXT_DATETIME, to_iso_format(obj).encode())
+    return json_serialize(obj)
+
+
+def msgpack_ext_hook(code, data):
+    if code == MSGPACK_EXT_DECIMAL:
+        return Decimal(data.decode())
+    if code == MSGPACK_EXT_DATETIME:
+        return datetime.fromisoformat(data.decode())
+    return msgpack.ExtType(code, data)
+
+
+def msgpack_dumps(obj):
+    return msgpack.packb(obj, default=msgpack_default)
+
+
+def msgpack_loads(data):
+    return msgpack.unpackb(data, ext_hook=msgpack_ext_hook)
+
+
+def msgpack_response(data, status=200):
+    return Response(body=msgpack_dumps(data), status=status, content_type=MSGPACK_CONTENT_TYPE)
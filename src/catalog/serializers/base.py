@@ -1,28 +1,49 @@
+from types import FunctionType
+
+
+def compile_serializer(serializer):
+    """
+    Turns an item of `serializers` into a `(obj, value, kwargs) -> value` callable,
+    so the type of the serializer isn't checked for every value
+    """
+    if type(serializer) is FunctionType:
+
+        def serialize_with_function(obj, value, kwargs):
+            return serializer(obj, value, **kwargs)
+
+        return serialize_with_function
+
+    def serialize_with_class(obj, value, kwargs):
+        return serializer(value, **kwargs).data
+
+    return serialize_with_class
+
+
 def evaluate_serializer(serializer, value, obj=None):
     kwargs = {}
     if obj:
         kwargs = obj.kwargs
-    if type(serializer).__name__ == "function":
-        value = serializer(obj, value, **kwargs)
-    else:
-        value = serializer(value, **kwargs).data
-    return value
+    return compile_serializer(serializer)(obj, value, kwargs)
 
 
 class ListSerializer:
     def __init__(self, serializer, **kwargs):
         self.kwargs = kwargs
         self.serializer = serializer
+        self._data = None
+        self._serialize = compile_serializer(serializer)
 
     def __call__(self, data, **kwargs):
-        self._data = data
-        self.kwargs.update(kwargs)
-        return self
+        # a bound copy, the instance itself is shared by all the calls of its parent serializer class
+        bound = ListSerializer(self.serializer, **{**self.kwargs, **kwargs})
+        bound._data = data
+        return bound
 
     @property
     def data(self) -> list:
         if self._data:
-            return [evaluate_serializer(self.serializer, e, self) for e in self._data]
+            serialize, kwargs = self._serialize, self.kwargs
+            return [serialize(self, e, kwargs) for e in self._data]
 
 
 class BaseSerializer:
@@ -32,6 +53,27 @@ class BaseSerializer:
     private_fields = None
     whitelist = None
 
+    # compiled from the attributes above once per class, see compile_plan
+    _plan: dict
+    _excluded: frozenset
+    _whitelist: frozenset
+    _calculated: tuple
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.compile_plan()
+
+    @classmethod
+    def compile_plan(cls):
+        """
+        Should be called again if `serializers`, `calculated`, `private_fields` or `whitelist`
+        are changed after the class creation
+        """
+        cls._plan = {key: compile_serializer(serializer) for key, serializer in cls.serializers.items()}
+        cls._excluded = frozenset(cls.private_fields or ())
+        cls._whitelist = frozenset(cls.whitelist) if cls.whitelist else None
+        cls._calculated = tuple(cls.calculated.items())
+
     def __init__(self, data: dict, **kwargs):
         self.kwargs = kwargs
         self._data = data
@@ -41,26 +83,30 @@ class BaseSerializer:
 
     @property
     def data(self) -> dict:
-        items = ((k, v) for k, v in self._data.items())
-        if self.private_fields:
-            items = ((k, v) for k, v in items if k not in self.private_fields)
-        if self.whitelist:
-            items = ((k, v) for k, v in items if k in self.whitelist)
-
-        data = {k: self.serialize_value(k, v) for k, v in items}
-        for k, v in self.calculated.items():
+        plan, excluded, whitelist, kwargs = self._plan, self._excluded, self._whitelist, self.kwargs
+        data = {}
+        for k, v in self._data.items():
+            if k in excluded or whitelist is not None and k not in whitelist:
+                continue
+            serializer = plan.get(k)
+            data[k] = serializer(self, v, kwargs) if serializer else v
+
+        for k, v in self._calculated:
             value = v(data)
             if value is not None:
-                data[k] = v(data)
+                data[k] = value
         return data
 
     def serialize_value(self, key, value):
-        serializer = self.serializers.get(key)
+        serializer = self._plan.get(key)
         if serializer:
-            value = evaluate_serializer(serializer, value, self)
+            value = serializer(self, value, self.kwargs)
         return value
 
 
+BaseSerializer.compile_plan()
+
+
 class RootSerializer(BaseSerializer):
     private_fields = {
         "rev",
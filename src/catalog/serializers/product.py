@@ -1,25 +1,26 @@
+from copy import deepcopy
+
+from catalog.requirements import get_requirement_index
 from catalog.serializers.base import ListSerializer, RootSerializer
 from catalog.serializers.document import DocumentSerializer
 
 
-def set_field_from_requirements(criteria, requirement_responses):
-    requirements = {
-        req["title"]: {**req, "classification": c.get("classification")}
-        for c in criteria
-        for rg in c.get("requirementGroups", "")
-        for req in rg.get("requirements", "")
-    }
-
-    fields_to_copy = ("classification", "unit", "dataSchema")
+def set_field_from_requirements(category, requirement_responses):
+    index = get_requirement_index(category)
+    fields_to_copy = ("unit", "dataSchema")
 
     for rr in requirement_responses:
-        req = requirements.get(rr["requirement"])
+        key = rr["requirement"]
+        req = index.get(key)
         if not req:
             return
 
+        # copies, the index is shared by the requests
+        if classification := index.classifications[key]:
+            rr["classification"] = deepcopy(classification)
         for field in fields_to_copy:
             if req.get(field):
-                rr[field] = req[field]
+                rr[field] = deepcopy(req[field])
 
 
 class ProductSerializer(RootSerializer):
@@ -44,4 +45,4 @@ class ProductSerializer(RootSerializer):
             )
 
         if category:
-            set_field_from_requirements(category.get("criteria", ""), data.get("requirementResponses", ""))
+            set_field_from_requirements(category, data.get("requirementResponses", ""))
@@ -5,8 +5,6 @@ import sys
 from uuid import uuid4
 from zoneinfo import ZoneInfo
 
-from aiohttp_client_cache.backends.mongodb import MongoDBBackend
-from motor.motor_asyncio import AsyncIOMotorClient
 from pymongo import ReadPreference
 from pymongo.read_concern import ReadConcern
 from pymongo.write_concern import WriteConcern
@@ -23,8 +21,12 @@ READ_CONCERN = ReadConcern(level=os.environ.get("READ_CONCERN") or None)
 
 SWAGGER_DOC_AVAILABLE = bool(os.environ.get("SWAGGER_DOC_AVAILABLE", True))
 MAX_LIST_LIMIT = int(os.environ.get("MAX_LIST_LIMIT", 10000))
+JSON_ENCODER = os.environ.get("JSON_ENCODER", "ujson")  # "ujson" or "json", the output is the same
+LIST_STREAM_BATCH_SIZE = int(os.environ.get("LIST_STREAM_BATCH_SIZE", 500))  # documents per write of ndjson lists
 
 IS_TEST = "test" in sys.argv[0]
+# otherwise indexes are only verified on start, see catalog.indexes
+MONGODB_APPLY_INDEXES = bool(os.environ.get("MONGODB_APPLY_INDEXES", IS_TEST))
 SENTRY_DSN = os.getenv("SENTRY_DSN")
 TIMEZONE = ZoneInfo("Europe/Kiev")
 CLIENT_MAX_SIZE = int(os.getenv("CLIENT_MAX_SIZE", 1024**2 * 100))
@@ -54,6 +56,17 @@ assert IMG_STORE_DIR_LEVELS * IMG_STORE_DIR_NAME_LEN < 32, "We only use 32 long
 CATALOG_DATA = os.getenv("CATALOG_DATA")
 
 OPENPROCUREMENT_API_URL = os.environ.get("OPENPROCUREMENT_API_URL", "http://api.master.k8s.prozorro.gov.ua/api/2.5")
+# agreement status and classification, see validate_agreement
+AGREEMENT_CACHE_SIZE = int(os.environ.get("AGREEMENT_CACHE_SIZE", 1000))  # agreements
+AGREEMENT_CACHE_TTL = int(os.environ.get("AGREEMENT_CACHE_TTL", 60))  # seconds
+
+# shared client of the upstream apis (openprocurement, medicine registry)
+HTTP_CLIENT_LIMIT = int(os.environ.get("HTTP_CLIENT_LIMIT", 100))  # connections
+HTTP_CLIENT_LIMIT_PER_HOST = int(os.environ.get("HTTP_CLIENT_LIMIT_PER_HOST", 20))  # connections
+HTTP_CLIENT_TIMEOUT = int(os.environ.get("HTTP_CLIENT_TIMEOUT", 10))  # seconds, whole request
+# an upstream is failed fast after that many failures in a row, until the reset timeout passes
+CIRCUIT_BREAKER_FAILURES = int(os.environ.get("CIRCUIT_BREAKER_FAILURES", 5))
+CIRCUIT_BREAKER_RESET_TIMEOUT = int(os.environ.get("CIRCUIT_BREAKER_RESET_TIMEOUT", 30))  # seconds
 
 
 DOC_SERVICE_URL = os.environ.get("DOC_SERVICE_URL", "https://docs.prozorro.gov.ua")
@@ -77,14 +90,37 @@ DOC_SERVICE_SIGNING_SEED = os.environ.get("DOC_SERVICE_SIGNING_SEED", uuid4().he
 
 MEDICINE_API_URL = os.environ.get("MEDICINE_API_URL", "https://medicines-registry.prozorro.gov.ua/api/1.0")
 MEDICINE_SCHEMES = ("INN", "ATC")
+# directory with inn.json and atc.json to use instead of the api (offline, tests)
+MEDICINE_REGISTRY_PATH = os.environ.get("MEDICINE_REGISTRY_PATH")
+MEDICINE_REGISTRY_PRELOAD = bool(os.environ.get("MEDICINE_REGISTRY_PRELOAD", not IS_TEST))
 
 # cache settings
 EXPIRE_CACHE_AFTER = int(os.environ.get("EXPIRE_CACHE_AFTER", 3600))  # value in seconds, default 1 hour
-CACHE_BACKEND = MongoDBBackend(
-    connection=AsyncIOMotorClient(MONGODB_URI),
-    cache_name=DB_NAME,
-    expire_after=EXPIRE_CACHE_AFTER,
-)
+MEDICINE_REGISTRY_REFRESH_INTERVAL = int(os.environ.get("MEDICINE_REGISTRY_REFRESH_INTERVAL", EXPIRE_CACHE_AFTER))
+# process-local cache of categories, invalidated by mongodb change stream
+CATEGORY_CACHE_SIZE = int(os.environ.get("CATEGORY_CACHE_SIZE", 1000))  # documents
+CATEGORY_CACHE_TTL = int(os.environ.get("CATEGORY_CACHE_TTL", 60))  # seconds, used if change streams unavailable
+CHANGE_STREAM_RETRY_DELAY = int(os.environ.get("CHANGE_STREAM_RETRY_DELAY", 30))  # seconds
+# compiled requirements of categories and profiles, keyed by (id, rev)
+REQUIREMENT_INDEX_CACHE_SIZE = int(os.environ.get("REQUIREMENT_INDEX_CACHE_SIZE", 1000))  # documents
+# cron/related_profiles_task.py
+RELATED_PROFILES_BATCH_SIZE = int(os.environ.get("RELATED_PROFILES_BATCH_SIZE", 1000))  # products per bulk write
+RELATED_PROFILES_WORKERS = int(os.environ.get("RELATED_PROFILES_WORKERS", 4))  # categories processed at once
+# processes matching the products, 0 to match them in the task process
+RELATED_PROFILES_PROCESSES = int(os.environ.get("RELATED_PROFILES_PROCESSES", 0 if IS_TEST else os.cpu_count() or 1))
+# products of a written profile matched within the request, the rest are left to the task
+RELATED_PROFILES_REQUEST_LIMIT = int(os.environ.get("RELATED_PROFILES_REQUEST_LIMIT", 1000))
+# catalog/prices.py calculate_price
+PRICE_CALCULATION_WORKERS = int(os.environ.get("PRICE_CALCULATION_WORKERS", 8))  # products calculated at once
+PRICE_CALCULATION_BATCH_SIZE = int(os.environ.get("PRICE_CALCULATION_BATCH_SIZE", 1000))  # products per progress log
+# quartiles engine of full_recalculation: "numpy" (the numpy extra) or "python", the prices are the same
+PRICE_RECALCULATION_ENGINE = os.environ.get("PRICE_RECALCULATION_ENGINE", "numpy")
+# catalog/price_worker.py, prices of the products queued by the crawler
+PRICE_WORKER_BATCH_SIZE = int(os.environ.get("PRICE_WORKER_BATCH_SIZE", 500))  # products calculated at once
+PRICE_WORKER_INTERVAL = int(os.environ.get("PRICE_WORKER_INTERVAL", 60))  # seconds between the empty queue checks
+# /api/feed: slow clients exceeding the queue are disconnected and reconnect with Last-Event-ID
+FEED_QUEUE_SIZE = int(os.environ.get("FEED_QUEUE_SIZE", 1000))  # events per client
+FEED_HEARTBEAT_INTERVAL = int(os.environ.get("FEED_HEARTBEAT_INTERVAL", 15))  # seconds
 
 
 CPB_USERNAME = "cpb"
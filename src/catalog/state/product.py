@@ -4,6 +4,7 @@ from aiohttp.web_exceptions import HTTPForbidden
 from catalog import db
 from catalog.context import get_now
 from catalog.models.product import ProductStatus
+from catalog.related_profiles import set_product_related_profiles
 from catalog.state.base import BaseState
 from catalog.validations import (
     validate_medicine_additional_classifications,
@@ -26,6 +27,7 @@ class ProductState(BaseState):
         )
         await validate_medicine_additional_classifications(data)
         cls.copy_data_from_category(data, category)
+        await set_product_related_profiles(data)
         data["dateCreated"] = data["dateModified"] = get_now().isoformat()
 
     @classmethod
@@ -48,11 +50,12 @@ class ProductState(BaseState):
             if before.get("additionalClassifications", "") != after.get("additionalClassifications", ""):
                 await validate_medicine_additional_classifications(after)
             cls.copy_data_from_category(after, category)
+            await set_product_related_profiles(after)
             if after.get("status") != ProductStatus.active:
                 after["expirationDate"] = now
             for doc in after.get("documents", []):
                 doc["datePublished"] = doc["dateModified"] = now
-        after["dateModified"] = now
+            after["dateModified"] = now
 
         super().on_patch(before, after)
 
@@ -10,11 +10,12 @@ from uuid import uuid4
 
 from aiocache import cached as aiocache_cached
 from aiohttp.hdrs import CONTENT_DISPOSITION, CONTENT_TYPE
-from aiohttp.web import HTTPBadRequest, HTTPNotFound, Response
+from aiohttp.web import HTTPBadRequest, HTTPNotFound, HTTPNotModified, Response
 from bson.json_util import dumps
 from jsonpatch import make_patch
 from jsonpointer import resolve_pointer
 
+from catalog.serialization import MSGPACK_CONTENT_TYPE
 from catalog.settings import IS_TEST, TIMEZONE
 
 logger = logging.getLogger(__name__)
@@ -222,6 +223,39 @@ def get_next_rev(current_rev=None):
     return next_rev
 
 
+def get_etag(request, *revs):
+    """
+    Strong ETag of a response built from the documents with these revs.
+    msgpack and json responses are different representations, so they have different ETags
+    """
+    etag = ".".join(rev or "" for rev in revs)
+    if MSGPACK_CONTENT_TYPE in request.headers.get("Accept", ""):
+        etag += ".msgpack"
+    return etag
+
+
+def set_etag(request, *revs):
+    # added to the response by convert_response_to_json
+    request["etag"] = get_etag(request, *revs)
+
+
+async def check_not_modified(request, read_revs, *args):
+    """
+    Answers 304 to If-None-Match requests after reading only the revs of the response documents
+    :param read_revs: coroutine function that returns the revs for `get_etag` or None
+    """
+    if not request.if_none_match:
+        return
+    revs = await read_revs(*args)
+    if revs:
+        etag = get_etag(request, *revs)
+        if any(tag.value in (etag, "*") for tag in request.if_none_match):
+            response = HTTPNotModified()
+            response.etag = etag
+            response.headers["Vary"] = "Accept"
+            raise response
+
+
 def get_session_time(session):
     session_data = {
         "operation_time": session.operation_time,
@@ -1,20 +1,15 @@
-import re
 from datetime import datetime
 from typing import Iterable
 
-import aiohttp
-from aiohttp.web import HTTPBadRequest, HTTPForbidden
-from aiohttp_client_cache import CachedSession
+from aiohttp.web import HTTPBadRequest, HTTPForbidden, HTTPServiceUnavailable
 
+from catalog.http_client import CircuitOpenError
+from catalog.medicine import MedicineRegistryError, medicine_registry
 from catalog.models.category import CategoryStatus
 from catalog.models.criteria import TYPEMAP
-from catalog.settings import (
-    CACHE_BACKEND,
-    LOCALIZATION_CRITERIA,
-    MEDICINE_API_URL,
-    MEDICINE_SCHEMES,
-    OPENPROCUREMENT_API_URL,
-)
+from catalog.openprocurement import AgreementNotFound, OpenprocurementError, get_agreement
+from catalog.requirements import compile_pattern, get_requirement_index
+from catalog.settings import LOCALIZATION_CRITERIA, MEDICINE_SCHEMES
 from catalog.utils import get_now
 
 
@@ -36,11 +31,16 @@ def validate_active_vendor(vendor):
             raise HTTPForbidden(text="Vendor is banned")
 
 
-def validate_req_response_values(requirement, values, key):
+def validate_req_response_values(requirement, values, key, match_pattern=None):
+    """
+    :param match_pattern: compiled `pattern` of the requirement, see RequirementIndex
+    """
     if not values:
         raise HTTPBadRequest(text=f"requirement {key} should have values")
     data_type = requirement.get("dataType")
     data_type = TYPEMAP.get(data_type)
+    if match_pattern is None and "pattern" in requirement:
+        match_pattern = compile_pattern(requirement["pattern"])
 
     for value in values:
         if not data_type or not isinstance(value, data_type):
@@ -54,7 +54,7 @@ def validate_req_response_values(requirement, values, key):
             raise HTTPBadRequest(text=f"requirement {key} minValue")
         if "maxValue" in requirement and value > requirement["maxValue"]:
             raise HTTPBadRequest(text=f"requirement {key} maxValue")
-        if "pattern" in requirement and not re.match(requirement["pattern"], str(value)):
+        if match_pattern is not None and not match_pattern(str(value)):
             raise HTTPBadRequest(text=f"requirement {key} pattern")
     if "expectedValues" in requirement and not set(values).issubset(set(requirement["expectedValues"])):
         raise HTTPBadRequest(text=f"requirement {key} expectedValues")
@@ -64,7 +64,7 @@ def validate_req_response_values(requirement, values, key):
         raise HTTPBadRequest(text=f"requirement {key} expectedMaxItems")
 
 
-def validate_req_response(req_response, requirement):
+def validate_req_response(req_response, requirement, match_pattern=None):
     value = req_response.get("value")
     values = req_response.get("values")
     if requirement.get("expectedValues") is not None and value is not None:
@@ -74,26 +74,21 @@ def validate_req_response(req_response, requirement):
     values = [value] if value is not None else values
     key = req_response.get("requirement")
 
-    validate_req_response_values(requirement, values, key)
+    validate_req_response_values(requirement, values, key, match_pattern)
 
 
 def validate_product_req_responses_to_category(
     category: dict, product: dict, product_before: dict = None, required_criteria: Iterable = None
 ):
-    category_requirements = {
-        r["title"]: (r, c.get("classification", {}).get("id"), group.get("id"))
-        for c in category.get("criteria", [])
-        for group in c["requirementGroups"]
-        for r in group["requirements"]
-    }
+    index = get_requirement_index(category)
     required_classifications = set()
     if required_criteria:
-        required_classifications = {i[1] for i in category_requirements.values() if i[1] in required_criteria}
+        required_classifications = {i for i in index.classification_ids if i in required_criteria}
 
     responded_classifications = set()
     localization_responded_groups = set()
 
-    if category_requirements and not product.get("requirementResponses"):
+    if index and not product.get("requirementResponses"):
         raise HTTPBadRequest(text="should be responded at least on one category requirement")
 
     before_responded_requirements = {}
@@ -103,17 +98,18 @@ def validate_product_req_responses_to_category(
     for req_response in product.get("requirementResponses", []):
         key = req_response["requirement"]
 
-        if key not in category_requirements:
+        requirement = index.get(key)
+        if requirement is None:
             raise HTTPBadRequest(text=f"requirement {key} not found")
 
         # check if added new requirement responses to archived requirement
-        if key not in before_responded_requirements and category_requirements[key][0].get("isArchived", False):
+        if key not in before_responded_requirements and requirement.get("isArchived", False):
             raise HTTPBadRequest(text=f"requirement {key} is archived")
 
-        requirement, classification, group = category_requirements[key]
+        classification = (index.classifications[key] or {}).get("id")
         if classification == LOCALIZATION_CRITERIA:
-            localization_responded_groups.add(group)
-        validate_req_response(req_response, requirement)
+            localization_responded_groups.add(index.groups[key])
+        validate_req_response(req_response, requirement, index.patterns.get(key))
         responded_classifications.add(classification)
 
     if len(localization_responded_groups) > 1:
@@ -146,12 +142,7 @@ def validate_product_to_category(
 
 
 def validate_profile_requirements(new_requirements: list, category: dict) -> None:
-    requirements_statuses = {
-        r["title"]: r
-        for c in category.get("criteria", "")
-        for rg in c.get("requirementGroups", "")
-        for r in rg.get("requirements")
-    }
+    requirements_statuses = get_requirement_index(category).requirements
 
     for req in new_requirements:
         key = req["title"]
@@ -291,34 +282,30 @@ async def validate_medicine_additional_classifications(obj: dict):
             med_values[classification["scheme"]].append(classification["id"])
     for scheme, ids in med_values.items():
         if ids:
-            async with CachedSession(cache=CACHE_BACKEND) as session:
-                async with session.get(f"{MEDICINE_API_URL}/registry/{scheme.lower()}.json") as resp:
-                    if resp.status != 200:
-                        raise HTTPBadRequest(
-                            text=f"Can't get classification {scheme} from medicine "
-                            f"registry, please make request later"
-                        )
-                    response = await resp.json()
-                    data = response["data"]
-                    if diff_values := set(ids).difference(data.keys()):
-                        raise HTTPBadRequest(text=f"values {diff_values} don't exist in {scheme} dictionary")
+            try:
+                registry_ids = await medicine_registry.get_ids(scheme)
+            except MedicineRegistryError:
+                raise HTTPBadRequest(
+                    text=f"Can't get classification {scheme} from medicine registry, please make request later"
+                )
+            if diff_values := set(ids).difference(registry_ids):
+                raise HTTPBadRequest(text=f"values {diff_values} don't exist in {scheme} dictionary")
 
 
 async def validate_agreement(category):
-    async with aiohttp.ClientSession() as session:
-        async with session.get(f'{OPENPROCUREMENT_API_URL}/agreements/{category["agreementID"]}') as resp:
-            if resp.status == 404:
-                raise HTTPBadRequest(text="Agreement doesn't exist")
-            if resp.status != 200:
-                raise HTTPBadRequest(text="Can't get agreement from openprocurement api, " "plz make request later")
-            data = await resp.json()
-            agreement = data["data"]
-            if agreement.get("status", "") != "active":
-                raise HTTPBadRequest(text="Agreement not in `active` status")
-            agr_clas_id = agreement["classification"]["id"]
-            cat_clas_id = category["classification"]["id"]
-            if agr_clas_id[0:3] != cat_clas_id[0:3]:
-                raise HTTPBadRequest(
-                    text="Agreement:classification:id first three numbers "
-                    "should be equal to Category:classification:id"
-                )
+    try:
+        agreement = await get_agreement(category["agreementID"])
+    except AgreementNotFound:
+        raise HTTPBadRequest(text="Agreement doesn't exist")
+    except OpenprocurementError:
+        raise HTTPBadRequest(text="Can't get agreement from openprocurement api, " "plz make request later")
+    except CircuitOpenError:
+        raise HTTPServiceUnavailable(text="Openprocurement api is unavailable, plz make request later")
+    if agreement["status"] != "active":
+        raise HTTPBadRequest(text="Agreement not in `active` status")
+    agr_clas_id = agreement["classification"].get("id", "")
+    cat_clas_id = category["classification"]["id"]
+    if agr_clas_id[0:3] != cat_clas_id[0:3]:
+        raise HTTPBadRequest(
+            text="Agreement:classification:id first three numbers " "should be equal to Category:classification:id"
+        )
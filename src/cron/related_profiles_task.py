@@ -1,225 +1,272 @@
+import argparse
 import asyncio
 import logging
-import re
-from dataclasses import dataclass
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import timedelta
+from multiprocessing import get_context
 from typing import Any
 
 import sentry_sdk
-from pymongo import UpdateOne
-
-from catalog.db import get_category_collection, get_products_collection, get_profiles_collection, init_mongo
+from pymongo import ASCENDING, UpdateOne
+
+from catalog.db import (
+    clear_task_state,
+    get_category_collection,
+    get_products_collection,
+    get_profiles_collection,
+    init_mongo,
+    read_task_state,
+    save_task_state,
+)
 from catalog.logging import setup_logging
-from catalog.models.criteria import TYPEMAP
 from catalog.models.product import ProductStatus
-from catalog.settings import LOCALIZATION_CRITERIA, SENTRY_DSN
-from catalog.utils import get_now
+from catalog.profile_matching import match_products
+from catalog.related_profiles import (
+    PRODUCT_PROJECTION,
+    PROFILE_PROJECTION,
+    get_product_match,
+    get_products_filters,
+    read_category_profiles,
+    update_profile_products,
+)
+from catalog.settings import (
+    RELATED_PROFILES_BATCH_SIZE,
+    RELATED_PROFILES_PROCESSES,
+    RELATED_PROFILES_WORKERS,
+    SENTRY_DSN,
+)
+from catalog.utils import get_next_rev, get_now
 
 logger = logging.getLogger(__name__)
 
 
+TASK_NAME = "related_profiles_task"
+WATERMARK_OVERLAP = timedelta(hours=1)
+
+
 @dataclass
 class Counters:
     total_products: int = 0
     succeeded_products: int = 0
     skipped_products: int = 0
-
-
-async def run_task() -> Counters:
-    category_collection = get_category_collection()
-    products_collection = get_products_collection()
-    profiles_collection = get_profiles_collection()
+    categories: int = 0
+    profiles: int = 0
+    category_seconds: dict[str, float] = field(default_factory=dict, repr=False)  # category id: processing time
+
+    def slowest_categories(self, limit: int = 10) -> list[tuple[str, float]]:
+        return sorted(self.category_seconds.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+
+class Checkpoint:
+    """
+    Categories are started in the `_id` order, but finished in any,
+    so the checkpoint is the last category that every category before it is finished too
+    """
+
+    def __init__(self, last_id: str | None = None):
+        self.last_id = last_id
+        self.started: deque[str] = deque()
+        self.finished: set[str] = set()
+
+    def start(self, category_id: str) -> None:
+        self.started.append(category_id)
+
+    async def finish(self, category_id: str) -> None:
+        self.finished.add(category_id)
+        last_id = None
+        while self.started and self.started[0] in self.finished:
+            last_id = self.started.popleft()
+            self.finished.remove(last_id)
+        if last_id is not None:
+            self.last_id = last_id
+            await save_task_state(TASK_NAME, checkpoint=last_id)
+
+
+async def run_task(full: bool = False) -> Counters:
+    """
+    The first run (or a `full` one) matches all the products,
+    the next ones only sweep the profiles and products changed since the previous run started,
+    as products and profiles are matched on their writes already
+    """
     counters = Counters()
-    bulk: list[UpdateOne] = []
-
-    async for category in category_collection.find({}, projection={"_id": True}, no_cursor_timeout=True):
-        category_id = category["_id"]
-        profiles: list[dict[str, Any]] = await profiles_collection.find(
-            {
-                "relatedCategory": category_id,
-                "status": ProductStatus.active,
-                "criteria.requirementGroups.requirements": {"$exists": True},
-            },
-            projection={"criteria": 1},
-            no_cursor_timeout=True,
-        ).to_list(None)
-
-        product_cursor = products_collection.find(
-            {"relatedCategory": category_id, "requirementResponses": {"$exists": True}, "status": ProductStatus.active},
-            projection={"requirementResponses": True, "relatedProfiles": True, "relatedCategory": True},
-            no_cursor_timeout=True,
-        )
-        product_cursor.batch_size(1000)
-
-        async for product in product_cursor:
-            related_profiles = await get_product_relatedProfiles(product, profiles)
-
-            if product.get("relatedProfiles", []) != related_profiles:
-                bulk.append(
-                    UpdateOne(
-                        filter={"_id": product["_id"]},
-                        update={
-                            "$set": {"relatedProfiles": related_profiles, "dateModified": get_now().isoformat()},
-                        },
-                    )
-                )
-            counters.total_products += 1
-
-    if bulk:
-        result = await products_collection.bulk_write(bulk)
-        bulk_len = len(bulk)
-
-        if result.modified_count != bulk_len:
-            logger.error(f"Unexpected modified_count: {result.modified_count}; expected {bulk_len}")
-
-        counters.succeeded_products = result.modified_count
-        counters.skipped_products = counters.total_products - result.modified_count
-
+    state = await read_task_state(TASK_NAME)
+    started = get_now()
+    if full or not state.get("watermark") or state.get("checkpoint"):
+        await run_full_task(counters, state.get("checkpoint"))
+    else:
+        await run_sweep_task(counters, state["watermark"])
+
+    # dateModified values are compared as strings, the overlap covers the utc offset change
+    await save_task_state(TASK_NAME, watermark=(started - WATERMARK_OVERLAP).isoformat())
+    await clear_task_state(TASK_NAME, "checkpoint")
+    counters.skipped_products = counters.total_products - counters.succeeded_products
     logger.info(f"Finished. Stats: {counters}")
     return counters
 
 
-async def get_product_relatedProfiles(product: dict[str, Any], profiles: list[dict[str, Any]]) -> list[str]:
-    related_profiles: list[str] = []
-    for profile in profiles:
-        profile_requirements = get_criteria_requirements(profile)
-
-        # there should be requirements in profile
-        if not profile_requirements:
-            continue
-
-        # all profile criteria must meet requirements
-        if not check_profile_criteria_meets_requirements(profile, product):
-            continue
-
-        # profile requirements must be valid
-        if not validate_profile_requirements(product, profile_requirements):
-            continue
-
-        related_profiles.append(profile["_id"])
-
-    return related_profiles
-
-
-def get_criteria_requirements(profile: dict[str, Any]) -> dict[str, dict[str, Any]]:
-    profile_requirements: dict[str, dict[str, Any]] = {}
-
-    for criterion in profile.get("criteria", []):
-        for group in criterion.get("requirementGroups", []):
-            for req in group.get("requirements", []):
-                profile_requirements[req["title"]] = req
-
-    return profile_requirements
-
-
-def check_profile_criteria_meets_requirements(profile: dict[str, Any], product: dict[str, Any]) -> bool:
-    product_requirement_responses: set[str] = {rr["requirement"] for rr in product.get("requirementResponses", [])}
-    criteria_meets_requirements: list[bool] = []
-
-    for criterion in profile.get("criteria", []):
-        group_meets_requirements: list[bool] = []
-
-        for group in criterion.get("requirementGroups", []):
-            req_ids: set[str] = {req["title"] for req in group.get("requirements", [])}
-            group_meets_requirements.append(req_ids.issubset(product_requirement_responses))
-
-        # LOCALIZATION_CRITERIA must have only ONE group to meet requirements, no more, no less
-        if criterion.get("classification", {}).get("id") == LOCALIZATION_CRITERIA:
-            criteria_meets_requirements.append(group_meets_requirements.count(True) == 1)
-        else:
-            # other criteria needs all the groups to meet requirements
-            criteria_meets_requirements.append(all(group_meets_requirements))
-
-    return all(criteria_meets_requirements)
-
-
-def validate_profile_requirements(product: dict[str, Any], profile_requirements: dict[str, dict[str, Any]]) -> bool:
-    is_valid_profile = False
-    for rr in product.get("requirementResponses", {}):
-        req_key: str = rr["requirement"]
-
-        requirement = profile_requirements.get(req_key)
-
-        if not requirement:
-            continue
-
-        if any(i in requirement for i in ("expectedValue", "minValue", "maxValue", "pattern")):
-            value = get_value(rr)
-            is_valid_profile = is_valid_req_response_value(requirement, value)
-
-        elif "expectedValues" in requirement:
-            value = get_value(rr, is_list=True)
-            is_valid_profile = is_valid_req_response_values(requirement, value)
-
-        else:
-            value = get_value(rr)
-            is_valid_profile = is_valid_data_type(requirement, value)
-
-        if not is_valid_profile:
-            break
-
-    return is_valid_profile
-
-
-def is_valid_data_type(requirement: dict[str, Any], value: Any) -> bool:
-    data_type = requirement.get("dataType")
-    data_type = TYPEMAP.get(data_type)
-    return isinstance(value, data_type) if data_type else False
-
-
-def is_valid_req_response_value(requirement: dict[str, Any], value: Any) -> bool:
-    if value is None:
-        return False
-
-    if not is_valid_data_type(requirement, value):
-        return False
+async def run_full_task(counters: Counters, checkpoint_id: str | None = None) -> None:
+    """
+    Matches all the products of every category
+    """
+    checkpoint = Checkpoint(checkpoint_id)
+    filters = {}
+    if checkpoint.last_id:
+        logger.info(f"Resuming after category {checkpoint.last_id}")
+        filters["_id"] = {"$gt": checkpoint.last_id}
+
+    executor = None
+    if RELATED_PROFILES_PROCESSES:
+        # the task process runs the motor threads, so workers aren't forked from it
+        executor = ProcessPoolExecutor(RELATED_PROFILES_PROCESSES, mp_context=get_context("spawn"))
+    queue: asyncio.Queue[str | None] = asyncio.Queue(RELATED_PROFILES_WORKERS)
+
+    async def worker() -> None:
+        while (category_id := await queue.get()) is not None:
+            start = time.monotonic()
+            await process_category(category_id, counters, executor)
+            counters.category_seconds[category_id] = time.monotonic() - start
+            counters.categories += 1
+            await checkpoint.finish(category_id)
+
+    async def produce() -> None:
+        categories = get_category_collection().find(filters, projection={"_id": True}, no_cursor_timeout=True)
+        async for category in categories.sort("_id", ASCENDING):
+            checkpoint.start(category["_id"])
+            await queue.put(category["_id"])
+        for _ in range(RELATED_PROFILES_WORKERS):
+            await queue.put(None)
 
     try:
-        if "expectedValue" in requirement and value != requirement["expectedValue"]:
-            return False
-        if "minValue" in requirement and float(value) < float(requirement["minValue"]):
-            return False
-        if "maxValue" in requirement and float(value) > float(requirement["maxValue"]):
-            return False
-        if "pattern" in requirement and not re.match(requirement["pattern"], str(value)):
-            return False
-    except (ValueError, TypeError):
-        return False
-
-    return True
-
-
-def is_valid_req_response_values(requirement: dict[str, Any], product_values: list[Any] | None) -> bool:
-    if not product_values:
-        return False
-
-    overlapping_values = set(requirement["expectedValues"]) & set(product_values)
-
-    if "expectedMinItems" in requirement and len(overlapping_values) < requirement["expectedMinItems"]:
-        return False
-
-    if "expectedMaxItems" in requirement and len(product_values) > requirement["expectedMaxItems"]:
-        return False
-
-    return True
-
-
-def get_value(rr: dict[str, Any], is_list: bool = False) -> Any:
-    if "value" in rr:
-        return [rr["value"]] if is_list else rr["value"]
-    elif "values" in rr:
-        return rr["values"] if is_list else rr["values"][0]
-
-    return None
+        async with asyncio.TaskGroup() as group:
+            group.create_task(produce())
+            for _ in range(RELATED_PROFILES_WORKERS):
+                group.create_task(worker())
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    logger.info(
+        "Slowest categories: "
+        + ", ".join(f"{category_id} {seconds:.1f}s" for category_id, seconds in counters.slowest_categories())
+    )
+
+
+async def run_sweep_task(counters: Counters, watermark: str) -> None:
+    logger.info(f"Sweeping changes since {watermark}")
+    profiles_cursor = get_profiles_collection().find(
+        {"dateModified": {"$gte": watermark}},
+        projection={**PROFILE_PROJECTION, "status": True, "relatedCategory": True},
+        no_cursor_timeout=True,
+    )
+    async for profile in profiles_cursor:
+        counters.profiles += 1
+        updated = await update_profile_products(profile)
+        counters.total_products += updated
+        counters.succeeded_products += updated
+
+    product_cursor = get_products_collection().find(
+        {
+            "dateModified": {"$gte": watermark},
+            "requirementResponses": {"$exists": True},
+            "status": ProductStatus.active,
+        },
+        projection=PRODUCT_PROJECTION,
+        no_cursor_timeout=True,
+    )
+    product_cursor.batch_size(RELATED_PROFILES_BATCH_SIZE)
+    category_profiles: dict[str, list[dict[str, Any]]] = {}
+    products: list[dict[str, Any]] = []
+    async for product in product_cursor:
+        products.append(product)
+        if len(products) >= RELATED_PROFILES_BATCH_SIZE:
+            await update_changed_products(products, category_profiles, counters)
+            products = []
+    if products:
+        await update_changed_products(products, category_profiles, counters)
+
+
+async def update_changed_products(
+    products: list[dict[str, Any]],
+    category_profiles: dict[str, list[dict[str, Any]]],
+    counters: Counters,
+) -> None:
+    by_category: dict[str, list[dict[str, Any]]] = defaultdict(list)
+    for product in products:
+        by_category[product["relatedCategory"]].append(product)
+    for category_id, category_products in by_category.items():
+        if category_id not in category_profiles:
+            category_profiles[category_id] = await read_category_profiles(category_id)
+        await update_products(category_profiles[category_id], category_products, counters, executor=None)
+
+
+async def process_category(category_id: str, counters: Counters, executor: ProcessPoolExecutor | None) -> None:
+    profiles = await read_category_profiles(category_id)
+    product_cursor = get_products_collection().find(
+        get_products_filters(category_id),
+        projection=PRODUCT_PROJECTION,
+        no_cursor_timeout=True,
+    )
+    product_cursor.batch_size(RELATED_PROFILES_BATCH_SIZE)
+
+    products: list[dict[str, Any]] = []
+    async for product in product_cursor:
+        products.append(product)
+        if len(products) >= RELATED_PROFILES_BATCH_SIZE:
+            await update_products(profiles, products, counters, executor)
+            products = []
+    if products:
+        await update_products(profiles, products, counters, executor)
+
+
+async def update_products(
+    profiles: list[dict[str, Any]],
+    products: list[dict[str, Any]],
+    counters: Counters,
+    executor: ProcessPoolExecutor | None,
+) -> None:
+    if executor is None:
+        changes = match_products(profiles, products)
+    else:
+        changes = await asyncio.get_running_loop().run_in_executor(executor, match_products, profiles, products)
+    counters.total_products += len(products)
+    if not changes:
+        return
+
+    date_modified = get_now().isoformat()
+    products_by_id = {product["_id"]: product for product in products}
+    bulk = [
+        UpdateOne(
+            filter=get_product_match(products_by_id[product_id]),
+            update={
+                "$set": {
+                    "relatedProfiles": related_profiles,
+                    "dateModified": date_modified,
+                    "_rev": get_next_rev(products_by_id[product_id].get("_rev")),
+                }
+            },
+        )
+        for product_id, related_profiles in changes
+    ]
+    result = await get_products_collection().bulk_write(bulk, ordered=False)
+    if result.modified_count != len(bulk):
+        logger.info(f"{len(bulk) - result.modified_count} products were skipped as they were written meanwhile")
+    counters.succeeded_products += result.modified_count
 
 
 async def main() -> None:
     setup_logging()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--full", action="store_true", help="match all the products, not only the changed ones")
+    args = parser.parse_args()
 
     if SENTRY_DSN:
         sentry_sdk.init(dsn=SENTRY_DSN)
 
     await init_mongo()
-    await run_task()
+    await run_task(full=args.full)
 
 
 if __name__ == "__main__":
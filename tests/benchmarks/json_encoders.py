@@ -0,0 +1,33 @@
+"""
+JSON encoders of catalog.serialization on the fixture documents
+
+    PYTHONPATH=src python -m tests.benchmarks.json_encoders
+"""
+
+import timeit
+from pathlib import Path
+
+from catalog.serialization import JSON_ENCODERS
+from tests.utils import get_fixture_json
+
+NUMBER = 2000
+FIXTURES = ("category", "profile", "product", "vendor", "price", "tender")
+
+
+def main():
+    documents = {name: get_fixture_json(name) for name in FIXTURES}
+    # a page of products as /api/products?opt_fields=... returns it
+    documents["products page"] = {"data": [get_fixture_json("product") for _ in range(100)]}
+    encoders = sorted(JSON_ENCODERS)
+
+    print(f"{'document':<16}{'bytes':>9}" + "".join(f"{name + ', us':>14}" for name in encoders))
+    for name, document in documents.items():
+        size = len(JSON_ENCODERS["json"](document))
+        number = NUMBER // 50 if name == "products page" else NUMBER
+        results = [timeit.timeit(lambda: JSON_ENCODERS[e](document), number=number) / number * 1e6 for e in encoders]
+        print(f"{name:<16}{size:>9}" + "".join(f"{r:>14.1f}" for r in results))
+
+
+if __name__ == "__main__":
+    assert Path("tests/fixtures").exists(), "run from the repository root"
+    main()
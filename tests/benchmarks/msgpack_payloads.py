@@ -0,0 +1,45 @@
+"""
+Payload size and encode/decode time of msgpack bodies compared to json ones
+
+    PYTHONPATH=src python -m tests.benchmarks.msgpack_payloads
+"""
+
+import json
+import timeit
+from pathlib import Path
+
+from catalog.serialization import json_dumps, msgpack_dumps, msgpack_loads
+from tests.utils import get_fixture_json
+
+NUMBER = 2000
+FIXTURES = ("category", "profile", "product")
+
+
+def measure(func, number):
+    return timeit.timeit(func, number=number) / number * 1e6
+
+
+def main():
+    documents = {name: get_fixture_json(name) for name in FIXTURES}
+    documents["products page"] = {"data": [get_fixture_json("product") for _ in range(100)]}
+
+    print(
+        f"{'document':<16}{'json, B':>10}{'msgpack, B':>12}"
+        f"{'json enc, us':>14}{'mp enc, us':>12}{'json dec, us':>14}{'mp dec, us':>12}"
+    )
+    for name, document in documents.items():
+        number = NUMBER // 50 if name == "products page" else NUMBER
+        json_body = json_dumps(document).encode()
+        msgpack_body = msgpack_dumps(document)
+        print(
+            f"{name:<16}{len(json_body):>10}{len(msgpack_body):>12}"
+            f"{measure(lambda: json_dumps(document).encode(), number):>14.1f}"
+            f"{measure(lambda: msgpack_dumps(document), number):>12.1f}"
+            f"{measure(lambda: json.loads(json_body), number):>14.1f}"
+            f"{measure(lambda: msgpack_loads(msgpack_body), number):>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    assert Path("tests/fixtures").exists(), "run from the repository root"
+    main()
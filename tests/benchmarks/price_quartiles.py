@@ -0,0 +1,58 @@
+"""
+Daily quartiles of the bids of a product, see calculate_price_for_product
+
+    PYTHONPATH=src python -m tests.benchmarks.price_quartiles
+
+A product of every seed/product_bids.py scenario (2 years of bids) from scratch, with the 7 days window.
+"Filtering" selects and sorts the bids of every window again, as the price calculation did before
+"""
+
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+from catalog.price_quartiles import get_quartiles, iter_window_quartiles
+from seed.product_bids import SCENARIO_CONFIG
+
+DAYS_BACK = 7
+
+
+def get_quartiles_by_filtering(parsed_bids, days):
+    result = []
+    for day in days:
+        start_day = day - timedelta(days=DAYS_BACK - 1)
+        amounts = sorted(Decimal(bid["amount"]) for bd, bid in parsed_bids if start_day <= bd.date() <= day)
+        result.append(get_quartiles(amounts) if len(amounts) < 3 else tuple(statistics.quantiles(amounts, n=4)))
+    return result
+
+
+def main():
+    random.seed(0)
+    print(f"{'scenario':<18}{'bids':>6}{'days':>6}{'filtering':>14}{'window':>12}")
+    totals = [0, 0]
+    for title, _, generate_bids, base_price in SCENARIO_CONFIG:
+        bids = sorted(generate_bids("a" * 32, base_price, "H87", "штука"), key=lambda bid: bid["date"])
+        parsed_bids = [(datetime.fromisoformat(bid["date"]), bid) for bid in bids]
+        days = sorted({bd.date() for bd, _ in parsed_bids})
+
+        start = time.perf_counter()
+        expected = get_quartiles_by_filtering(parsed_bids, days)
+        filtering = time.perf_counter() - start
+
+        start = time.perf_counter()
+        windows = list(iter_window_quartiles(parsed_bids, days, DAYS_BACK))
+        window = time.perf_counter() - start
+
+        assert [(w.lower, w.median, w.upper) for w in windows] == expected
+        totals[0] += filtering
+        totals[1] += window
+        print(f"{title:<18}{len(bids):>6}{len(days):>6}{filtering * 1e3:>11.1f} ms{window * 1e3:>9.1f} ms")
+    print(f"{'total':<30}{totals[0] * 1e3:>11.1f} ms{totals[1] * 1e3:>9.1f} ms")
+
+
+if __name__ == "__main__":
+    assert Path("tests/fixtures").exists(), "should be run from the repository root"
+    main()
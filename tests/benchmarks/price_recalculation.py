@@ -0,0 +1,61 @@
+"""
+Quartiles engines of full_recalculation, see catalog.price_quartiles
+
+    PYTHONPATH=src python -m tests.benchmarks.price_recalculation
+
+Products of the seed/product_bids.py scenarios in turn (2 years of bids each) up to BIDS bids,
+their prices are calculated from scratch with the 7 days window.
+"Engine" is the window quartiles only, "prices" includes building the price documents (get_product_prices)
+"""
+
+import random
+import time
+from datetime import datetime
+from pathlib import Path
+
+from catalog.price_quartiles import WINDOW_QUARTILES_ENGINES
+from catalog.prices import get_product_prices
+from seed.product_bids import SCENARIO_CONFIG
+
+BIDS = 250_000
+DAYS_BACK = 7
+
+
+def get_products():
+    random.seed(0)
+    products = []
+    total = 0
+    while total < BIDS:
+        for title, _, generate_bids, base_price in SCENARIO_CONFIG:
+            bids = sorted(generate_bids("a" * 32, base_price, "H87", "штука"), key=lambda bid: bid["date"])
+            products.append(bids)
+            total += len(bids)
+    return products, total
+
+
+def main():
+    products, total = get_products()
+    parsed_products = []
+    for bids in products:
+        parsed_bids = [(datetime.fromisoformat(bid["date"]), bid) for bid in bids]
+        parsed_products.append((parsed_bids, sorted({bd.date() for bd, _ in parsed_bids})))
+    print(f"{len(products)} products, {total} bids")
+
+    for name, engine in WINDOW_QUARTILES_ENGINES.items():
+        start = time.perf_counter()
+        windows = sum(len(list(engine(parsed_bids, days, DAYS_BACK))) for parsed_bids, days in parsed_products)
+        engine_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for bids in products:
+            get_product_prices("a" * 32, bids, None, DAYS_BACK, engine)
+        prices_seconds = time.perf_counter() - start
+        print(
+            f"{name:<8} engine {engine_seconds / total * 1e6:6.2f} s per 1M bids, "
+            f"prices {prices_seconds / total * 1e6:6.2f} s per 1M bids, {windows} windows"
+        )
+
+
+if __name__ == "__main__":
+    assert Path("tests/fixtures").exists(), "should be run from the repository root"
+    main()
@@ -0,0 +1,110 @@
+"""
+Matching of products to the profiles of a category, see related_profiles_task
+
+    PYTHONPATH=src python -m tests.benchmarks.profile_matching
+
+A synthetic category of 200 profiles and 50k products, products respond either to a random half
+of the category requirements (sparse) or to all of them (full).
+"Per pair" tests every profile against every product with the same compiled predicates,
+as the task did before the matcher (its uncompiled checks were ~3x slower still)
+"""
+
+import random
+import time
+from pathlib import Path
+
+from catalog.profile_matching import ProfileMatcher, group_responses
+from catalog.settings import LOCALIZATION_CRITERIA
+
+PROFILES = 200
+PRODUCTS = 50_000
+PER_PAIR_PRODUCTS = 5_000  # a sample, per pair matching of all the products takes minutes
+TITLES = [f"requirement-{i}" for i in range(60)]
+PROFILE_TITLES = 10
+
+
+def get_requirement(title, rnd):
+    kind = rnd.randrange(3)
+    if kind == 0:
+        return {"title": title, "dataType": "number", "minValue": rnd.randint(0, 40), "maxValue": rnd.randint(60, 100)}
+    if kind == 1:
+        return {"title": title, "dataType": "string", "expectedValues": ["a", "b", "c"], "expectedMinItems": 1}
+    return {"title": title, "dataType": "string", "pattern": "^[a-c]$"}
+
+
+def get_profiles(rnd):
+    localization = {
+        "classification": {"id": LOCALIZATION_CRITERIA},
+        "requirementGroups": [
+            {"requirements": [{"title": "local", "dataType": "number", "minValue": 25}]},
+            {"requirements": [{"title": "origin", "dataType": "string", "expectedValues": ["UA"]}]},
+        ],
+    }
+    return [
+        {
+            "_id": f"{i:032x}",
+            "_rev": "1",
+            "criteria": [
+                {
+                    "classification": {"id": "CRITERION.OTHER"},
+                    "requirementGroups": [
+                        {"requirements": [get_requirement(t, rnd) for t in rnd.sample(TITLES, PROFILE_TITLES)]}
+                    ],
+                },
+                localization,
+            ],
+        }
+        for i in range(PROFILES)
+    ]
+
+
+def get_products(rnd, titles_count):
+    products = []
+    for _ in range(PRODUCTS):
+        responses = [{"requirement": "local", "value": 30}]
+        for title in rnd.sample(TITLES, titles_count):
+            if rnd.random() < 0.5:
+                responses.append({"requirement": title, "value": rnd.randint(0, 100)})
+            else:
+                responses.append({"requirement": title, "values": [rnd.choice("abcd")]})
+        products.append({"requirementResponses": responses})
+    return products
+
+
+def match_per_pair(matcher, product):
+    responses = group_responses(product["requirementResponses"])
+    titles = set(responses)
+    return [p.id for p in matcher.profiles if p.index.meets_criteria(titles) and p.matches(responses)]
+
+
+def main():
+    rnd = random.Random(0)
+    profiles = get_profiles(rnd)
+
+    start = time.perf_counter()
+    matcher = ProfileMatcher(profiles)
+    print(f"compile {PROFILES} profiles: {(time.perf_counter() - start) * 1e3:.1f} ms")
+
+    for title, titles_count in (("sparse", len(TITLES) // 2), ("full", len(TITLES))):
+        products = get_products(rnd, titles_count)
+
+        start = time.perf_counter()
+        related = sum(len(match_per_pair(matcher, product)) for product in products[:PER_PAIR_PRODUCTS])
+        per_pair = (time.perf_counter() - start) / PER_PAIR_PRODUCTS
+
+        matcher = ProfileMatcher(profiles)
+        start = time.perf_counter()
+        related_total = sum(len(matcher.match(product)) for product in products)
+        indexed = (time.perf_counter() - start) / PRODUCTS
+
+        assert related == sum(len(matcher.match(product)) for product in products[:PER_PAIR_PRODUCTS])
+        print(
+            f"{title:<7} per pair {per_pair * 1e6:8.1f} us/product ({per_pair * PRODUCTS:6.1f} s)  "
+            f"indexed {indexed * 1e6:8.1f} us/product ({indexed * PRODUCTS:6.1f} s)  "
+            f"{related_total} relations"
+        )
+
+
+if __name__ == "__main__":
+    assert Path("tests/fixtures").exists(), "should be run from the repository root"
+    main()
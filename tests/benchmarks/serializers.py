@@ -0,0 +1,86 @@
+"""
+Serialization of large product and product request documents
+
+    PYTHONPATH=src python -m tests.benchmarks.serializers
+
+ProductRequestSerializer nests ProductSerializer and DocumentSerializer lists
+"""
+
+import timeit
+from copy import deepcopy
+from pathlib import Path
+
+from aiohttp.test_utils import make_mocked_request
+
+from catalog.context import set_request
+from catalog.serializers.product import ProductSerializer
+from catalog.serializers.product_request import ProductRequestSerializer
+from tests.utils import get_fixture_json
+
+NUMBER = 2000
+DOCUMENTS = 50
+RESPONSES = 100
+
+
+def get_documents():
+    return [
+        {
+            "id": f"{i:032x}",
+            "title": f"document-{i}.pdf",
+            "url": f"/api/products/1/documents/{i:032x}?download=1",
+            "hash": "md5:00000000000000000000000000000000",
+            "format": "application/pdf",
+            "datePublished": "2025-01-01T00:00:00+02:00",
+            "dateModified": "2025-01-01T00:00:00+02:00",
+        }
+        for i in range(DOCUMENTS)
+    ]
+
+
+def get_product():
+    product = get_fixture_json("product")
+    response = product["requirementResponses"][0]
+    product["requirementResponses"] = [{**response, "requirement": f"req-{i}"} for i in range(RESPONSES)]
+    product.update(
+        id="1" * 32,
+        _rev="1-" + "0" * 32,
+        access={"owner": "broker", "token": "0" * 32},
+        dateModified="2025-01-01T00:00:00+02:00",
+        documents=get_documents(),
+    )
+    return product
+
+
+def get_product_request():
+    return {
+        "id": "2" * 32,
+        "_rev": "1-" + "0" * 32,
+        "contributor_id": "3" * 32,
+        "product": {key: value for key, value in get_product().items() if key not in ("access", "_rev")},
+        "documents": get_documents(),
+        "dateModified": "2025-01-01T00:00:00+02:00",
+    }
+
+
+def main():
+    set_request(make_mocked_request("GET", "/api/products", headers={"Host": "localhost"}))
+    contributor = {"contributor": {"name": "contributor", "identifier": {"id": "1"}}}
+    cases = (
+        ("product", get_product(), lambda data: ProductSerializer(data).data),
+        (
+            "product request",
+            get_product_request(),
+            lambda data: ProductRequestSerializer(data, contributor=deepcopy(contributor)).data,
+        ),
+    )
+    for title, document, serialize in cases:
+        # serializers change the input, so every run gets a copy
+        copies = [deepcopy(document) for _ in range(NUMBER)]
+        copies.reverse()
+        result = timeit.timeit(lambda: serialize(copies.pop()), number=NUMBER) / NUMBER * 1e6
+        print(f"{title:<16} {result:8.1f} us")
+
+
+if __name__ == "__main__":
+    assert Path("tests/fixtures").exists(), "run from the repository root"
+    main()
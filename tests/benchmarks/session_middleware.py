@@ -0,0 +1,59 @@
+"""
+Per-request overhead of db_session_middleware
+
+    PYTHONPATH=src python -m tests.benchmarks.session_middleware
+
+Handlers don't query the db, so only the session handling is measured
+and a running mongodb isn't required
+"""
+
+import asyncio
+import time
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from catalog import db
+from catalog.context import get_db_session
+from catalog.middleware import db_session_middleware
+
+REQUESTS = 2000
+
+
+async def no_db_handler(request):
+    return web.json_response({"text": "pong"})
+
+
+async def session_handler(request):
+    get_db_session()
+    return web.json_response({"text": "pong"})
+
+
+async def measure(client, path):
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        resp = await client.get(path)
+        await resp.read()
+    return (time.perf_counter() - start) / REQUESTS * 1e6
+
+
+async def main():
+    db.DB = AsyncIOMotorClient("mongodb://localhost:27017/", connect=False)["benchmark"]
+    app = web.Application(middlewares=(db_session_middleware,))
+    app.router.add_get("/api/ping", no_db_handler)
+    app.router.add_get("/api/products", no_db_handler)
+    app.router.add_get("/api/profiles", session_handler)
+
+    async with TestClient(TestServer(app)) as client:
+        await measure(client, "/api/ping")  # warm up
+        for path, title in (
+            ("/api/ping", "db free route"),
+            ("/api/products", "db route, session isn't used"),
+            ("/api/profiles", "db route, session is used"),
+        ):
+            print(f"{title:<32} {await measure(client, path):8.1f} us/request")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
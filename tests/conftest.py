@@ -4,9 +4,11 @@ from unittest.mock import AsyncMock, patch
 from uuid import uuid4
 
 import pytest
+from aiohttp import web
 
 from catalog.api import create_application
 from catalog.db import (
+    CACHE_WATCHERS,
     flush_database,
     get_database,
     get_offers_collection,
@@ -16,6 +18,9 @@ from catalog.db import (
     insert_object,
 )
 from catalog.doc_service import generate_test_url
+from catalog.http_client import close_http_client
+from catalog.medicine import medicine_registry
+from catalog.openprocurement import agreement_cache, openprocurement_breaker
 from catalog.utils import get_now
 from tests.base import TEST_AUTH, TEST_AUTH_CPB
 from tests.utils import create_criteria, create_profile, get_fixture_json
@@ -35,6 +40,10 @@ async def db(event_loop):
         yield get_database()
     except Exception:
         await flush_database()
+    finally:
+        # cache watchers are bound to the loop of the test
+        while CACHE_WATCHERS:
+            CACHE_WATCHERS.pop().cancel()
 
 
 @pytest.fixture
@@ -52,6 +61,48 @@ async def mock_agreement():
         yield m
 
 
+@pytest.fixture
+async def openprocurement_api(aiohttp_server):
+    """
+    Local stub of the openprocurement api.
+    `agreements` of the server are served by id, an int instead of an agreement is the response status
+    """
+    agreements = {}
+    requests = []
+
+    async def get_agreement(request):
+        agreement_id = request.match_info["agreement_id"]
+        requests.append(agreement_id)
+        agreement = agreements.get(agreement_id)
+        if agreement is None:
+            raise web.HTTPNotFound()
+        if isinstance(agreement, int):
+            return web.Response(status=agreement)
+        return web.json_response({"data": agreement})
+
+    app = web.Application()
+    app.router.add_get("/api/2.5/agreements/{agreement_id}", get_agreement)
+    server = await aiohttp_server(app)
+    server.agreements = agreements
+    server.agreement_requests = requests
+
+    agreement_cache.clear()
+    openprocurement_breaker.reset()
+    with patch("catalog.openprocurement.OPENPROCUREMENT_API_URL", str(server.make_url("/api/2.5"))):
+        yield server
+    agreement_cache.clear()
+    openprocurement_breaker.reset()
+    await close_http_client()
+
+
+@pytest.fixture
+def mock_medicine_registry():
+    medicine_registry.clear()
+    with patch.object(medicine_registry, "fetch", AsyncMock(return_value={"foo": "bar"})) as m:
+        yield m
+    medicine_registry.clear()
+
+
 @pytest.fixture
 async def category(api, mock_agreement):
     data = get_fixture_json("category")
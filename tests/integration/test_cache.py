@@ -0,0 +1,81 @@
+from unittest.mock import patch
+
+from catalog.cache import DocumentCache, apply_projection
+from catalog.metrics import get_metrics, reset_metrics
+
+
+def test_cache_lru():
+    reset_metrics()
+    cache = DocumentCache("test", max_size=2, ttl=60)
+    assert cache.get("a") is None
+
+    cache.set({"id": "a", "rev": "1-a"})
+    cache.set({"id": "b", "rev": "1-b"})
+    assert cache.get("a") == {"id": "a", "rev": "1-a"}
+    cache.set({"id": "c", "rev": "1-c"})  # "b" is the least recently used
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get_rev("a") == "1-a"
+    assert cache.get_rev("c") == "1-c"
+
+    metrics = get_metrics()
+    assert metrics["cache_hits"] == {"test": 1}
+    assert metrics["cache_misses"] == {"test": 2}
+    assert metrics["cache_evictions"] == {"test": 1}
+
+
+def test_cache_copies():
+    cache = DocumentCache("test", max_size=2, ttl=60)
+    obj = {"id": "a", "access": {"owner": "test"}}
+    cache.set(obj)
+    obj["access"]["owner"] = "changed"
+
+    result = cache.get("a")
+    assert result == {"id": "a", "access": {"owner": "test"}}
+    result.pop("access")
+    assert cache.get("a") == {"id": "a", "access": {"owner": "test"}}
+
+
+def test_cache_ttl():
+    cache = DocumentCache("test", max_size=2, ttl=60)
+    with patch("catalog.cache.time.monotonic", return_value=100):
+        cache.set({"id": "a", "rev": "1-a"})
+    with patch("catalog.cache.time.monotonic", return_value=170):
+        assert cache.get_rev("a") is None
+        assert cache.get("a") is None
+
+        cache.set({"id": "a"})
+        cache.watching = True  # no expiration while changes are watched
+    with patch("catalog.cache.time.monotonic", return_value=1000):
+        assert cache.get("a") == {"id": "a"}
+
+
+def test_cache_invalidate():
+    cache = DocumentCache("test", max_size=2, ttl=60)
+    cache.set({"id": "a"})
+    cache.set({"id": "b"})
+    cache.invalidate("a")
+    assert cache.get("a") is None
+    assert cache.get("b") == {"id": "b"}
+
+    # a document changed while it was being read isn't cached
+    version = cache.version
+    cache.invalidate("a")
+    cache.set({"id": "a"}, version=version)
+    assert cache.get("a") is None
+
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_cache_disabled():
+    cache = DocumentCache("test", max_size=0, ttl=60)
+    cache.set({"id": "a"})
+    assert cache.get("a") is None
+
+
+def test_apply_projection():
+    obj = {"id": "a", "title": "Title", "criteria": [], "access": {"owner": "test"}}
+    assert apply_projection(obj, None) is obj
+    assert apply_projection(obj, {"title": 1}) == {"id": "a", "title": "Title"}
+    assert apply_projection(obj, {"access": 0}) == {"id": "a", "title": "Title", "criteria": []}
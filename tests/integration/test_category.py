@@ -2,6 +2,9 @@ from copy import deepcopy
 from random import randint
 from urllib.parse import quote
 
+from catalog.db import category_cache, get_category_collection
+from catalog.metrics import get_metrics, reset_metrics
+from catalog.serialization import MSGPACK_CONTENT_TYPE, msgpack_dumps, msgpack_loads
 from tests.base import TEST_AUTH, TEST_AUTH_ANOTHER, TEST_AUTH_NO_PERMISSION
 from tests.conftest import set_requirements_to_responses
 from tests.utils import create_criteria, create_profile
@@ -257,6 +260,36 @@ async def test_111_limit_offset(api, mock_agreement):
     assert len(resp_json["data"]) == 0
 
 
+async def test_112_limit_offset_same_date_modified(api):
+    test_category = api.get_fixture_json("category")
+    date_modified = "2024-08-20T10:03:07.108768+03:00"
+    category_ids = set()
+    for i in range(7):
+        category_id = "{}-{}-{}".format(
+            test_category["classification"]["id"][:8],
+            randint(1000, 9999),
+            i,
+        )
+        await get_category_collection().insert_one({**test_category, "_id": category_id, "dateModified": date_modified})
+        category_ids.add(category_id)
+
+    for reverse in ("", "&reverse=1"):
+        offset = quote("2024-08-20T10:03:07+03:00") if not reverse else quote("2024-08-20T10:03:08+03:00")
+        received = []
+        while True:
+            resp = await api.get(f"/api/categories?limit=2&offset={offset}{reverse}")
+            assert resp.status == 200
+            resp_json = await resp.json()
+            if not resp_json["data"]:
+                break
+            received.extend(i["id"] for i in resp_json["data"] if i["id"] in category_ids)
+            offset = quote(resp_json["next_page"]["offset"])
+
+        assert len(received) == len(category_ids)
+        assert set(received) == category_ids
+        assert received == sorted(received, reverse=bool(reverse))
+
+
 async def test_120_category_patch(api, category, tag):
     category_id = category["data"]["id"]
     patch_category_bad = {
@@ -1189,3 +1222,64 @@ async def test_category_criterion_patch_to_law922_scheme(api, mock_agreement):
     assert resp_json["errors"] == [
         "Input should be 'ESPD211' or 'LAW922': data.classification.scheme",
     ]
+
+
+async def test_category_cache_etag(api, category):
+    category_id = category["data"]["id"]
+    resp = await api.get(f"/api/categories/{category_id}")
+    assert resp.status == 200
+    etag = resp.headers["ETag"]
+
+    reset_metrics()
+    resp = await api.get(f"/api/categories/{category_id}", headers={"If-None-Match": etag})
+    assert resp.status == 304
+    resp = await api.get(f"/api/categories/{category_id}")
+    assert resp.status == 200
+    assert get_metrics()["cache_hits"] == {"category": 1}  # the rev is cached with the document
+
+    resp = await api.patch(
+        f"/api/categories/{category_id}",
+        json={"data": {"title": "changed"}, "access": category["access"]},
+        auth=TEST_AUTH,
+    )
+    assert resp.status == 200
+    assert category_cache.get_rev(category_id) is None
+
+    resp = await api.get(f"/api/categories/{category_id}", headers={"If-None-Match": etag})
+    assert resp.status == 200
+    assert (await resp.json())["data"]["title"] == "changed"
+    new_etag = resp.headers["ETag"]
+    assert new_etag != etag
+    stored = await get_category_collection().find_one({"_id": category_id})
+    assert category_cache.get_rev(category_id) == stored["_rev"]
+
+    resp = await api.get(f"/api/categories/{category_id}", headers={"If-None-Match": new_etag})
+    assert resp.status == 304
+
+
+async def test_category_msgpack(api, category):
+    category_id = category["data"]["id"]
+    resp = await api.get(f"/api/categories/{category_id}", headers={"Accept": MSGPACK_CONTENT_TYPE})
+    assert resp.status == 200
+    assert resp.headers["Content-Type"] == MSGPACK_CONTENT_TYPE
+    data = msgpack_loads(await resp.read())
+    json_resp = await api.get(f"/api/categories/{category_id}")
+    assert data == await json_resp.json()
+
+    resp = await api.patch(
+        f"/api/categories/{category_id}",
+        data=msgpack_dumps({"data": {"title": "msgpack"}, "access": category["access"]}),
+        headers={"Content-Type": MSGPACK_CONTENT_TYPE, "Accept": MSGPACK_CONTENT_TYPE},
+        auth=TEST_AUTH,
+    )
+    assert resp.status == 200
+    assert msgpack_loads(await resp.read())["data"]["title"] == "msgpack"
+
+    resp = await api.patch(
+        f"/api/categories/{category_id}",
+        data=b"\xc1",
+        headers={"Content-Type": MSGPACK_CONTENT_TYPE},
+        auth=TEST_AUTH,
+    )
+    assert resp.status == 400
+    assert await resp.json() == {"errors": ["Malformed msgpack"]}
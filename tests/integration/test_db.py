@@ -1,53 +1,118 @@
-from unittest.mock import AsyncMock, MagicMock
+from copy import deepcopy
+from types import SimpleNamespace
 
+import pytest
+from aiohttp.web import HTTPBadRequest
+from bson import ObjectId
 from bson.timestamp import Timestamp
-
-from catalog.db import wait_until_cluster_time_reached
-
-
-class IncrementingClusterTimeSession:
-    def __init__(self, start_time, target_time):
-        self._time = start_time
-        self._target = target_time
-        self.client = MagicMock()
-        self._ping_count = 0
-
-        # підставляємо ping, який змінює cluster_time
-        async def ping(*args, **kwargs):
-            self._ping_count += 1
-            if self._time.time < self._target.time:
-                self._time = Timestamp(self._time.time + 1, self._time.inc)
-            return {"ok": 1}
-
-        self.client.admin.command = AsyncMock(side_effect=ping)
-
-    async def __aenter__(self):
-        return self
-
-    async def __aexit__(self, exc_type, exc, tb):
-        pass
-
-    @property
-    def cluster_time(self):
-        return {"clusterTime": self._time}
-
-    def advance_cluster_time(self, val):
-        pass
-
-    def advance_operation_time(self, val):
-        pass
-
-    @property
-    def ping_count(self):
-        return self._ping_count
-
-
-async def test_wait_until_cluster_time_reached_retries():
-    start_time = Timestamp(1754313847, 1)
-    target_time = Timestamp(1754313850, 1)
-
-    session = IncrementingClusterTimeSession(start_time, target_time)
-
-    await wait_until_cluster_time_reached(session, {"clusterTime": target_time})
-
-    assert session.ping_count >= 3  # перевіряємо, що було щонайменше 3 ping'и
+from pymongo import ASCENDING
+
+from catalog.db import (
+    CausalReadsListener,
+    LazySession,
+    decode_offset,
+    encode_offset,
+    get_update_operations,
+)
+from catalog.indexes import apply_indexes, diff_indexes, get_index_stats
+from catalog.metrics import get_metrics, reset_metrics
+
+
+def test_causal_reads_listener():
+    reset_metrics()
+    listener = CausalReadsListener()
+    causal_read = SimpleNamespace(
+        connection_id=("localhost", 27017),
+        request_id=1,
+        command_name="find",
+        command={"find": "products", "readConcern": {"afterClusterTime": Timestamp(1754313850, 1)}},
+    )
+    listener.started(causal_read)
+    listener.started(SimpleNamespace(**{**vars(causal_read), "request_id": 2, "command": {"find": "products"}}))
+    listener.succeeded(SimpleNamespace(connection_id=("localhost", 27017), request_id=1, duration_micros=250000))
+    listener.succeeded(SimpleNamespace(connection_id=("localhost", 27017), request_id=2, duration_micros=1000))
+    assert get_metrics() == {"causal_reads_count": {"find": 1}, "causal_reads_seconds": {"find": 0.25}}
+    assert listener.pending == {}
+
+
+def test_lazy_session_time_validation():
+    with pytest.raises(TypeError):
+        LazySession(cluster_time={"clusterTime": 1})
+    with pytest.raises(TypeError):
+        LazySession(operation_time="1")
+    session = LazySession(
+        cluster_time={"clusterTime": Timestamp(1754313850, 1)},
+        operation_time=Timestamp(1754313850, 1),
+    )
+    assert session.session is None
+    assert not session.operation_time_advanced
+
+
+def test_offset_cursor():
+    date_modified = "2025-01-01T00:00:00.000001+02:00"
+    for uid in ("a" * 32, ObjectId()):
+        offset = encode_offset({"dateModified": date_modified, "id": uid})
+        assert "+" not in offset and "=" not in offset
+        assert decode_offset(offset) == (date_modified, uid)
+
+    # plain dateModified offsets still work
+    assert decode_offset("2025-01-01T00:00:00 02:00") == ("2025-01-01T00:00:00+02:00", None)
+
+    with pytest.raises(HTTPBadRequest):
+        decode_offset("1729285200.000000")
+
+
+def test_get_update_operations():
+    before = {
+        "title": "Product",
+        "status": "active",
+        "isActivated": 1,
+        "classification": {"id": "33600000-6", "scheme": "ДК021"},
+        "documents": [{"id": "1"}],
+        "requirementResponses": [{"requirement": "A", "value": 1}, {"requirement": "B", "value": 2}],
+        "expirationDate": "2025-01-01T00:00:00+02:00",
+    }
+    assert get_update_operations(before, deepcopy(before)) == {}
+
+    after = deepcopy(before)
+    after["title"] = "Updated"
+    after["isActivated"] = True
+    after["classification"]["id"] = "33600000-7"
+    after["documents"].append({"id": "2"})
+    after["requirementResponses"] = after["requirementResponses"][1:]
+    after["vendor"] = {"id": "v"}
+    del after["expirationDate"]
+    assert get_update_operations(before, after) == {
+        "$set": {
+            "title": "Updated",
+            "isActivated": True,
+            "classification.id": "33600000-7",
+            "requirementResponses": [{"requirement": "B", "value": 2}],
+            "vendor": {"id": "v"},
+        },
+        "$unset": {"expirationDate": ""},
+        "$push": {"documents": {"$each": [{"id": "2"}]}},
+    }
+
+
+async def test_indexes(db):
+    await apply_indexes(db)
+    diffs = await diff_indexes(db)
+    assert all(not indexes for diff in diffs.values() for indexes in diff.values())
+
+    await db.prices.create_index([("dateModified", ASCENDING)])
+    await db.tag.drop_index("name_1")
+    diffs = await diff_indexes(db)
+    assert diffs["prices"] == {"missing": [], "changed": [], "extra": ["dateModified_1"]}
+    assert diffs["tag"] == {"missing": ["name_1"], "changed": [], "extra": []}
+
+    rows = await get_index_stats(db)
+    stats = {(row["collection"], row["name"]): row for row in rows}
+    assert stats[("tag", "name_1")] == {"collection": "tag", "name": "name_1", "missing": True}
+    assert stats[("prices", "dateModified_1")]["declared"] is False
+    assert stats[("prices", "dateModified_1")]["redundant"] is True
+    assert stats[("prices", "dateModified_1__id_1")]["declared"] is True
+
+    await apply_indexes(db, drop=True)
+    diffs = await diff_indexes(db)
+    assert all(not indexes for diff in diffs.values() for indexes in diff.values())
@@ -0,0 +1,64 @@
+import asyncio
+import json
+from urllib.parse import quote
+
+from catalog.db import encode_offset, get_category_collection
+from tests.base import TEST_AUTH
+
+
+async def read_event(resp):
+    event = {}
+    while True:
+        line = (await asyncio.wait_for(resp.content.readline(), 5)).decode().rstrip("\n")
+        if not line:
+            if event:
+                return event
+            continue
+        if line.startswith(":"):  # heartbeat
+            continue
+        name, value = line.split(": ", 1)
+        event[name] = json.loads(value) if name == "data" else value
+
+
+async def test_feed(api, category):
+    resp = await api.get("/api/feed/unknown")
+    assert resp.status == 404
+
+    resp = await api.get("/api/feed/categories?offset=invalid")
+    assert resp.status == 400
+    assert await resp.json() == {"errors": ["Invalid offset: invalid"]}
+
+    category_id = category["data"]["id"]
+    date_modified = category["data"]["dateModified"]
+    resp = await api.get(f"/api/feed/categories?offset={quote('2020-01-01T00:00:00+02:00')}")
+    assert resp.status == 200
+    assert resp.headers["Content-Type"] == "text/event-stream"
+    assert "X-Request-ID" in resp.headers  # set once the stream is prepared
+
+    # stored changes
+    stored = await get_category_collection().find_one({"_id": category_id})
+    event = await read_event(resp)
+    assert event["data"] == {"id": category_id, "dateModified": date_modified, "rev": stored["_rev"]}
+    assert event["id"] == encode_offset({"id": category_id, "dateModified": date_modified})
+
+    # live changes
+    patch_resp = await api.patch(
+        f"/api/categories/{category_id}",
+        json={"data": {"title": "changed"}, "access": category["access"]},
+        auth=TEST_AUTH,
+    )
+    assert patch_resp.status == 200
+    stored = await get_category_collection().find_one({"_id": category_id})
+    event = await read_event(resp)
+    assert event["data"] == {"id": category_id, "dateModified": stored["dateModified"], "rev": stored["_rev"]}
+    resp.close()
+
+    # reconnect after the last received event
+    await get_category_collection().update_one({"_id": category_id}, {"$set": {"title": "not in feed"}})
+    resp = await api.get("/api/feed/categories", headers={"Last-Event-ID": event["id"]})
+    assert resp.status == 200
+    with_heartbeat = asyncio.create_task(read_event(resp))
+    await asyncio.sleep(0.5)
+    assert not with_heartbeat.done()
+    with_heartbeat.cancel()
+    resp.close()
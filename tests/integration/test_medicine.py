@@ -0,0 +1,41 @@
+import asyncio
+import json
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from catalog.medicine import MedicineRegistry, MedicineRegistryError
+
+
+async def test_medicine_registry_file(tmp_path):
+    (tmp_path / "atc.json").write_text(json.dumps({"data": {"A01": "x", "A02": "y"}}))
+    registry = MedicineRegistry(("ATC", "INN"), "http://localhost", refresh_interval=60, path=str(tmp_path))
+    assert await registry.get_ids("ATC") == frozenset({"A01", "A02"})
+
+    with pytest.raises(MedicineRegistryError):
+        await registry.get_ids("INN")
+
+
+async def test_medicine_registry_stale_while_revalidate():
+    registry = MedicineRegistry(("ATC",), "http://localhost", refresh_interval=60)
+    fetch = AsyncMock(return_value={"A01": "x"})
+    with patch.object(registry, "fetch", fetch), patch("catalog.medicine.time.monotonic", return_value=100):
+        # concurrent first requests share the loading
+        results = await asyncio.gather(registry.get_ids("ATC"), registry.get_ids("ATC"))
+        assert results == [frozenset({"A01"})] * 2
+        assert fetch.await_count == 1
+
+    fetch.return_value = {"A02": "x"}
+    with patch.object(registry, "fetch", fetch), patch("catalog.medicine.time.monotonic", return_value=170):
+        # the stale ids are returned while they are refreshed
+        assert await registry.get_ids("ATC") == frozenset({"A01"})
+        await asyncio.sleep(0)
+        assert await registry.get_ids("ATC") == frozenset({"A02"})
+        assert fetch.await_count == 2
+
+    # failed refresh keeps the loaded ids
+    fetch.side_effect = MedicineRegistryError("unavailable")
+    with patch.object(registry, "fetch", fetch), patch("catalog.medicine.time.monotonic", return_value=300):
+        assert await registry.get_ids("ATC") == frozenset({"A02"})
+        await asyncio.sleep(0)
+        assert await registry.get_ids("ATC") == frozenset({"A02"})
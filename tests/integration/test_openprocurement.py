@@ -0,0 +1,120 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+from aiohttp.web import HTTPBadRequest, HTTPServiceUnavailable
+
+from catalog.http_client import CircuitBreaker, CircuitOpenError
+from catalog.openprocurement import AgreementNotFound, OpenprocurementError, get_agreement, openprocurement_breaker
+from catalog.validations import validate_agreement
+
+AGREEMENT = {"id": "a" * 32, "status": "active", "classification": {"id": "33190000-8"}}
+CATEGORY = {"agreementID": "a" * 32, "classification": {"id": "33191110-9"}}
+
+
+async def test_agreement_cached(openprocurement_api):
+    openprocurement_api.agreements[AGREEMENT["id"]] = dict(AGREEMENT, title="Agreement")
+
+    await validate_agreement(CATEGORY)
+    agreement = await get_agreement(AGREEMENT["id"])
+    assert agreement == {"id": AGREEMENT["id"], "status": "active", "classification": {"id": "33190000-8"}}
+    assert openprocurement_api.agreement_requests == [AGREEMENT["id"]]
+
+    agreement["status"] = "terminated"  # cached copies can't be changed by callers
+    await validate_agreement(CATEGORY)
+
+
+async def test_agreement_errors(openprocurement_api):
+    with pytest.raises(HTTPBadRequest) as e:
+        await validate_agreement(CATEGORY)
+    assert e.value.text == "Agreement doesn't exist"
+
+    openprocurement_api.agreements[AGREEMENT["id"]] = dict(AGREEMENT, status="terminated")
+    with pytest.raises(HTTPBadRequest) as e:
+        await validate_agreement(CATEGORY)
+    assert e.value.text == "Agreement not in `active` status"
+
+    openprocurement_api.agreements["b" * 32] = 403
+    with pytest.raises(OpenprocurementError):
+        await get_agreement("b" * 32)
+    assert not openprocurement_breaker.failures
+
+
+async def test_agreement_circuit_breaker(openprocurement_api):
+    openprocurement_api.agreements[AGREEMENT["id"]] = 502
+    for _ in range(openprocurement_breaker.max_failures):
+        with pytest.raises(HTTPBadRequest) as e:
+            await validate_agreement(CATEGORY)
+        assert e.value.text == "Can't get agreement from openprocurement api, plz make request later"
+    assert openprocurement_breaker.is_open
+
+    # the api isn't requested until the reset timeout passes
+    with pytest.raises(HTTPServiceUnavailable) as e:
+        await validate_agreement(CATEGORY)
+    assert e.value.text == "Openprocurement api is unavailable, plz make request later"
+    assert len(openprocurement_api.agreement_requests) == openprocurement_breaker.max_failures
+
+    openprocurement_api.agreements[AGREEMENT["id"]] = AGREEMENT
+    with patch.object(openprocurement_breaker, "reset_timeout", 0):
+        await validate_agreement(CATEGORY)
+    assert not openprocurement_breaker.is_open
+
+
+async def test_agreement_api_unreachable(openprocurement_api):
+    with patch("catalog.openprocurement.OPENPROCUREMENT_API_URL", "http://127.0.0.1:1/api/2.5"):
+        with pytest.raises(OpenprocurementError):
+            await get_agreement(AGREEMENT["id"])
+    assert openprocurement_breaker.failures == 1
+
+
+def test_circuit_breaker_half_open():
+    breaker = CircuitBreaker("test", max_failures=2, reset_timeout=30)
+    breaker.on_failure()
+    breaker.before_call()
+    breaker.on_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    with patch("catalog.http_client.time.monotonic", return_value=breaker.opened_at + 30):
+        breaker.before_call()  # a single trial call
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+        breaker.on_failure()  # reopens at once
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+
+    with patch("catalog.http_client.time.monotonic", return_value=breaker.opened_at + 30):
+        breaker.before_call()
+        breaker.on_success()
+        breaker.before_call()
+    assert breaker.failures == 0
+
+
+async def test_circuit_breaker_trial_cancelled():
+    breaker = CircuitBreaker("test", max_failures=1, reset_timeout=30)
+    breaker.on_failure()
+    started = asyncio.Event()
+
+    async def trial():
+        async with breaker:
+            started.set()
+            await asyncio.sleep(60)
+
+    with patch("catalog.http_client.time.monotonic", return_value=breaker.opened_at + 30):
+        task = asyncio.create_task(trial())
+        await started.wait()
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        async with breaker:  # the next trial isn't rejected
+            breaker.on_success()
+    assert not breaker.is_open
+
+
+async def test_agreement_not_found(openprocurement_api):
+    with pytest.raises(AgreementNotFound):
+        await get_agreement(AGREEMENT["id"])
+    assert not openprocurement_breaker.failures
@@ -1,3 +1,4 @@
+import json
 from copy import deepcopy
 from urllib.parse import quote
 from uuid import uuid4
@@ -66,6 +67,38 @@ async def test_price_list_pagination(api, db):
     assert len(price_map) == 0
 
 
+async def test_price_list_ndjson(api, db):
+    test_price = api.get_fixture_json("price")
+    price_ids = []
+    for i in range(3):
+        price_copy = deepcopy(test_price)
+        price_copy["id"] = uuid4().hex
+        price_copy["dateModified"] = get_now().isoformat()
+        price_copy["dateCreated"] = get_now().isoformat()
+        await insert_object(get_prices_collection(), price_copy)
+        price_ids.append(price_copy["id"])
+
+    resp = await api.get("/api/prices?limit=2", headers={"Accept": "application/x-ndjson"})
+    assert resp.status == 200
+    assert resp.headers["Content-Type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in (await resp.text()).splitlines()]
+    assert [i["id"] for i in lines[:-1]] == price_ids[:2]
+    assert lines[0]["sampleSize"] == 50
+
+    json_resp = await api.get("/api/prices?limit=2")
+    json_data = await json_resp.json()
+    assert lines[:-1] == json_data["data"]
+    assert lines[-1] == {"next_page": json_data["next_page"]}
+
+    resp = await api.get(
+        "/api/prices?offset=" + quote(lines[-1]["next_page"]["offset"]),
+        headers={"Accept": "application/x-ndjson"},
+    )
+    lines = [json.loads(line) for line in (await resp.text()).splitlines()]
+    assert [i["id"] for i in lines[:-1]] == price_ids[2:]
+    assert "prev_page" in lines[-1]
+
+
 async def test_product_prices(api, product):
     product_id = product["data"]["id"]
     test_price = api.get_fixture_json("price")
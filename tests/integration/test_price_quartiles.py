@@ -0,0 +1,81 @@
+import random
+import statistics
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest.mock import patch
+
+import pytest
+
+from catalog.price_quartiles import WINDOW_QUARTILES_ENGINES, get_quartiles, iter_window_quartiles
+from seed.product_bids import SCENARIO_CONFIG
+
+
+def get_windows_by_filtering(parsed_bids, days, days_back):
+    """
+    Every window filtered and sorted from scratch, as calculate_price_for_product did before
+    """
+    for day in days:
+        start_day = day - timedelta(days=days_back - 1)
+        window_bids = [bid for bd, bid in parsed_bids if start_day <= bd.date() <= day]
+        amounts = sorted(Decimal(bid["amount"]) for bid in window_bids)
+        if len(amounts) < 3:
+            quartiles = get_quartiles(amounts)
+        else:
+            quartiles = tuple(statistics.quantiles(amounts, n=4))
+        latest = max(bd for bd, _ in parsed_bids if bd.date() == day)
+        yield day, latest, window_bids[0], len(amounts), quartiles
+
+
+def get_parsed_bids(bids):
+    return [(datetime.fromisoformat(bid["date"]), bid) for bid in sorted(bids, key=lambda bid: bid["date"])]
+
+
+def test_get_quartiles():
+    rnd = random.Random(0)
+    for n in range(3, 40):
+        choices = ["0", "0.01", "100", "100.00", str(rnd.randint(1, 10**9))]
+        amounts = sorted(Decimal(rnd.choice(choices)) for _ in range(n))
+        assert get_quartiles(amounts) == tuple(statistics.quantiles(amounts, n=4))
+    assert get_quartiles([Decimal(5)]) == (5, 5, 5)
+    assert get_quartiles([Decimal(5), Decimal(7)]) == (5, 5, 7)
+
+
+@pytest.mark.parametrize("scenario", SCENARIO_CONFIG, ids=[scenario[0] for scenario in SCENARIO_CONFIG])
+@pytest.mark.parametrize("days_back", [1, 7, 30])
+@pytest.mark.parametrize("engine", WINDOW_QUARTILES_ENGINES.values(), ids=WINDOW_QUARTILES_ENGINES.keys())
+def test_window_quartiles(scenario, days_back, engine):
+    _, _, generate_bids, base_price = scenario
+    random.seed(42)  # seed generators use the module state
+    parsed_bids = get_parsed_bids(generate_bids("a" * 32, base_price, "H87", "штука"))
+    days = sorted({bd.date() for bd, _ in parsed_bids})
+
+    for last_calculated_day in (None, days[len(days) // 2]):
+        if last_calculated_day:
+            days = [day for day in days if day > last_calculated_day]
+        windows = list(engine(parsed_bids, days, days_back))
+        expected = list(get_windows_by_filtering(parsed_bids, days, days_back))
+        assert len(windows) == len(expected) == len(days)
+        for window, (day, latest, bid, sample_size, quartiles) in zip(windows, expected):
+            assert (window.day, window.date, window.sample_size) == (day, latest, sample_size)
+            assert window.bid is bid
+            # same digits, not only equal values
+            assert [str(q) for q in (window.lower, window.median, window.upper)] == [str(q) for q in quartiles]
+
+
+@pytest.mark.skipif("numpy" not in WINDOW_QUARTILES_ENGINES, reason="numpy isn't installed")
+def test_numpy_window_quartiles():
+    rnd = random.Random(0)
+    start = datetime.fromisoformat("2025-01-01T10:00:00+02:00")
+    bids = [
+        {
+            "date": (start + timedelta(days=rnd.randint(0, 60), minutes=rnd.randint(0, 600))).isoformat(),
+            "amount": Decimal(rnd.choice(["10", "10.00", "10.5", "3000000000.01", str(rnd.randint(1, 10**6) / 100)])),
+        }
+        for _ in range(2000)
+    ]
+    parsed_bids = get_parsed_bids(bids)
+    days = sorted({bd.date() for bd, _ in parsed_bids})
+    with patch("catalog.price_quartiles.NUMPY_CHUNK_CELLS", 1000):  # many chunks of the dense windows
+        windows = list(WINDOW_QUARTILES_ENGINES["numpy"](parsed_bids, days, 7))
+    assert windows == list(iter_window_quartiles(parsed_bids, days, 7))
+    assert [str(w.median) for w in windows] == [str(w.median) for w in iter_window_quartiles(parsed_bids, days, 7)]
@@ -1,8 +1,8 @@
 from copy import deepcopy
 from datetime import timedelta
-from unittest.mock import AsyncMock, patch
 from urllib.parse import quote
 
+from catalog.db import get_products_collection, get_revisions_collection
 from catalog.doc_service import generate_test_url
 from catalog.settings import CPB_USERNAME
 from catalog.utils import get_now
@@ -148,7 +148,7 @@ async def test_requirement_response_carries_data_schema(api, category):
             assert "dataSchema" not in rr
 
 
-async def test_420_product_patch(api, category, profile, product):
+async def test_420_product_patch(api, category, profile, product, mock_medicine_registry):
     product_id = product["data"]["id"]
 
     resp = await api.get(f"/api/products/{product_id}")
@@ -246,27 +246,23 @@ async def test_420_product_patch(api, category, profile, product):
             }
         ]
     }
-    with patch("catalog.validations.CachedSession.get") as medicine_resp:
-        medicine_resp.return_value = AsyncMock()
-        medicine_resp.return_value.__aenter__.return_value.status = 200
-        medicine_resp.return_value.__aenter__.return_value.json.return_value = {"data": {"foo": "bar"}}
-        resp = await api.patch(f"/api/products/{product_id}", json=patch_product, auth=TEST_AUTH)
-        assert resp.status == 400
-        assert {"errors": ["values {'test'} don't exist in ATC dictionary"]} == await resp.json()
-
-        patch_product["data"]["additionalClassifications"][0]["id"] = "foo"
-        resp = await api.patch(f"/api/products/{product_id}", json=patch_product, auth=TEST_AUTH)
-        assert resp.status == 200
+    resp = await api.patch(f"/api/products/{product_id}", json=patch_product, auth=TEST_AUTH)
+    assert resp.status == 400
+    assert {"errors": ["values {'test'} don't exist in ATC dictionary"]} == await resp.json()
 
-        patch_product["data"]["expirationDate"] = (get_now() - timedelta(minutes=1)).isoformat()
-        resp = await api.patch(f"/api/products/{product_id}", json=patch_product, auth=TEST_AUTH)
-        assert resp.status == 400
-        response = await resp.json()
-        assert "Value error, should be greater than now: data.ProductUpdateData.expirationDate" == response["errors"][0]
+    patch_product["data"]["additionalClassifications"][0]["id"] = "foo"
+    resp = await api.patch(f"/api/products/{product_id}", json=patch_product, auth=TEST_AUTH)
+    assert resp.status == 200
 
-        patch_product["data"]["expirationDate"] = (get_now() + timedelta(days=1)).isoformat()
-        resp = await api.patch(f"/api/products/{product_id}", json=patch_product, auth=TEST_AUTH)
-        assert resp.status == 200
+    patch_product["data"]["expirationDate"] = (get_now() - timedelta(minutes=1)).isoformat()
+    resp = await api.patch(f"/api/products/{product_id}", json=patch_product, auth=TEST_AUTH)
+    assert resp.status == 400
+    response = await resp.json()
+    assert "Value error, should be greater than now: data.ProductUpdateData.expirationDate" == response["errors"][0]
+
+    patch_product["data"]["expirationDate"] = (get_now() + timedelta(days=1)).isoformat()
+    resp = await api.patch(f"/api/products/{product_id}", json=patch_product, auth=TEST_AUTH)
+    assert resp.status == 200
 
     # try to hide product without patching additionalClassifications snd without medicine validation
     # try edit product with master access
@@ -283,6 +279,92 @@ async def test_420_product_patch(api, category, profile, product):
     assert resp_json["data"]["status"] == "hidden"
 
 
+async def test_product_revisions(api, product):
+    product_id = product["data"]["id"]
+
+    resp = await api.patch(
+        f"/api/products/{product_id}",
+        json={"data": {"title": "Updated title"}, "access": product["access"]},
+        auth=TEST_AUTH,
+    )
+    assert resp.status == 200, await resp.json()
+
+    # history isn't stored inside the document anymore
+    doc = await get_products_collection().find_one({"_id": product_id})
+    assert "revisions" not in doc
+
+    resp = await api.get(f"/api/products/{product_id}/revisions")
+    assert resp.status == 200, await resp.json()
+    revisions = (await resp.json())["data"]
+    assert len(revisions) == 2
+    assert revisions[0]["newRev"] == revisions[1]["rev"]
+    assert revisions[1]["newRev"] == doc["_rev"]
+    assert {"op": "replace", "path": "/title", "value": product["data"]["title"]} in revisions[1]["changes"]
+
+    resp = await api.get("/api/products/unknown/revisions")
+    assert resp.status == 404, await resp.json()
+
+
+async def test_product_revisions_private_fields(api, product):
+    product_id = product["data"]["id"]
+    stored = await get_revisions_collection().find({"objectId": product_id}).to_list(None)
+    assert any(change["path"].startswith("/access") for revision in stored for change in revision["changes"])
+
+    resp = await api.get(f"/api/products/{product_id}/revisions")
+    assert resp.status == 200, await resp.json()
+    revisions = (await resp.json())["data"]
+    assert revisions
+    for revision in revisions:
+        assert "author" not in revision
+        assert not [change for change in revision["changes"] if change["path"].startswith("/access")]
+    assert "access" not in await resp.text()
+
+
+async def test_product_etag(api, category, product):
+    product_id = product["data"]["id"]
+    resp = await api.get(f"/api/products/{product_id}")
+    assert resp.status == 200
+    etag = resp.headers["ETag"]
+    doc = await get_products_collection().find_one({"_id": product_id})
+    assert etag.startswith(f'"{doc["_rev"]}.')
+
+    resp = await api.get(f"/api/products/{product_id}", headers={"If-None-Match": etag})
+    assert resp.status == 304
+    assert resp.headers["ETag"] == etag
+    assert await resp.read() == b""
+
+    resp = await api.get(
+        f"/api/products/{product_id}", headers={"If-None-Match": etag, "Accept": "application/msgpack"}
+    )
+    assert resp.status == 200
+    assert resp.headers["ETag"] != etag
+
+    # the product is served with the requirements of its category
+    resp = await api.patch(
+        f"/api/categories/{category['data']['id']}",
+        json={"data": {"title": "changed"}, "access": category["access"]},
+        auth=TEST_AUTH,
+    )
+    assert resp.status == 200
+    resp = await api.get(f"/api/products/{product_id}", headers={"If-None-Match": etag})
+    assert resp.status == 200
+    new_etag = resp.headers["ETag"]
+    assert new_etag != etag
+
+    resp = await api.patch(
+        f"/api/products/{product_id}",
+        json={"data": {"title": "Updated title"}, "access": product["access"]},
+        auth=TEST_AUTH,
+    )
+    assert resp.status == 200
+    resp = await api.get(f"/api/products/{product_id}", headers={"If-None-Match": new_etag})
+    assert resp.status == 200
+    assert resp.headers["ETag"] != new_etag
+
+    resp = await api.get("/api/products/unknown", headers={"If-None-Match": etag})
+    assert resp.status == 404
+
+
 async def test_product_patch_after_termination_status(api, product, category):
     product_id = product["data"]["id"]
 
@@ -0,0 +1,56 @@
+from catalog.profile_matching import ProfileMatcher, get_required_titles
+from catalog.requirements import RequirementIndex
+from catalog.settings import LOCALIZATION_CRITERIA
+
+LOCALIZATION = {
+    "classification": {"id": LOCALIZATION_CRITERIA},
+    "requirementGroups": [
+        {"id": "g1", "requirements": [{"title": "local", "dataType": "number", "minValue": 25}]},
+        {"id": "g2", "requirements": [{"title": "origin", "dataType": "string", "expectedValues": ["UA"]}]},
+    ],
+}
+
+
+def get_profile(profile_id, *requirements):
+    return {
+        "_id": profile_id,
+        "criteria": [
+            {"classification": {"id": "CRITERION.OTHER"}, "requirementGroups": [{"requirements": list(requirements)}]},
+            LOCALIZATION,
+        ],
+    }
+
+
+def get_product(**values):
+    return {"requirementResponses": [{"requirement": title, "value": value} for title, value in values.items()]}
+
+
+def test_required_titles():
+    assert get_required_titles(RequirementIndex(get_profile("a", {"title": "code"})["criteria"])) == {"code"}
+    assert get_required_titles(RequirementIndex([{"classification": {"id": LOCALIZATION_CRITERIA}}])) is None
+
+
+def test_profile_matcher():
+    matcher = ProfileMatcher(
+        [
+            get_profile("code", {"title": "code", "dataType": "string", "pattern": "^[A-Z]{2}$"}),
+            get_profile("weight", {"title": "weight", "dataType": "number", "minValue": 1, "maxValue": 10}),
+            get_profile(
+                "both",
+                {"title": "weight", "dataType": "number", "maxValue": 5},
+                {"title": "code", "dataType": "string", "expectedValue": "UA"},
+            ),
+            {"_id": "empty", "criteria": []},
+        ]
+    )
+    assert len(matcher) == 3
+    assert sorted(matcher.by_title) == ["code", "weight"]
+
+    assert matcher.match(get_product(code="UA", weight=4, local=30)) == ["code", "weight", "both"]
+    assert matcher.match(get_product(code="UA", weight=8, local=30)) == ["code", "weight"]
+    assert matcher.match(get_product(code="UKR", local=30)) == []
+    # exactly one of the localization groups
+    assert matcher.match(get_product(code="UA", local=30, origin="UA")) == []
+    assert matcher.match(get_product(weight=4)) == []
+    # candidates are found once per set of the responded titles
+    assert len(matcher._candidates) == 4
@@ -4,7 +4,8 @@ from unittest.mock import AsyncMock, patch
 from urllib.parse import quote
 from uuid import uuid4
 
-from catalog.db import get_category_collection
+from catalog.db import category_cache, get_category_collection
+from catalog.medicine import MedicineRegistryError, medicine_registry
 from tests.base import TEST_AUTH, TEST_AUTH_ANOTHER, TEST_AUTH_NO_PERMISSION
 
 
@@ -75,7 +76,7 @@ async def create_blank_criterion(api, profile):
     return criterion_id, rg_id
 
 
-async def test_310_profile_create(api, category):
+async def test_310_profile_create(api, category, mock_medicine_registry):
     category_id = category["data"]["id"]
     profile_id = "{}-{}".format(randint(100000, 900000), category_id)
 
@@ -127,20 +128,17 @@ async def test_310_profile_create(api, category):
         }
     ]
 
-    with patch("catalog.validations.CachedSession.get") as medicine_resp:
-        medicine_resp.return_value = AsyncMock()
-        medicine_resp.return_value.__aenter__.return_value.status = 200
-        medicine_resp.return_value.__aenter__.return_value.json.return_value = {"data": {"foo": "bar"}}
-        resp = await api.put(f"/api/profiles/{profile_id}", json=invalid_profile, auth=TEST_AUTH)
-        assert resp.status == 400
-        assert {"errors": ["values {'test'} don't exist in ATC dictionary"]} == await resp.json()
-
-        medicine_resp.return_value.__aenter__.return_value.status = 400
-        resp = await api.put(f"/api/profiles/{profile_id}", json=invalid_profile, auth=TEST_AUTH)
-        assert resp.status == 400
-        assert {
-            "errors": ["Can't get classification ATC from medicine registry, please make request later"]
-        } == await resp.json()
+    resp = await api.put(f"/api/profiles/{profile_id}", json=invalid_profile, auth=TEST_AUTH)
+    assert resp.status == 400
+    assert {"errors": ["values {'test'} don't exist in ATC dictionary"]} == await resp.json()
+
+    medicine_registry.clear()
+    mock_medicine_registry.side_effect = MedicineRegistryError("ATC registry response status 400")
+    resp = await api.put(f"/api/profiles/{profile_id}", json=invalid_profile, auth=TEST_AUTH)
+    assert resp.status == 400
+    assert {
+        "errors": ["Can't get classification ATC from medicine registry, please make request later"]
+    } == await resp.json()
 
     # test data type
     for criteria in resp_json["data"]["criteria"]:
@@ -173,6 +171,7 @@ async def test_310_profile_create(api, category):
     test_profile["data"]["dateModified"] = test_date_modified
 
     await get_category_collection().find_one_and_update({"_id": category_id}, {"$unset": {"agreementID": ""}})
+    category_cache.invalidate(category_id)  # as the change stream watcher does, but at once
     profile_id = "{}-{}".format(randint(100000, 900000), category_id)
     test_profile_copy["data"]["id"] = profile_id
     resp = await api.put("/api/profiles/%s" % profile_id, json=test_profile_copy, auth=TEST_AUTH)
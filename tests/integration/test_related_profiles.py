@@ -0,0 +1,145 @@
+from copy import deepcopy
+from unittest.mock import patch
+
+from catalog.db import get_products_collection
+from catalog.related_profiles import (
+    set_product_related_profiles,
+    update_profile_products,
+    update_written_profile_products,
+)
+from catalog.settings import LOCALIZATION_CRITERIA
+from cron.related_profiles_task import Counters, update_products
+from tests.base import TEST_AUTH
+
+PROFILE = {
+    "_id": "p" * 32,
+    "_rev": "1-" + "0" * 32,
+    "relatedCategory": "c" * 32,
+    "status": "active",
+    "criteria": [
+        {
+            "classification": {"id": "CRITERION.OTHER"},
+            "requirementGroups": [
+                {"requirements": [{"title": "code", "dataType": "string", "pattern": "^[A-Z]{2}$"}]},
+            ],
+        },
+        {
+            "classification": {"id": LOCALIZATION_CRITERIA},
+            "requirementGroups": [
+                {"requirements": [{"title": "local", "dataType": "number", "minValue": 25}]},
+            ],
+        },
+    ],
+}
+
+
+def get_product(product_id, code, **kwargs):
+    return {
+        "_id": product_id,
+        "relatedCategory": "c" * 32,
+        "status": "active",
+        "dateModified": "2025-01-01T00:00:00+02:00",
+        "requirementResponses": [{"requirement": "code", "value": code}, {"requirement": "local", "value": 30}],
+        **kwargs,
+    }
+
+
+async def test_update_profile_products(db):
+    await db.products.insert_many(
+        [
+            get_product("1" * 32, "UA"),
+            get_product("2" * 32, "UKR", relatedProfiles=["p" * 32, "x" * 32]),
+            get_product("3" * 32, "UA", relatedProfiles=["x" * 32]),
+            get_product("4" * 32, "UA", status="hidden"),
+        ]
+    )
+
+    assert await update_profile_products(PROFILE) == 3
+    products = {p["_id"]: p async for p in db.products.find({})}
+    assert products["1" * 32]["relatedProfiles"] == ["p" * 32]
+    assert products["1" * 32]["dateModified"] != "2025-01-01T00:00:00+02:00"
+    assert products["1" * 32]["_rev"].startswith("2-")
+    assert products["2" * 32]["relatedProfiles"] == ["x" * 32]
+    assert products["3" * 32]["relatedProfiles"] == ["x" * 32, "p" * 32]
+    assert "relatedProfiles" not in products["4" * 32]
+
+    assert await update_profile_products(PROFILE) == 0
+
+    # renamed document of a hidden profile
+    profile = {key: value for key, value in PROFILE.items() if key not in ("_id", "_rev")}
+    assert await update_profile_products({**profile, "id": "p" * 32, "status": "hidden"}) == 2
+    products = {p["_id"]: p async for p in db.products.find({})}
+    assert products["1" * 32]["relatedProfiles"] == []
+    assert products["3" * 32]["relatedProfiles"] == ["x" * 32]
+
+
+async def test_update_written_profile_products(db):
+    await db.products.insert_many([get_product(str(i) * 32, "UA") for i in range(1, 4)])
+
+    # the rest are left to related_profiles_task
+    with patch("catalog.related_profiles.RELATED_PROFILES_REQUEST_LIMIT", 2):
+        await update_written_profile_products(PROFILE)
+    assert await db.products.count_documents({"relatedProfiles": "p" * 32}) == 2
+    assert await update_profile_products(PROFILE) == 1
+
+    # the profile is saved already
+    with patch("catalog.related_profiles.ProfileMatcher", side_effect=ValueError):
+        await update_written_profile_products({**PROFILE, "status": "active"})
+
+
+async def test_set_product_related_profiles(db):
+    await db.profiles.insert_one(PROFILE)
+
+    product = get_product("1" * 32, "UA")
+    await set_product_related_profiles(product)
+    assert product["relatedProfiles"] == ["p" * 32]
+
+    product = get_product("2" * 32, "UKR")
+    await set_product_related_profiles(product)
+    assert "relatedProfiles" not in product
+
+    product = get_product("3" * 32, "UA", status="hidden")
+    await set_product_related_profiles(product)
+    assert "relatedProfiles" not in product
+
+
+async def test_product_etag_related_profiles(api, profile, product):
+    product_id = product["data"]["id"]
+    profile_id = profile["data"]["id"]
+    resp = await api.get(f"/api/products/{product_id}")
+    assert (await resp.json())["data"]["relatedProfiles"] == [profile_id]
+    etag = resp.headers["ETag"]
+
+    # the product doesn't meet the changed requirement
+    criterion = profile["data"]["criteria"][0]
+    group = criterion["requirementGroups"][0]
+    requirement = next(r for r in group["requirements"] if r["title"] == "Три шари або більше")
+    resp = await api.patch(
+        f"/api/profiles/{profile_id}/criteria/{criterion['id']}/requirementGroups/{group['id']}"
+        f"/requirements/{requirement['id']}",
+        json={"data": {"minValue": 5}, "access": profile["access"]},
+        auth=TEST_AUTH,
+    )
+    assert resp.status == 200, await resp.json()
+
+    resp = await api.get(f"/api/products/{product_id}", headers={"If-None-Match": etag})
+    assert resp.status == 200
+    assert (await resp.json())["data"]["relatedProfiles"] == []
+    assert resp.headers["ETag"] != etag
+    stored = await get_products_collection().find_one({"_id": product_id})
+    assert resp.headers["ETag"].startswith(f'"{stored["_rev"]}.')
+
+
+async def test_update_products_written_meanwhile(db):
+    products = [get_product(str(i) * 32, "UA", _rev=f"1-{i}") for i in range(1, 3)]
+    await db.products.insert_many(deepcopy(products))
+    # patched since the task read it
+    await db.products.update_one({"_id": "2" * 32}, {"$set": {"_rev": "2-2", "relatedProfiles": []}})
+
+    counters = Counters()
+    await update_products([PROFILE], products, counters, executor=None)
+    assert counters.succeeded_products == 1
+    stored = {p["_id"]: p async for p in db.products.find({})}
+    assert stored["1" * 32]["relatedProfiles"] == ["p" * 32]
+    assert stored["2" * 32]["relatedProfiles"] == []
+    assert stored["2" * 32]["_rev"] == "2-2"
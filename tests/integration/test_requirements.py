@@ -0,0 +1,94 @@
+import re
+
+import pytest
+
+from catalog.metrics import get_metrics, reset_metrics
+from catalog.requirements import RequirementIndex, RequirementIndexCache, get_requirement_index
+from catalog.serializers.product import set_field_from_requirements
+from catalog.settings import LOCALIZATION_CRITERIA
+
+CRITERIA = [
+    {
+        "classification": {"id": LOCALIZATION_CRITERIA},
+        "requirementGroups": [
+            {"id": "g1", "requirements": [{"title": "local", "dataType": "number", "minValue": 25}]},
+            {"id": "g2", "requirements": [{"title": "origin", "dataType": "string", "expectedValues": ["UA"]}]},
+        ],
+    },
+    {
+        "classification": {"id": "CRITERION.OTHER"},
+        "requirementGroups": [
+            {
+                "id": "g3",
+                "requirements": [
+                    {"title": "code", "dataType": "string", "pattern": "^[A-Z]{2}$"},
+                    {"title": "broken", "dataType": "string", "pattern": "["},
+                    {"title": "weight", "dataType": "number", "minValue": "light", "maxValue": 10},
+                ],
+            },
+        ],
+    },
+]
+
+
+def test_requirement_index():
+    index = RequirementIndex(CRITERIA)
+    assert len(index) == 5
+    assert "local" in index
+    assert index.get("unknown") is None
+    assert index.groups["origin"] == "g2"
+    assert index.classifications["code"] == {"id": "CRITERION.OTHER"}
+    assert index.classification_ids == {LOCALIZATION_CRITERIA, "CRITERION.OTHER"}
+    assert index.data_types["local"] == (float, int)
+    assert index.bounds == {"local": (25.0, None), "weight": (None, 10.0)}
+    assert index.patterns["code"]("UA")
+    assert not index.patterns["code"]("UKR")
+    with pytest.raises(re.error):
+        index.patterns["broken"]("x")
+
+    # one localization group and all the groups of the other criteria
+    assert index.meets_criteria({"local", "code", "broken", "weight"})
+    assert not index.meets_criteria({"local", "origin", "code", "broken", "weight"})
+    assert not index.meets_criteria({"local", "code"})
+
+    # the index doesn't share dicts with the document
+    criteria = [{"requirementGroups": [{"requirements": [{"title": "a"}]}]}]
+    index = RequirementIndex(criteria)
+    criteria[0]["requirementGroups"][0]["requirements"][0]["title"] = "b"
+    assert index.get("a") == {"title": "a"}
+
+
+def test_requirement_index_cache():
+    reset_metrics()
+    cache = RequirementIndexCache("test", max_size=1)
+    category = {"id": "c1", "rev": "1-a", "criteria": CRITERIA}
+    index = cache.get(category)
+    assert cache.get(category) is index
+    assert cache.get({"_id": "c1", "_rev": "1-a", "criteria": CRITERIA}) is index
+
+    # a new rev is a new index, the old one is evicted
+    assert cache.get({**category, "rev": "2-b"}) is not index
+    assert len(cache) == 1
+
+    # without rev the index isn't cached
+    assert cache.get({"id": "c2", "criteria": CRITERIA}) is not cache.get({"id": "c2", "criteria": CRITERIA})
+    assert len(cache) == 1
+
+    metrics = get_metrics()
+    assert metrics["cache_hits"] == {"test": 2}
+    assert metrics["cache_misses"] == {"test": 2}
+    assert metrics["cache_evictions"] == {"test": 1}
+
+
+def test_set_field_from_requirements_copies():
+    criteria = [{**CRITERIA[1], "requirementGroups": [{"id": "g3", "requirements": [{"title": "code", "unit": {}}]}]}]
+    criteria[0]["requirementGroups"][0]["requirements"][0]["unit"] = {"code": "KGM", "name": "кілограм"}
+    category = {"id": "c-copies", "rev": "1-a", "criteria": criteria}
+    response = [{"requirement": "code", "value": "UA"}]
+    set_field_from_requirements(category, response)
+    response[0]["classification"]["id"] = "changed"
+    response[0]["unit"]["code"] = "changed"
+
+    index = get_requirement_index(category)
+    assert index.classifications["code"] == {"id": "CRITERION.OTHER"}
+    assert index.get("code")["unit"] == {"code": "KGM", "name": "кілограм"}
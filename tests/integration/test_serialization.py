@@ -0,0 +1,58 @@
+from datetime import datetime
+from decimal import Decimal
+from pathlib import Path
+from uuid import UUID
+
+import pytest
+from bson import ObjectId
+
+from catalog.serialization import JSON_ENCODERS, json_dumps, msgpack_dumps, msgpack_loads, stdlib_dumps
+from tests.utils import get_fixture_json
+
+FIXTURES = sorted(p.stem for p in (Path(__file__).parent.parent / "fixtures").glob("*.json"))
+
+
+@pytest.mark.parametrize("encoder", sorted(JSON_ENCODERS))
+def test_json_encoders_output(encoder):
+    dumps = JSON_ENCODERS[encoder]
+    for name in FIXTURES:
+        data = get_fixture_json(name)
+        assert dumps(data) == stdlib_dumps(data), name
+
+    data = {
+        "Київ": "Київ /   \x00 \x7f",
+        "date": datetime.fromisoformat("2025-01-01T00:00:00.000001+02:00"),
+        "naive": datetime(2025, 1, 1),
+        "decimals": [Decimal("1.10"), Decimal("1e-9"), Decimal("12345678901234567890.5")],
+        "floats": [0.1, 1e-7, 1e22, 1e16, -0.0, float("nan")],
+        "ids": [ObjectId("66c45a7f9f5b3c0b8c1d2e3f"), UUID("0f9ba4f6-8e8d-4a6c-9f0f-2b7d8a7b1c11")],
+        "set": {"b", "a"},
+        "tuple": (1, 2),
+        "bigint": 2**70,
+        1: None,
+    }
+    assert dumps(data) == stdlib_dumps(data)
+
+    with pytest.raises(TypeError):
+        dumps({"bytes": b"x"})
+
+
+def test_json_dumps_kwargs():
+    assert json_dumps({"b": Decimal("1"), "a": 1}, sort_keys=True) == '{"a": 1, "b": 1.0}'
+
+
+def test_msgpack_round_trip():
+    for name in FIXTURES:
+        data = get_fixture_json(name)
+        assert msgpack_loads(msgpack_dumps(data)) == data, name
+
+    data = {
+        "date": datetime.fromisoformat("2025-01-01T00:00:00.000001+02:00"),
+        "decimal": Decimal("1.10"),
+        "id": ObjectId("66c45a7f9f5b3c0b8c1d2e3f"),
+        "set": {"a"},
+    }
+    result = msgpack_loads(msgpack_dumps(data))
+    assert result == {**data, "id": "66c45a7f9f5b3c0b8c1d2e3f", "set": ["a"]}
+    assert str(result["decimal"]) == "1.10"
+    assert result["date"].utcoffset() == data["date"].utcoffset()
@@ -0,0 +1,43 @@
+from catalog.serializers.base import BaseSerializer, ListSerializer, RootSerializer
+
+
+def upper_serializer(obj, value, **kwargs):
+    return value.upper() + kwargs.get("suffix", "")
+
+
+class ItemSerializer(BaseSerializer):
+    whitelist = {"title", "size"}
+    serializers = {"title": upper_serializer}
+
+
+class ParentSerializer(RootSerializer):
+    serializers = {"items": ListSerializer(ItemSerializer)}
+    calculated = {"count": lambda data: len(data["items"]) if data.get("items") else None}
+
+
+def test_serializer_plan():
+    data = {
+        "id": "1",
+        "rev": "1-a",
+        "access": {"owner": "broker", "token": "secret"},
+        "items": [{"title": "a", "size": 1, "hidden": True}],
+    }
+    assert ParentSerializer(data, suffix="!").data == {
+        "id": "1",
+        "items": [{"title": "A!", "size": 1}],
+        "owner": "broker",
+        "count": 1,
+    }
+    # kwargs of a call don't leak into the next ones through the shared ListSerializer
+    assert ParentSerializer({"items": [{"title": "b"}]}).data == {"items": [{"title": "B"}], "count": 1}
+    assert ParentSerializer({"items": []}).data == {"items": None}
+
+
+def test_serializer_plan_recompile():
+    class Serializer(BaseSerializer):
+        serializers = {}
+
+    Serializer.serializers = {"title": upper_serializer}
+    assert Serializer({"title": "a"}).data == {"title": "a"}
+    Serializer.compile_plan()
+    assert Serializer({"title": "a"}).data == {"title": "A"}
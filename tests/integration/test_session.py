@@ -0,0 +1,39 @@
+from tests.base import TEST_AUTH
+
+
+async def test_session_cookie(api, category):
+    resp = await api.get("/api/ping")
+    assert resp.status == 200
+    assert "SESSION" not in resp.cookies
+
+    resp = await api.patch(
+        f"/api/categories/{category['data']['id']}",
+        json={"data": {"title": "changed"}, "access": category["access"]},
+        auth=TEST_AUTH,
+    )
+    assert resp.status == 200
+    assert "SESSION" in resp.cookies
+
+    # the cookie is sent back
+    resp = await api.get(f"/api/categories/{category['data']['id']}")
+    assert resp.status == 200
+    assert "X-Warning" not in resp.headers
+    assert (await resp.json())["data"]["title"] == "changed"
+
+    api.session.cookie_jar.clear()
+    resp = await api.get(f"/api/categories/{category['data']['id']}", cookies={"SESSION": "invalid"})
+    assert resp.status == 200
+    assert resp.headers["X-Warning"].startswith('199 - "Error on SESSION cookie parsing')
+
+
+async def test_streamed_response_headers(api):
+    # the ndjson page is sent before the middlewares get the response back
+    resp = await api.get(
+        "/api/prices",
+        headers={"Accept": "application/x-ndjson", "X-Request-ID": "test-request-id"},
+        cookies={"SESSION": "invalid"},
+    )
+    assert resp.status == 200
+    assert resp.headers["Content-Type"] == "application/x-ndjson"
+    assert resp.headers["X-Request-ID"] == "test-request-id"
+    assert resp.headers["X-Warning"].startswith('199 - "Error on SESSION cookie parsing')
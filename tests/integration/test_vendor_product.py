@@ -1,6 +1,5 @@
 from copy import deepcopy
 from datetime import datetime
-from unittest.mock import AsyncMock, patch
 
 from catalog.doc_service import generate_test_url
 from catalog.models.product import VendorProductIdentifierScheme
@@ -11,7 +10,7 @@ from tests.conftest import set_requirements_to_responses
 from tests.utils import create_criteria, create_profile
 
 
-async def test_vendor_product_create(api, vendor, category, profile):
+async def test_vendor_product_create(api, vendor, category, profile, mock_medicine_registry):
     category_id = category["data"]["id"]
     category_token = category["access"]["token"]
 
@@ -118,17 +117,13 @@ async def test_vendor_product_create(api, vendor, category, profile):
             "scheme": "ATC",
         }
     ]
-    with patch("catalog.validations.CachedSession.get") as medicine_resp:
-        medicine_resp.return_value = AsyncMock()
-        medicine_resp.return_value.__aenter__.return_value.status = 200
-        medicine_resp.return_value.__aenter__.return_value.json.return_value = {"data": {"foo": "bar"}}
-        resp = await api.post(
-            f'/api/vendors/{vendor["id"]}/products?access_token={vendor_token}',
-            json={"data": invalid_product},
-            auth=TEST_AUTH,
-        )
-        assert resp.status == 400
-        assert {"errors": ["values {'test'} don't exist in ATC dictionary"]} == await resp.json()
+    resp = await api.post(
+        f'/api/vendors/{vendor["id"]}/products?access_token={vendor_token}',
+        json={"data": invalid_product},
+        auth=TEST_AUTH,
+    )
+    assert resp.status == 400
+    assert {"errors": ["values {'test'} don't exist in ATC dictionary"]} == await resp.json()
 
     resp = await api.patch(
         f"/api/categories/{category_id}?access_token={category_token}",
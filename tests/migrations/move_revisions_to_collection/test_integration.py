@@ -0,0 +1,41 @@
+from copy import deepcopy
+from uuid import uuid4
+
+from catalog.db import get_revisions_collection
+from catalog.migrations.move_revisions_to_collection import migrate_collection_revisions
+from tests.utils import get_fixture_json
+
+
+async def test_migrate(db):
+    product = deepcopy(get_fixture_json("product"))
+    revisions = [
+        {"author": "test.prozorro.ua", "changes": [], "rev": None, "date": "2025-01-01T00:00:00+02:00"},
+        {
+            "author": "test.prozorro.ua",
+            "changes": [{"op": "replace", "path": "/title", "value": "Old title"}],
+            "rev": "2-" + uuid4().hex,
+            "date": "2025-01-02T00:00:00+02:00",
+        },
+    ]
+    product_1 = {**product, "_id": uuid4().hex, "revisions": revisions}
+    await db.products.insert_one(product_1)
+    product_2 = {**product, "_id": uuid4().hex}
+    await db.products.insert_one(product_2)
+
+    await migrate_collection_revisions("products")
+
+    product_1_data = await db.products.find_one({"_id": product_1["_id"]})
+    assert "revisions" not in product_1_data
+    migrated = (
+        await get_revisions_collection()
+        .find({"objectId": product_1["_id"]}, projection={"_id": False})
+        .sort("date", 1)
+        .to_list(None)
+    )
+    assert migrated == [{**r, "objectId": product_1["_id"], "collection": "products"} for r in revisions]
+
+    assert await get_revisions_collection().count_documents({"objectId": product_2["_id"]}) == 0
+
+    # nothing to move on the second run
+    await migrate_collection_revisions("products")
+    assert await get_revisions_collection().count_documents({"objectId": product_1["_id"]}) == 2
@@ -1,5 +1,7 @@
+import asyncio
 from copy import deepcopy
 from datetime import timedelta
+from uuid import uuid4
 
 import pytest
 
@@ -10,8 +12,15 @@ from catalog.db import (
     insert_category,
     insert_object,
     insert_product,
+    read_task_state,
+)
+from catalog.prices import (
+    TASK_NAME,
+    calculate_price,
+    calculate_price_for_product,
+    calculate_prices_for_products,
+    full_recalculation,
 )
-from catalog.prices import calculate_price, calculate_price_for_product
 from catalog.utils import get_now
 from tests.utils import get_fixture_json
 
@@ -183,6 +192,7 @@ async def test_calculate_price_incrementality(db):
                 "productId": product_id,
                 "date": (day1 + timedelta(hours=i)).isoformat(),
                 "dateCreated": (now + timedelta(hours=i)).isoformat(),
+                "dateModified": (now + timedelta(hours=i)).isoformat(),
                 "tenderId": f"tender-inc-d1-{i}",
                 "bidId": f"bid-inc-d1-{i}",
                 "itemId": f"item-inc-d1-{i}",
@@ -205,6 +215,7 @@ async def test_calculate_price_incrementality(db):
                 "productId": product_id,
                 "date": (day2 + timedelta(hours=i)).isoformat(),
                 "dateCreated": (now + timedelta(hours=i)).isoformat(),
+                "dateModified": (now + timedelta(hours=i)).isoformat(),
                 "tenderId": f"tender-inc-d2-{i}",
                 "bidId": f"bid-inc-d2-{i}",
                 "itemId": f"item-inc-d2-{i}",
@@ -450,3 +461,226 @@ async def test_calculate_price_with_missing_data(db):
     assert await prices_collection.count_documents({"productId": p_missing_doc}) == 0
     assert await prices_collection.count_documents({"productId": p_missing_cat}) == 0
     assert await prices_collection.count_documents({"productId": p_no_unit}) == 0
+
+
+@pytest.mark.asyncio
+async def test_calculate_price_workers(db):
+    await flush_database()
+
+    day1 = get_now() - timedelta(days=1)
+    bid_fixture = get_fixture_json("product_bid")
+    for i in range(5):
+        product_id = f"product-{i}"
+        await insert_test_product_and_category(product_id, category_id=f"category-{i}")
+        for j in range(i + 1):
+            bid = deepcopy(bid_fixture)
+            bid.update(
+                {
+                    "id": f"bid-{i}-{j}",
+                    "productId": product_id,
+                    "date": day1.isoformat(),
+                    "unitCode": "KGM",
+                    "tenderId": f"tender-{i}-{j}",
+                    "bidId": f"bid-{i}-{j}",
+                    "itemId": f"item-{i}-{j}",
+                }
+            )
+            await insert_object(get_product_bids_collection(), bid)
+
+    counters = await calculate_price(batch_size=2, workers=3)
+    assert (counters.products, counters.bids, counters.prices, counters.failed_products) == (5, 15, 5, 0)
+    for i in range(5):
+        price = await get_prices_collection().find_one({"productId": f"product-{i}"})
+        assert price["sampleSize"] == i + 1
+
+
+@pytest.mark.asyncio
+async def test_calculate_price_failed_product(db):
+    await flush_database()
+
+    day1 = get_now() - timedelta(days=1)
+    bid_fixture = get_fixture_json("product_bid")
+    for i in range(3):
+        product_id = f"product-{i}"
+        await insert_test_product_and_category(product_id, category_id=f"category-{i}")
+        bid = deepcopy(bid_fixture)
+        bid.update(
+            {
+                "id": f"bid-{i}",
+                "productId": product_id,
+                "date": day1.isoformat(),
+                "unitCode": "KGM",
+                "tenderId": f"tender-{i}",
+                "bidId": f"bid-{i}",
+                "itemId": f"item-{i}",
+            }
+        )
+        await insert_object(get_product_bids_collection(), bid)
+    await get_product_bids_collection().update_one({"_id": "bid-1"}, {"$set": {"date": day1.date().isoformat() + "x"}})
+
+    counters = await calculate_price(batch_size=3, workers=1)
+    assert (counters.products, counters.prices, counters.failed_products) == (3, 2, 1)
+    prices = await get_prices_collection().find({}).to_list(None)
+    assert sorted(price["productId"] for price in prices) == ["product-0", "product-2"]
+    assert "watermark" not in await read_task_state(TASK_NAME)
+
+    # the failed product is selected again
+    await get_product_bids_collection().update_one({"_id": "bid-1"}, {"$set": {"date": day1.isoformat()}})
+    counters = await calculate_price(batch_size=3, workers=1)
+    assert (counters.products, counters.prices, counters.failed_products) == (3, 1, 0)
+    assert await get_prices_collection().count_documents({"productId": "product-1"}) == 1
+    assert "watermark" in await read_task_state(TASK_NAME)
+
+
+@pytest.mark.asyncio
+async def test_calculate_prices_for_products(db):
+    await flush_database()
+
+    now = get_now()
+    bid_fixture = get_fixture_json("product_bid")
+    product_ids = ["product-a", "product-b", "product-missing"]
+    for product_id in product_ids[:2]:
+        await insert_test_product_and_category(product_id, category_id=f"category-{product_id}")
+    for i in range(12):
+        bid = deepcopy(bid_fixture)
+        bid.update(
+            {
+                "id": f"bid-{i}",
+                "productId": product_ids[i % 3],
+                "date": (now - timedelta(days=i % 4 + 1)).isoformat(),
+                "unitCode": "KGM",
+                "amount": 100 * (i + 1),
+                "tenderId": f"tender-{i}",
+                "bidId": f"bid-{i}",
+                "itemId": f"item-{i}",
+            }
+        )
+        await insert_object(get_product_bids_collection(), bid)
+
+    inserted_ids = await calculate_prices_for_products(product_ids)
+    fields = ("productId", "date", "sampleSize", "lowerQuartile", "medianQuartile", "upperQuartile", "unitCode")
+    sort = [("productId", 1), ("date", 1)]
+    batch_prices = await get_prices_collection().find({}, projection=fields).sort(sort).to_list(None)
+    assert sorted(price["_id"] for price in batch_prices) == sorted(inserted_ids)
+    assert {price["productId"] for price in batch_prices} == {"product-a", "product-b"}
+
+    await get_prices_collection().delete_many({})
+    for product_id in product_ids:
+        await calculate_price_for_product(product_id)
+    prices = await get_prices_collection().find({}, projection=fields).sort(sort).to_list(None)
+    assert [dict(p, _id=None) for p in batch_prices] == [dict(p, _id=None) for p in prices]
+
+    # only the days after the last price
+    assert await calculate_prices_for_products(product_ids) == []
+
+
+@pytest.mark.asyncio
+async def test_full_recalculation_writes_changed_prices(db):
+    await flush_database()
+
+    product_id = "test-product-full"
+    await insert_test_product_and_category(product_id)
+    now = get_now()
+    bid_fixture = get_fixture_json("product_bid")
+
+    async def insert_bid(i, days_ago, amount):
+        bid = deepcopy(bid_fixture)
+        bid.update(
+            {
+                "id": f"bid-full-{i}",
+                "productId": product_id,
+                "date": (now - timedelta(days=days_ago)).isoformat(),
+                "unitCode": "KGM",
+                "amount": amount,
+                "tenderId": f"tender-full-{i}",
+                "bidId": f"bid-full-{i}",
+                "itemId": f"item-full-{i}",
+            }
+        )
+        await insert_object(get_product_bids_collection(), bid)
+
+    await insert_bid(0, 2, 100)
+    await insert_bid(1, 1, 200)
+    await calculate_price()
+    prices = {p["_id"]: p async for p in get_prices_collection().find({})}
+    assert len(prices) == 2
+    await insert_object(get_prices_collection(), dict(prices[next(iter(prices))], id="stale-price", date="2020"))
+
+    # a late bid of the last day changes its price only
+    await insert_bid(2, 1, 300)
+    await full_recalculation()
+    recalculated = {p["_id"]: p async for p in get_prices_collection().find({})}
+    assert recalculated.keys() == prices.keys()
+    first, last = sorted(prices, key=lambda price_id: prices[price_id]["date"])
+    assert recalculated[first] == prices[first]
+    assert recalculated[last]["sampleSize"] == 3
+    assert recalculated[last]["dateCreated"] == prices[last]["dateCreated"]
+    assert recalculated[last]["dateModified"] > prices[last]["dateModified"]
+
+    await full_recalculation()
+    assert [p async for p in get_prices_collection().find({})] == list(recalculated.values())
+
+
+@pytest.mark.asyncio
+async def test_calculate_prices_for_products_concurrently(db):
+    await flush_database()
+
+    product_id = "test-product-concurrent"
+    await insert_test_product_and_category(product_id)
+    bid = get_fixture_json("product_bid")
+    bid.update(
+        {
+            "id": "bid-concurrent",
+            "productId": product_id,
+            "date": (get_now() - timedelta(days=1)).isoformat(),
+            "unitCode": "KGM",
+        }
+    )
+    await insert_object(get_product_bids_collection(), bid)
+
+    # the worker and the nightly calculation may insert the same new prices at once
+    results = await asyncio.gather(
+        calculate_prices_for_products([product_id]),
+        calculate_prices_for_products([product_id]),
+    )
+    prices = await get_prices_collection().find({"productId": product_id}).to_list(None)
+    assert len(prices) == 1
+    assert prices[0]["_id"] in results[0] + results[1]
+
+
+@pytest.mark.asyncio
+async def test_calculate_price_updates_earlier_price_ids(db):
+    await flush_database()
+
+    product_id = "test-product-legacy"
+    await insert_test_product_and_category(product_id)
+    day = get_now() - timedelta(days=1)
+    bid = get_fixture_json("product_bid")
+    bid.update({"id": "bid-legacy", "productId": product_id, "date": day.isoformat(), "unitCode": "KGM"})
+    await insert_object(get_product_bids_collection(), bid)
+    # written with a random id before the ids became deterministic
+    legacy_id = uuid4().hex
+    await insert_object(
+        get_prices_collection(),
+        {
+            "id": legacy_id,
+            "productId": product_id,
+            "currency": "UAH",
+            "valueAddedTaxIncluded": False,
+            "unitCode": "KGM",
+            "unitName": "кілограм",
+            "date": (day - timedelta(minutes=1)).isoformat(),
+            "sampleSize": 1,
+            "lowerQuartile": "100.00",
+            "medianQuartile": "100.00",
+            "upperQuartile": "100.00",
+            "dateCreated": day.isoformat(),
+            "dateModified": day.isoformat(),
+        },
+    )
+
+    await calculate_price()
+    prices = await get_prices_collection().find({"productId": product_id}).to_list(None)
+    assert [price["_id"] for price in prices] == [legacy_id]
+    assert prices[0]["date"] == day.isoformat()
+    assert prices[0]["dateCreated"] == day.isoformat()
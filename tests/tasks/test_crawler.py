@@ -4,7 +4,7 @@ from unittest.mock import MagicMock
 import pytest
 
 from catalog.crawler import process_tender
-from catalog.db import flush_database, get_product_bids_collection
+from catalog.db import flush_database, get_dirty_products_collection, get_product_bids_collection
 from tests.utils import get_fixture_json
 
 
@@ -33,6 +33,10 @@ async def test_process_tender_valid(db):
 
     assert inserted_date.astimezone(timezone.utc) == expected_date.astimezone(timezone.utc)
 
+    # queued for the price worker once
+    await process_tender(session, tender)
+    assert await get_dirty_products_collection().distinct("_id") == ["product-1"]
+
 
 @pytest.mark.asyncio
 async def test_process_tender_inactive_bid(db):
@@ -44,3 +48,4 @@ async def test_process_tender_inactive_bid(db):
     await process_tender(session, tender)
     bids_count = await get_product_bids_collection().count_documents({})
     assert bids_count == 0
+    assert await get_dirty_products_collection().count_documents({}) == 0
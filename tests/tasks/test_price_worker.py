@@ -0,0 +1,153 @@
+from copy import deepcopy
+from datetime import timedelta
+from unittest.mock import patch
+
+import pytest
+
+from catalog.db import (
+    flush_database,
+    get_dirty_products_collection,
+    get_prices_collection,
+    get_product_bids_collection,
+    insert_category,
+    insert_object,
+    insert_product,
+    mark_products_dirty,
+    read_dirty_products,
+)
+from catalog.price_worker import process_dirty_products
+from catalog.prices import calculate_price
+from catalog.utils import get_now
+from tests.utils import get_fixture_json
+
+
+async def insert_test_product_and_category(product_id, category_id="test-category"):
+    await insert_category(
+        {
+            "id": category_id,
+            "status": "active",
+            "unit": {"code": "KGM", "name": "test unit"},
+            "dateModified": get_now().isoformat(),
+        }
+    )
+    await insert_product(
+        {
+            "id": product_id,
+            "status": "active",
+            "relatedCategory": category_id,
+            "dateModified": get_now().isoformat(),
+        }
+    )
+
+
+async def insert_bids(product_id, amounts, date):
+    bid_fixture = get_fixture_json("product_bid")
+    for amount in amounts:
+        bid = deepcopy(bid_fixture)
+        bid_id = f"{product_id}-{amount}"
+        bid.update(
+            {
+                "id": bid_id,
+                "productId": product_id,
+                "date": date.isoformat(),
+                "tenderId": bid_id,
+                "bidId": bid_id,
+                "itemId": bid_id,
+                "amount": amount,
+                "dateModified": get_now().isoformat(),
+            }
+        )
+        await insert_object(get_product_bids_collection(), bid)
+
+
+@pytest.mark.asyncio
+async def test_process_dirty_products(db):
+    await flush_database()
+
+    today = get_now().replace(hour=0, minute=0, second=0, microsecond=0)
+    for i in range(3):
+        await insert_test_product_and_category(f"product-{i}", category_id=f"category-{i}")
+        await insert_bids(f"product-{i}", [100, 200, 300], today - timedelta(days=1))
+    await mark_products_dirty(["product-0", "product-1"])
+    await mark_products_dirty(["product-1"])  # deduplicated
+    assert await get_dirty_products_collection().count_documents({}) == 2
+
+    assert await process_dirty_products(batch_size=1) == 1
+    assert await process_dirty_products(batch_size=1) == 1
+    assert await process_dirty_products(batch_size=1) == 0
+    assert await get_dirty_products_collection().count_documents({}) == 0
+    assert sorted(await get_prices_collection().distinct("productId")) == ["product-0", "product-1"]
+
+    # more bids of the day calculated already update its price
+    price = await get_prices_collection().find_one({"productId": "product-0"})
+    assert price["sampleSize"] == 3
+    await insert_bids("product-0", [400], today - timedelta(days=1))
+    await mark_products_dirty(["product-0"])
+    assert await process_dirty_products() == 1
+    updated = await get_prices_collection().find_one({"productId": "product-0"})
+    assert (updated["_id"], updated["sampleSize"]) == (price["_id"], 4)
+    assert await get_prices_collection().count_documents({"productId": "product-0"}) == 1
+
+
+@pytest.mark.asyncio
+async def test_process_dirty_products_queued_again(db):
+    await flush_database()
+
+    await insert_test_product_and_category("product-0")
+    await insert_bids("product-0", [100], get_now() - timedelta(days=1))
+    await mark_products_dirty(["product-0"])
+
+    async def calculate_prices_for_products(product_ids, **kwargs):
+        # a new bid is crawled during the calculation
+        await get_dirty_products_collection().update_one(
+            {"_id": "product-0"}, {"$set": {"dateModified": get_now().isoformat() + "-later"}}
+        )
+        return []
+
+    with patch("catalog.price_worker.calculate_prices_for_products", calculate_prices_for_products):
+        assert await process_dirty_products() == 1
+    assert [product["_id"] for product in await read_dirty_products(10)] == ["product-0"]
+
+
+@pytest.mark.asyncio
+async def test_calculate_price_after_worker(db):
+    await flush_database()
+
+    await calculate_price()  # the last nightly run
+    today = get_now().replace(hour=0, minute=0, second=0, microsecond=0)
+    for i in range(2):
+        await insert_test_product_and_category(f"product-{i}", category_id=f"category-{i}")
+    await insert_bids("product-0", [100, 200], today - timedelta(days=1))
+    await insert_bids("product-0", [300], today + timedelta(minutes=1))
+    await mark_products_dirty(["product-0"])
+
+    # today isn't finished, so its prices are left to the nightly run, same as there
+    assert await process_dirty_products() == 1
+    prices = await get_prices_collection().find({"productId": "product-0"}).to_list(None)
+    assert [price["sampleSize"] for price in prices] == [2]
+
+    # a bid of the product that wasn't queued
+    await insert_bids("product-1", [100], today - timedelta(days=1))
+    counters = await calculate_price()
+    assert (counters.products, counters.prices, counters.failed_products) == (2, 1, 0)
+    assert sorted(await get_prices_collection().distinct("productId")) == ["product-0", "product-1"]
+    assert await get_prices_collection().find_one({"productId": "product-0"}) == prices[0]
+
+
+@pytest.mark.asyncio
+async def test_process_dirty_products_failed_product(db):
+    await flush_database()
+
+    today = get_now().replace(hour=0, minute=0, second=0, microsecond=0)
+    for i in range(2):
+        await insert_test_product_and_category(f"product-{i}", category_id=f"category-{i}")
+        await insert_bids(f"product-{i}", [100], today - timedelta(days=1))
+    await get_product_bids_collection().update_one(
+        {"_id": "product-1-100"}, {"$set": {"date": (today - timedelta(days=1)).date().isoformat() + "x"}}
+    )
+    await mark_products_dirty(["product-0", "product-1"])
+
+    assert await process_dirty_products() == 2
+    assert await get_prices_collection().distinct("productId") == ["product-0"]
+    # queued again to be retried
+    assert [product["_id"] for product in await read_dirty_products(10)] == ["product-1"]
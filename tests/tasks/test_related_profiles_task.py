@@ -1,8 +1,11 @@
 from copy import deepcopy
+from datetime import timedelta
 
 import pytest
 
-from cron.related_profiles_task import run_task
+from catalog.db import read_task_state, save_task_state
+from catalog.utils import get_now
+from cron.related_profiles_task import TASK_NAME, run_task
 from tests.utils import get_fixture_json
 
 
@@ -210,3 +213,51 @@ async def test_set_related_profiles(
     resp_json = await resp.json()
     prod = resp_json["data"]
     assert check_product(test_product, prod)
+
+
+async def test_related_profiles_checkpoint(db, api, category, profile, product):
+    category_id = category["data"]["id"]
+    product_id = product["data"]["id"]
+    await db.products.update_one({"_id": product_id}, {"$set": {"relatedProfiles": ["b" * 32]}})
+
+    # categories up to the checkpoint have been processed by the interrupted run
+    await save_task_state(TASK_NAME, checkpoint=category_id)
+    counters = await run_task()
+    assert counters.categories == 0
+    assert (await db.products.find_one({"_id": product_id}))["relatedProfiles"] == ["b" * 32]
+    assert "checkpoint" not in await read_task_state(TASK_NAME)
+
+    counters = await run_task(full=True)
+    assert counters.categories == 1
+    assert counters.total_products == 1
+    assert counters.succeeded_products == 1
+    assert list(counters.category_seconds) == [category_id]
+    assert "b" * 32 not in (await db.products.find_one({"_id": product_id}))["relatedProfiles"]
+
+
+async def test_related_profiles_sweep(db, api, category, profile, product):
+    product_id = product["data"]["id"]
+    await run_task()
+    assert "watermark" in await read_task_state(TASK_NAME)
+
+    # changed before the last run
+    date_modified = (get_now() - timedelta(days=1)).isoformat()
+    await db.products.update_one(
+        {"_id": product_id}, {"$set": {"relatedProfiles": ["b" * 32], "dateModified": date_modified}}
+    )
+    await db.profiles.update_many({}, {"$set": {"dateModified": date_modified}})
+    counters = await run_task()
+    assert counters.categories == 0
+    assert counters.profiles == 0
+    assert counters.total_products == 0
+    assert (await db.products.find_one({"_id": product_id}))["relatedProfiles"] == ["b" * 32]
+
+    # changed by other means than the api since the last run
+    await db.products.update_one({"_id": product_id}, {"$set": {"dateModified": get_now().isoformat()}})
+    rev = (await db.products.find_one({"_id": product_id}))["_rev"]
+    counters = await run_task()
+    assert counters.total_products == 1
+    assert counters.succeeded_products == 1
+    stored = await db.products.find_one({"_id": product_id})
+    assert "b" * 32 not in stored["relatedProfiles"]
+    assert stored["_rev"] != rev